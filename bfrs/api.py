@@ -1,21 +1,25 @@
 import traceback
+from calendar import timegm
 from django.conf.urls import url
+from django.db import connection
+from django.utils.http import http_date, parse_http_date_safe
 from django.conf import settings
 from django.utils import timezone
 from django.http import JsonResponse
 from django.core.exceptions import ValidationError
-from tastypie.resources import ModelResource, Resource
 from tastypie.authorization import Authorization, ReadOnlyAuthorization, DjangoAuthorization
-from tastypie.resources import ModelResource, ALL, ALL_WITH_RELATIONS
+from tastypie.resources import ModelResource, Resource, ALL, ALL_WITH_RELATIONS
 from tastypie.utils.mime import determine_format
 from tastypie.api import Api
-from tastypie import fields
 from bfrs.models import Profile, Region, District, Bushfire, Tenure, current_finyear,BushfireProperty,CaptureMethod
+from bfrs.reports import REPORTS, LIVE_DATA_REPORTS, get_report_data
+from bfrs import reporting_tables
+from bfrs.tenures import resolve_tenure, client_tenure_data
 from bfrs.utils import update_areas_burnt, invalidate_bushfire, serialize_bushfire, is_external_user, can_maintain_data,get_tenure,update_status
 
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import Point, GEOSGeometry, Polygon, MultiPolygon, GEOSException
-from tastypie.http import HttpBadRequest, HttpUnauthorized, HttpAccepted
+from tastypie.http import HttpBadRequest, HttpUnauthorized, HttpAccepted, HttpNotFound, HttpNotModified
 from tastypie.exceptions import ImmediateHttpResponse, Unauthorized
 import json
 
@@ -298,11 +302,29 @@ class BushfireSpatialResource(ModelResource):
         #print("processing fire boundary,set fire_boundary to {}".format(bundle.data["fire_boundary"]))
         return bundle
 
+    def get_origin_point(self,bundle):
+        """ The origin point passed in, or the current origin point of the bushfire """
+        origin_point = bundle.data.get('origin_point')
+        if isinstance(origin_point, list):
+            origin_point = Point(origin_point)
+        elif origin_point and not isinstance(origin_point, GEOSGeometry):
+            origin_point = GEOSGeometry(origin_point)
+        origin_point = origin_point or bundle.obj.origin_point
+        if origin_point and not origin_point.srid:
+            origin_point.srid = 4326
+        return origin_point
+
     def hydrate_tenure_ignition_point(self,bundle):
         if not bundle.data.has_key('tenure_ignition_point'):
             #tenure_ignition_point is not passed in
             return
 
+        if not (bundle.data['tenure_ignition_point'] and bundle.data['tenure_ignition_point'].get('category')) and settings.TENURE_RESOLVER == "local":
+            #resolve the tenure from the local tenure layers, the posted data is kept if the point is not within any local tenure layer
+            tenure = resolve_tenure(self.get_origin_point(bundle))
+            if tenure:
+                bundle.data['tenure_ignition_point'] = client_tenure_data(tenure)
+
         if bundle.data['tenure_ignition_point'] and bundle.data['tenure_ignition_point'].get('category'):
             #origin point is within dpaw_tenure
             try:
@@ -484,6 +506,67 @@ class BushfireSpatialResource(ModelResource):
                 traceback.print_exc()
             raise
 
+class ReportResource(Resource):
+    """ Read only json api of the reports, generated from the reporting tables
+        http://localhost:8000/api/v1/report/?format=json                                       --> the report names
+        http://localhost:8000/api/v1/report/by_tenure/?reporting_year=2019&format=json         --> rpt_map and item_map of the report
+
+        The responses carry the ETag and Last-Modified of the last build of the reporting tables,
+        a conditional request (If-None-Match/If-Modified-Since) returns 304 until calculate_report_tables runs again.
+    """
+    class Meta:
+        resource_name = 'report'
+        authorization= ReadOnlyAuthorization()
+        allowed_methods=[]
+        list_allowed_methods=[]
+
+    @property
+    def urls(self):
+        return [
+            url(
+                r"^(?P<resource_name>{})/$".format(self._meta.resource_name),
+                self.wrap_view('report_names'), name="api_report_names"),
+            url(
+                r"^(?P<resource_name>{})/(?P<report_name>[\w\d_]+)/$".format(self._meta.resource_name),
+                self.wrap_view('report_data'), name="api_report_data"),
+        ]
+
+    def report_names(self, request, **kwargs):
+        return self.create_response(request, data=REPORTS.keys())
+
+    def report_data(self, request, **kwargs):
+        report_name = kwargs['report_name']
+        if report_name not in REPORTS:
+            return self.create_response(request, data={'error': 'Report ({}) Not Found'.format(report_name)}, response_class=HttpNotFound)
+        try:
+            reporting_year = int(request.GET['reporting_year']) if request.GET.get('reporting_year') else current_finyear()
+        except ValueError:
+            return self.create_response(request, data={'error': 'Invalid reporting_year ({})'.format(request.GET['reporting_year'])}, response_class=HttpBadRequest)
+        reporting_year = min(reporting_year, current_finyear())
+
+        with connection.cursor() as csr:
+            build = reporting_tables.get_last_build(csr)
+            summary_exists = reporting_tables.table_exists(csr, "reporting_summary")
+        if not build or not summary_exists:
+            return self.create_response(request, data={'error': 'The reporting tables have not been calculated'}, response_class=HttpBadRequest)
+
+        if report_name in LIVE_DATA_REPORTS:
+            #the 268b fires can change without a new build, so the response can't be validated by the build
+            return self.create_response(request, data=get_report_data(report_name, reporting_year, build['id']))
+
+        etag = '"{}-{}-{}"'.format(report_name, reporting_year, build['id'])
+        last_modified = timegm(build['finished'].utctimetuple())
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+        if (if_none_match and etag in if_none_match) or (not if_none_match and if_modified_since and if_modified_since >= last_modified):
+            response = HttpNotModified()
+        else:
+            response = self.create_response(request, data=get_report_data(report_name, reporting_year, build['id']))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
 v1_api = Api(api_name='v1')
 v1_api.register(BushfireResource())
 v1_api.register(BushfireSpatialResource())
@@ -491,3 +574,4 @@ v1_api.register(ProfileResource())
 v1_api.register(RegionResource())
 v1_api.register(TenureResource())
 v1_api.register(CaptureMethodResource())
+v1_api.register(ReportResource())
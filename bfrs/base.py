@@ -10,6 +10,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.contrib.auth import get_user_model
 from django.contrib.gis.db import models
+from django.db.models.query import ModelIterable
 from django.core.urlresolvers import reverse
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
@@ -17,6 +18,34 @@ from django.utils.encoding import python_2_unicode_compatible
 logger = logging.getLogger("log." + __name__)
 INITIAL_COMMENT = 'Initial version.'
 
+#set while a read only queryset builds its instances, so Audit doesn't keep their initial values
+_change_tracking = threading.local()
+
+
+class ReadOnlyModelIterable(ModelIterable):
+    """
+    Yields the instances without the change tracking of Audit, for the querysets which are only displayed or exported
+    """
+    def __iter__(self):
+        rows = super(ReadOnlyModelIterable, self).__iter__()
+        while True:
+            _change_tracking.disabled = True
+            try:
+                obj = next(rows)
+            except StopIteration:
+                return
+            finally:
+                _change_tracking.disabled = False
+            yield obj
+
+
+class AuditQuerySet(models.QuerySet):
+    def read_only(self):
+        """ The instances are not change tracked and can't be saved """
+        clone = self._clone()
+        clone._iterable_class = ReadOnlyModelIterable
+        return clone
+
 
 @python_2_unicode_compatible
 class Audit(models.Model):
@@ -37,9 +66,13 @@ class Audit(models.Model):
         super(Audit, self).__init__(*args, **kwargs)
         self._changed_data = None
         self._initial = {}
-        if self.pk:
+        self._read_only = getattr(_change_tracking, "disabled", False)
+        if self.pk and not self._read_only:
+            #a deferred field would be loaded with a query per instance
+            deferred_fields = self.get_deferred_fields()
             for field in self._meta.fields:
-                self._initial[field.attname] = getattr(self, field.attname)
+                if field.attname not in deferred_fields:
+                    self._initial[field.attname] = getattr(self, field.attname)
 
     def has_changed(self):
         """
@@ -58,6 +91,12 @@ class Audit(models.Model):
         return self._changed_data
     changed_data = property(get_changed_data)
 
+    def save(self, *args, **kwargs):
+        #a read only instance has no initial values, so its changes can't be tracked
+        if self._read_only:
+            raise Exception("{}({}) was loaded read only and can't be saved".format(self.__class__.__name__, self.pk))
+        super(Audit, self).save(*args, **kwargs)
+
     def _save(self, *args, **kwargs):
 
         '''
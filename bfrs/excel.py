@@ -0,0 +1,195 @@
+"""
+The workbook backend used by the report and bushfire list exports.
+
+new_workbook() returns an xlwt Workbook (.xls) or, if settings.EXCEL_FORMAT is 'xlsx', an XlsxWorkbook, which has the
+subset of the xlwt api used by the exports (add_sheet, get_sheet, sheet.row(i).write, sheet.write, sheet.write_merge,
+sheet.flush_row_data, save) and keeps the xlwt styles.
+XlsxWorkbook writes the rows to a write-only (constant memory) xlsx file in the temp folder, so a flushed row doesn't
+use any memory and a sheet is not limited to the 65,536 rows of an xls sheet.
+
+To Test:
+    from bfrs.excel import new_workbook
+    book = new_workbook()
+    sheet = book.add_sheet('Data')
+    for i in range(100000):
+        sheet.row(i).write(0, i)
+        if i % 1000 == 0:
+            sheet.flush_row_data()
+    book.save('/tmp/test.xlsx')
+"""
+import datetime
+import decimal
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from xlwt import Workbook, Alignment, Pattern, Style
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+XLS = 'xls'
+XLSX = 'xlsx'
+
+CONTENT_TYPES = {
+    XLS: 'application/vnd.ms-excel',
+    XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+#xlwt horizontal alignment -> xlsxwriter align
+HORZ_ALIGNMENTS = {
+    Alignment.HORZ_LEFT: 'left',
+    Alignment.HORZ_CENTER: 'center',
+    Alignment.HORZ_RIGHT: 'right',
+    Alignment.HORZ_FILLED: 'fill',
+    Alignment.HORZ_JUSTIFIED: 'justify',
+    Alignment.HORZ_CENTER_ACROSS_SEL: 'center_across',
+}
+
+#xlwt colour index -> colour name, xlsxwriter only knows a few colour names
+XLSX_COLOURS = ('black', 'blue', 'brown', 'cyan', 'gray', 'green', 'lime', 'magenta', 'navy', 'orange', 'pink', 'purple', 'red', 'silver', 'white', 'yellow')
+COLOUR_NAMES = dict([(index, name) for name, index in Style.colour_map.iteritems() if name in XLSX_COLOURS])
+
+
+def workbook_format():
+    """ The format of the exported workbooks; xls if xlsxwriter is not installed """
+    if settings.EXCEL_FORMAT == XLSX and xlsxwriter is None:
+        logger.warning("xlsxwriter is not installed, export the workbooks as xls")
+        return XLS
+    return settings.EXCEL_FORMAT
+
+
+def new_workbook():
+    """ A new (empty) workbook of the configured format """
+    if workbook_format() == XLSX:
+        return XlsxWorkbook()
+    return Workbook()
+
+
+def excel_extension():
+    return workbook_format()
+
+
+def excel_content_type():
+    return CONTENT_TYPES[workbook_format()]
+
+
+class XlsxRow(object):
+    def __init__(self, sheet, row_no):
+        self.sheet = sheet
+        self.row_no = row_no
+
+    def write(self, col, label="", style=None):
+        self.sheet.write(self.row_no, col, label, style)
+
+
+class XlsxSheet(object):
+    """
+    A sheet of XlsxWorkbook; the cells are buffered until flush_row_data is called (as xlwt does),
+    then written to the file in row order and can't be changed any more
+    """
+    def __init__(self, book, worksheet):
+        self.book = book
+        self.worksheet = worksheet
+        self.name = worksheet.get_name()
+        self._rows = {}
+        self._merges = {}
+
+    def row(self, row_no):
+        return XlsxRow(self, row_no)
+
+    def write(self, row_no, col, label="", style=None):
+        self._rows.setdefault(row_no, {})[col] = (label, style)
+
+    def write_merge(self, r1, r2, c1, c2, label="", style=None):
+        self._merges.setdefault(r1, []).append((r1, c1, r2, c2, label, style))
+
+    def flush_row_data(self):
+        for row_no in sorted(set(self._rows.keys()) | set(self._merges.keys())):
+            for col, (label, style) in sorted(self._rows.get(row_no, {}).iteritems()):
+                self._write_cell(row_no, col, label, style)
+            for r1, c1, r2, c2, label, style in self._merges.get(row_no, []):
+                self.worksheet.merge_range(r1, c1, r2, c2, label, self.book.get_format(style))
+        self._rows = {}
+        self._merges = {}
+
+    def _write_cell(self, row_no, col, label, style):
+        cell_format = self.book.get_format(style)
+        if label is None or label == "":
+            self.worksheet.write_blank(row_no, col, None, cell_format)
+        elif isinstance(label, basestring):
+            self.worksheet.write_string(row_no, col, label, cell_format)
+        elif isinstance(label, bool):
+            self.worksheet.write_boolean(row_no, col, label, cell_format)
+        elif isinstance(label, (int, long, float, decimal.Decimal)):
+            self.worksheet.write_number(row_no, col, label, cell_format)
+        elif isinstance(label, (datetime.datetime, datetime.date, datetime.time)):
+            self.worksheet.write_datetime(row_no, col, label, cell_format)
+        else:
+            self.worksheet.write_string(row_no, col, unicode(label), cell_format)
+
+
+class XlsxWorkbook(object):
+    """
+    A write-only xlsx workbook with the xlwt api used by the exports
+    """
+    def __init__(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        self.workbook = xlsxwriter.Workbook(self.filename, {'constant_memory': True, 'strings_to_formulas': False})
+        self.sheets = []
+        self._formats = {}
+
+    def add_sheet(self, sheetname):
+        sheet = XlsxSheet(self, self.workbook.add_worksheet(sheetname))
+        self.sheets.append(sheet)
+        return sheet
+
+    def get_sheet(self, sheet):
+        if isinstance(sheet, (int, long)):
+            return self.sheets[sheet]
+        for s in self.sheets:
+            if s.name == sheet:
+                return s
+        raise Exception("Sheet '{}' not found".format(sheet))
+
+    def get_format(self, style):
+        """ The xlsxwriter format of a xlwt XFStyle, created once per style """
+        if style is None:
+            return None
+        key = id(style)
+        if key not in self._formats:
+            properties = {'bold': bool(style.font.bold), 'italic': bool(style.font.italic)}
+            if style.num_format_str and style.num_format_str != 'General':
+                properties['num_format'] = style.num_format_str
+            if style.alignment.horz in HORZ_ALIGNMENTS:
+                properties['align'] = HORZ_ALIGNMENTS[style.alignment.horz]
+            if style.alignment.wrap:
+                properties['text_wrap'] = True
+            if style.pattern.pattern == Pattern.SOLID_PATTERN and style.pattern.pattern_fore_colour in COLOUR_NAMES:
+                properties['pattern'] = 1
+                properties['bg_color'] = COLOUR_NAMES[style.pattern.pattern_fore_colour]
+            #keep a reference to the style, so its id is not reused
+            self._formats[key] = (style, self.workbook.add_format(properties))
+        return self._formats[key][1]
+
+    def save(self, filename_or_stream):
+        """ Close the workbook and copy it to the file or stream; the workbook can only be saved once """
+        try:
+            for sheet in self.sheets:
+                sheet.flush_row_data()
+            self.workbook.close()
+            with open(self.filename, 'rb') as f:
+                if isinstance(filename_or_stream, basestring):
+                    with open(filename_or_stream, 'wb') as out:
+                        shutil.copyfileobj(f, out)
+                else:
+                    shutil.copyfileobj(f, filename_or_stream)
+        finally:
+            os.remove(self.filename)
@@ -2,11 +2,11 @@ from datetime import date,timedelta
 
 import django_filters
 
-from django.db.models import Q
 from django.utils import timezone
 from django import forms
 
 from .models import (Bushfire,Document)
+from .search import search_bushfires
 import basefilters
 
 class BooleanFilter(django_filters.filters.BooleanFilter):
@@ -68,8 +68,10 @@ class BushfireFilter(django_filters.FilterSet):
 
         Works because 'fire_number' present in self.data (from <input> field in base.html) 
         NOTE: filter_name in arg is a required dummy arg, not used.
+
+        A value like 'BF 2019 SWC' is searched by fire number prefix; the results are ranked by similarity if order_by is 'relevance'
         """
-        return queryset.filter(Q(fire_number__icontains=value) | Q(name__icontains=value) | Q(dfes_incident_no__icontains=value))
+        return search_bushfires(queryset, value, ranked=self.data.get('order_by') == 'relevance')
 
 
     def filter_include_archived(self, queryset, filter_name, value):
@@ -87,7 +89,11 @@ class BushfireFilter(django_filters.FilterSet):
         if value:
             if value[0] == "+":
                 value = value[1:]
-            if value in BUSHFIRE_SORT_MAPPING:
+            if value == 'relevance':
+                #ordered by search_bushfires; by the default order if there is no search
+                if not self.data.get('fire_number'):
+                    queryset = queryset.order_by(*BUSHFIRE_SORT_MAPPING['-modified'])
+            elif value in BUSHFIRE_SORT_MAPPING:
                 queryset = queryset.order_by(*BUSHFIRE_SORT_MAPPING[value])
             else:
                 queryset = queryset.order_by(value)
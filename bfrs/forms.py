@@ -456,6 +456,9 @@ class BushfireViewForm(BaseBushfireViewForm):
 
 class BushfireSnapshotViewForm(BaseBushfireViewForm):
     def __init__(self,*args,**kwargs):
+        #the fire boundary of a snapshot is kept in SnapshotGeometry
+        if kwargs.get("instance"):
+            kwargs["initial"] = dict(kwargs.get("initial") or {}, fire_boundary=kwargs["instance"].boundary)
         super(BushfireSnapshotViewForm,self).__init__(*args,**kwargs)
         self.damages          = DamageSnapshot.objects.filter(snapshot = self.instance)
         self.injuries         = InjurySnapshot.objects.filter(snapshot = self.instance)
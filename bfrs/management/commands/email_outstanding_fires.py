@@ -16,6 +16,8 @@ class Command(BaseCommand):
     '
 
     def handle(self, *args, **options):
-        email_outstanding_fires()
+        failed = email_outstanding_fires()
+        if failed:
+            raise CommandError("Failed to send {} emails: {}".format(len(failed), ", ".join([m.subject for m in failed])))
         self.stdout.write('Done')
 
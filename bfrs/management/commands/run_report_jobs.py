@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from bfrs.report_jobs import run_workers
+
+import logging
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Runs the report job workers, which generate the reports queued by the web application \n \
+\n \
+        usage: ./manage.py run_report_jobs [--workers N] [--max-jobs N] \n \
+        --workers:  the number of worker processes, default is settings.REPORT_JOB_WORKERS \n \
+        --max-jobs: stop each worker after it has run N jobs, default is to run forever \n \
+    '
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, dest='workers', default=None,
+            help='The number of worker processes')
+        parser.add_argument('--max-jobs', type=int, dest='max_jobs', default=None,
+            help='Stop each worker after it has run N jobs')
+
+    def handle(self, *args, **options):
+        print ('Started report job workers')
+        run_workers(workers=options['workers'], max_jobs=options['max_jobs'])
+        print ('Stopped report job workers')
@@ -7,10 +7,12 @@ import shutil
 import tempfile
 from datetime import datetime,timedelta
 from collections import defaultdict, OrderedDict
+from multiprocessing.pool import ThreadPool
 
 from django.core import serializers
 from django.conf import settings
 from django.db import IntegrityError, transaction,connection
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from django.contrib.gis.geos import Point, GEOSGeometry, Polygon, MultiPolygon, GEOSException
 from django.core.exceptions import ObjectDoesNotExist
@@ -19,6 +21,7 @@ from django.contrib.auth.models import User
 from bfrs.models import (Bushfire, Tenure,AreaBurntSnapshot,AreaBurnt,BushfireSnapshot)
 from bfrs import utils
 from bfrs.utils import serialize_bushfire
+from bfrs.tenures import resolve_tenures, resolve_tenure, sss_tenure_data
 
 RERUN = 1
 RESUME = 2
@@ -240,23 +243,33 @@ def add_warnings(status,bushfire,scope,datatypes,warnings):
     for warning in warnings:
         all_warnings[warning_key].append(warning)
 
-def refresh_all_bushfires(scope=BUSHFIRE,datatypes = 0,runtype=RESUME,layersuffix=""):
+def refresh_all_bushfires(scope=BUSHFIRE,datatypes = 0,runtype=RESUME,layersuffix="",batch_size=None,workers=None):
     try:
         min_year = Bushfire.objects.all().order_by("reporting_year").first().reporting_year
         max_year = Bushfire.objects.all().order_by("-reporting_year").first().reporting_year
         year = min_year
         while year <= max_year:
             try:
-                refresh_bushfires(year,scope=scope,datatypes=datatypes,runtype=runtype,layersuffix=layersuffix)
+                refresh_bushfires(year,scope=scope,datatypes=datatypes,runtype=runtype,layersuffix=layersuffix,batch_size=batch_size,workers=workers)
             finally:
                 year += 1
     except:
         return
 
-def refresh_bushfires(reporting_year,scope=BUSHFIRE,datatypes = 0,runtype=RESUME,size=0,layersuffix="",debug=False):
+def refresh_bushfires(reporting_year,scope=BUSHFIRE,datatypes = 0,runtype=RESUME,size=0,layersuffix="",debug=False,batch_size=None,workers=None):
+    """
+    Refresh the spatial data of the reporting year's bushfires.
+    batch_size: the number of features sent to SSS with one request, 0 or 1 refreshes one bushfire at a time; default is settings.SSS_REFRESH_BATCH_SIZE
+    workers: the number of concurrent SSS requests; default is settings.SSS_REFRESH_WORKERS
+    In the batched mode, the refresh status is updated after each round of (batch_size * workers) bushfires,
+    a resumed refresh starts from the first bushfire of the unfinished round
+    """
     if datatypes == 0 or scope == 0:
         return
 
+    batch_size = settings.SSS_REFRESH_BATCH_SIZE if batch_size is None else batch_size
+    workers = max(settings.SSS_REFRESH_WORKERS if workers is None else workers,1)
+
     if runtype & RERUN == RERUN:
         runtype = RERUN
 
@@ -322,6 +335,48 @@ def refresh_bushfires(reporting_year,scope=BUSHFIRE,datatypes = 0,runtype=RESUME
             bushfires = bushfires.order_by("id") if last_refreshed_id is None else bushfires.filter(id__gt=last_refreshed_id).order_by("id")
             index = 0
             totalcount = len(bushfires)
+            if batch_size > 1:
+                pool = ThreadPool(workers) if workers > 1 else None
+                try:
+                    round_size = batch_size * workers
+                    while index < totalcount:
+                        batch = list(bushfires[index:index + (min(round_size,size - counter) if size else round_size)])
+                        if not batch:
+                            break
+                        prefetch_related_objects(batch,"snapshots")
+                        print("Refresh {}'s bushfires({} - {}), {}/{}".format(reporting_year,batch[0].fire_number,batch[-1].fire_number,index + len(batch),totalcount))
+                        scope_types = dict((bf.id,get_scope_and_datatypes(status,bf,scope,datatypes)) for bf in batch)
+                        batch_warnings = _refresh_bushfire_batch(batch,scope_types,layersuffix=layersuffix,debug=debug,batch_size=batch_size,pool=pool)
+                        for bushfire in batch:
+                            bfscope = 0
+                            bfdatatypes = 0
+                            for s,t in scope_types[bushfire.id]:
+                                set_last_refreshed_bushfireid(status,s,t,bushfire.id)
+                                bfscope |= s
+                                bfdatatypes |= t
+                            warnings = batch_warnings.get(bushfire.id)
+                            if warnings:
+                                add_warnings(status,bushfire,bfscope,bfdatatypes,warnings)
+                                warning_key = (bushfire.id,bushfire.fire_number)
+                                if warning_key in all_warnings:
+                                    for w in warnings:
+                                        all_warnings[warning_key].append(w)
+                                else:
+                                    all_warnings[warning_key] = warnings
+                        index += len(batch)
+                        counter += len(batch)
+                        if size and counter >= size:
+                            break
+                        if datetime.now() - start_time >= save_interval:
+                            save_refresh_status(reporting_year,status)
+                            start_time = datetime.now()
+                finally:
+                    if pool:
+                        pool.close()
+                        pool.join()
+                #all bushfires are refreshed
+                bushfires = []
+
             for bushfire in bushfires:
                 index += 1
                 print("Refresh {}'s bushfire({}), {}/{}".format(reporting_year,bushfire.fire_number,index,totalcount))
@@ -406,6 +461,101 @@ def _refresh_bushfire(bushfire,scope=BUSHFIRE,datatypes=0,layersuffix="",debug=F
 
     return warnings
 
+def _request_batch(args):
+    """ Post a batch of features to SSS, return the result features or the exception """
+    features,options = args
+    try:
+        return request_spatial(features,options)
+    except Exception as ex:
+        return ex
+
+def _refresh_bushfire_batch(bushfires,scope_types,layersuffix="",debug=False,batch_size=50,pool=None):
+    """
+    Refresh the spatial data of the bushfires and their snapshots (prefetched)
+    scope_types: {bushfire id: [(scope,datatypes)]}, returned by get_scope_and_datatypes
+    The grid data and the origin point tenure are requested for batch_size features per request, the requests run in the pool
+    and the results are saved in the current thread;
+    the burnt area is refreshed with one request per feature, the features are requested and saved in the pool (except in debug mode).
+    If settings.TENURE_RESOLVER is 'local', the origin point tenures are resolved from the local tenure layers first,
+    only the unresolved features are sent to SSS.
+    Return {bushfire id: warnings}, the warnings have the same format as the warnings returned by _refresh_bushfire
+    """
+    warnings = defaultdict(list)
+    def refresh(bushfire,bf,is_snapshot,datatype,func,*args,**kwargs):
+        key = (bf.id,SNAPSHOT if is_snapshot else BUSHFIRE,datatype)
+        try:
+            warning = func(*args,**kwargs)
+            if warning :
+                warnings[bushfire.id].append((key + ('WARNING',),warning if isinstance(warning,(list,tuple)) else [warning]))
+        except Exception as ex:
+            warnings[bushfire.id].append((key + ('ERROR',),[str(ex)]))
+
+    def pool_result(result):
+        if isinstance(result,Exception):
+            raise result
+        return result
+
+    def set_batch_data(set_data,name,result,batch,i,bf,is_snapshot):
+        if isinstance(result,Exception):
+            raise result
+        elif len(result) != len(batch):
+            raise Exception("SSS returned {} features for a batch of {} features".format(len(result),len(batch)))
+        return set_data(bf,is_snapshot,result[i][name])
+
+    #(bushfire, bushfire or snapshot, is_snapshot, datatypes) of each feature
+    features = []
+    for bushfire in bushfires:
+        for s,t in scope_types[bushfire.id]:
+            bfs = []
+            if s & BUSHFIRE == BUSHFIRE:
+                bfs.append(bushfire)
+            if s & SNAPSHOT == SNAPSHOT:
+                bfs.extend(bushfire.snapshots.all())
+            for bf in bfs:
+                features.append((bushfire,bf,hasattr(bf,"snapshot_type"),t))
+
+    for datatype,options,name,set_data in (
+        (GRID_DATA,grid_data_options(),"grid",set_grid_data),
+        (ORIGIN_POINT_TENURE,originpoint_tenure_options(layersuffix),"originpoint_tenure",set_originpoint_tenure)
+    ):
+        datatype_features = [f for f in features if f[3] & datatype == datatype]
+        if datatype == ORIGIN_POINT_TENURE and use_local_tenures(layersuffix):
+            tenures = resolve_tenures(dict([(i,f[1].origin_point) for i,f in enumerate(datatype_features)]))
+            for i,(bushfire,bf,is_snapshot,t) in enumerate(datatype_features):
+                if tenures[i]:
+                    refresh(bushfire,bf,is_snapshot,datatype,set_data,bf,is_snapshot,sss_tenure_data(tenures[i]))
+            datatype_features = [f for i,f in enumerate(datatype_features) if not tenures[i]]
+
+        batches = [datatype_features[i:i + batch_size] for i in range(0,len(datatype_features),batch_size)]
+        requests_args = [(serializers.serialize('geojson',[f[1] for f in batch],geometry_field='origin_point',fields=('id','fire_number')),options) for batch in batches]
+        results = pool.map(_request_batch,requests_args) if pool else [_request_batch(args) for args in requests_args]
+        for batch,result in zip(batches,results):
+            for i,(bushfire,bf,is_snapshot,t) in enumerate(batch):
+                refresh(bushfire,bf,is_snapshot,datatype,set_batch_data,set_data,name,result,batch,i,bf,is_snapshot)
+
+    burnt_area_features = [f for f in features if f[3] & BURNT_AREA == BURNT_AREA]
+    if pool and not debug:
+        results = pool.map(_refresh_burnt_area,[(bf,is_snapshot,layersuffix) for bushfire,bf,is_snapshot,t in burnt_area_features])
+        for (bushfire,bf,is_snapshot,t),result in zip(burnt_area_features,results):
+            refresh(bushfire,bf,is_snapshot,BURNT_AREA,pool_result,result)
+    else:
+        #debug mode creates the debug tables on demand, so the features are refreshed one by one
+        for bushfire,bf,is_snapshot,t in burnt_area_features:
+            refresh(bushfire,bf,is_snapshot,BURNT_AREA,refresh_burnt_area,bf,is_snapshot,layersuffix=layersuffix,debug=debug)
+
+    return warnings
+
+def _refresh_burnt_area(args):
+    """ Refresh the burnt area of a bushfire or snapshot in a pool thread, return the warning or the exception """
+    bf,is_snapshot,layersuffix = args
+    try:
+        return refresh_burnt_area(bf,is_snapshot,layersuffix=layersuffix)
+    except Exception as ex:
+        return ex
+    finally:
+        #close the database connection opened by the pool thread
+        connection.close()
+
 def get_bushfire(bushfire):
     if isinstance(bushfire,int):
         return Bushfire.objects.get(id = bushfire)
@@ -440,11 +590,29 @@ def refresh_bushfire(bushfire,scope=BUSHFIRE,datatypes=0,layersuffix="",debug=Fa
                 print("    {}. {}:{}".format(index,key[3],msg))
 
 
-def refresh_grid_data(bushfire,is_snapshot):
-    warning = None
-    req_data = {"features":serializers.serialize('geojson',[bushfire],geometry_field='origin_point',fields=('id','fire_number'))}
+_sss_session = None
+
+def get_sss_session():
+    """ The session of the SSS spatial requests, its connection pool is shared by the refresh workers """
+    global _sss_session
+    if _sss_session is None:
+        session = requests.Session()
+        session.auth = requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO)
+        session.verify = settings.SSS_CERTIFICATE_VERIFY
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(settings.SSS_REFRESH_WORKERS,1))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _sss_session = session
+    return _sss_session
+
+def request_spatial(features,options):
+    """ Post the features (geojson) and the options to the SSS spatial api, return the result features """
+    resp=get_sss_session().post(url="{}/spatial".format(settings.SSS_URL), data={"features":features,"options":json.dumps(options)},timeout=settings.SSS_REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()["features"]
+
+def grid_data_options():
     req_options = {}
-    update_fields = ["origin_point_grid"]
     req_options["grid"] = {
         "action":"getClosestFeature",
         "layers":[
@@ -470,12 +638,16 @@ def refresh_grid_data(bushfire,is_snapshot):
             },
         ],
     }
+    return req_options
 
-    req_data["options"] = json.dumps(req_options)
-    resp=requests.post(url="{}/spatial".format(settings.SSS_URL), data=req_data,auth=requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO),verify=settings.SSS_CERTIFICATE_VERIFY)
-    resp.raise_for_status()
-    result = resp.json()
-    grid_data = result["features"][0]["grid"]
+def refresh_grid_data(bushfire,is_snapshot):
+    result = request_spatial(serializers.serialize('geojson',[bushfire],geometry_field='origin_point',fields=('id','fire_number')),grid_data_options())
+    return set_grid_data(bushfire,is_snapshot,result[0]["grid"])
+
+def set_grid_data(bushfire,is_snapshot,grid_data):
+    """ Save the origin point grid of the bushfire or snapshot from its SSS result """
+    warning = None
+    update_fields = ["origin_point_grid"]
     if grid_data.get("failed"):
         raise Exception(grid_data["failed"])
     elif grid_data.get("id") == "fd_grid_points":
@@ -493,11 +665,8 @@ def refresh_grid_data(bushfire,is_snapshot):
         print("The bushfire report({})'s grid data is {}".format(bushfire.fire_number,bushfire.origin_point_grid if bushfire.origin_point_grid else "null"))
     return warning
 
-def refresh_originpoint_tenure(bushfire,is_snapshot,layersuffix=""):
-    warning = None
-    req_data = {"features":serializers.serialize('geojson',[bushfire],geometry_field='origin_point',fields=('id','fire_number'))}
+def originpoint_tenure_options(layersuffix=""):
     req_options = {}
-    update_fields = ["tenure"]
     req_options["originpoint_tenure"] = {
         "action":"getFeature",
         "layers":[
@@ -546,18 +715,31 @@ def refresh_originpoint_tenure(bushfire,is_snapshot,layersuffix=""):
                 },
             }]
     }
-    req_data["options"] = json.dumps(req_options)
-    resp=requests.post(url="{}/spatial".format(settings.SSS_URL), data=req_data,auth=requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO),verify=settings.SSS_CERTIFICATE_VERIFY)
-    resp.raise_for_status()
-    result = resp.json()
-    tenure_data = result["features"][0]["originpoint_tenure"]
+    return req_options
+
+def use_local_tenures(layersuffix=""):
+    """ Resolve the origin point tenures from the local tenure layers, which are the current versions of the SSS layers """
+    return settings.TENURE_RESOLVER == "local" and not layersuffix
+
+def refresh_originpoint_tenure(bushfire,is_snapshot,layersuffix=""):
+    if use_local_tenures(layersuffix):
+        tenure = resolve_tenure(bushfire.origin_point)
+        if tenure:
+            return set_originpoint_tenure(bushfire,is_snapshot,sss_tenure_data(tenure))
+    result = request_spatial(serializers.serialize('geojson',[bushfire],geometry_field='origin_point',fields=('id','fire_number')),originpoint_tenure_options(layersuffix))
+    return set_originpoint_tenure(bushfire,is_snapshot,result[0]["originpoint_tenure"])
+
+def set_originpoint_tenure(bushfire,is_snapshot,tenure_data):
+    """ Save the origin point tenure of the bushfire or snapshot from its SSS result """
+    warning = None
+    update_fields = ["tenure"]
     if tenure_data.get("failed"):
         raise Exception(tenure_data["failed"])
     elif tenure_data and tenure_data.get('id'):
         try:
             bushfire.tenure = utils.get_tenure(tenure_data['feature']['category'],createIfMissing=False)
         except:
-            raise Exception("Unknown tenure category({})".format(category))
+            raise Exception("Unknown tenure category({})".format(tenure_data['feature']['category']))
     else:
         #origin point is not within dpaw_tenure
         bushfire.tenure = Tenure.OTHER
@@ -741,6 +923,9 @@ def refresh_burnt_area(bushfire,is_snapshot,layersuffix="",debug=False):
             )
             """)
 
+    if is_snapshot and bushfire.fire_boundary is None:
+        #the fire boundary of a snapshot is kept in SnapshotGeometry
+        bushfire.fire_boundary = bushfire.boundary
     try:
         if not bushfire.fire_boundary:
             #no fire boundary,
@@ -836,7 +1021,7 @@ def refresh_burnt_area(bushfire,is_snapshot,layersuffix="",debug=False):
                     "unit":"ha",
                 }
             req_data["options"] = json.dumps(req_options)
-            resp=requests.post(url="{}/spatial".format(settings.SSS_URL), data=req_data,auth=requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO),verify=settings.SSS_CERTIFICATE_VERIFY)
+            resp=get_sss_session().post(url="{}/spatial".format(settings.SSS_URL), data=req_data,timeout=settings.SSS_REQUEST_TIMEOUT)
             resp.raise_for_status()
             result = resp.json()
             fb_validation_req = None
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bfrs', '0026_auto_20190919_1114'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[(b'bushfire_report', b'Bushfire Report (Excel)'), (b'ministerial_pdf', b'Ministerial Report (PDF)')], editable=False, max_length=32)),
+                ('parameters', models.TextField(default=b'{}', editable=False)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, b'Queued'), (2, b'Running'), (3, b'Succeeded'), (4, b'Failed')], db_index=True, default=1, editable=False)),
+                ('submitted', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('started', models.DateTimeField(editable=False, null=True)),
+                ('finished', models.DateTimeField(editable=False, null=True)),
+                ('worker', models.CharField(editable=False, max_length=64, null=True)),
+                ('result', models.FileField(editable=False, null=True, upload_to=b'report_jobs/%Y/%m/')),
+                ('filename', models.CharField(editable=False, max_length=128, null=True)),
+                ('content_type', models.CharField(editable=False, max_length=64, null=True)),
+                ('error', models.TextField(editable=False, null=True)),
+                ('submitter', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-submitted'],
+            },
+        ),
+    ]
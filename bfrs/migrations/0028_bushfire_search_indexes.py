@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+#the global search filters with icontains, which postgres runs as UPPER("column"::text) LIKE UPPER('%value%'),
+#and with startswith for fire numbers ("column"::text LIKE 'value%'); the indexes are on the same expressions
+SEARCH_TABLES = ('bfrs_bushfire', 'bfrs_bushfiresnapshot')
+SEARCH_COLUMNS = ('fire_number', 'name', 'dfes_incident_no')
+
+CREATE_INDEXES = ["CREATE EXTENSION IF NOT EXISTS pg_trgm;"]
+DROP_INDEXES = []
+for table in SEARCH_TABLES:
+    for column in SEARCH_COLUMNS:
+        CREATE_INDEXES.append("CREATE INDEX {0}_{1}_trgm ON {0} USING gin (UPPER({1}::text) gin_trgm_ops);".format(table, column))
+        DROP_INDEXES.append("DROP INDEX IF EXISTS {0}_{1}_trgm;".format(table, column))
+    CREATE_INDEXES.append("CREATE INDEX {0}_fire_number_prefix ON {0} ((fire_number::text) text_pattern_ops);".format(table))
+    DROP_INDEXES.append("DROP INDEX IF EXISTS {0}_fire_number_prefix;".format(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bfrs', '0027_reportjob'),
+    ]
+
+    operations = [
+        migrations.RunSQL("\n".join(CREATE_INDEXES), "\n".join(DROP_INDEXES)),
+    ]
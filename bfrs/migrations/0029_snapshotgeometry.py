@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+#move the fire boundaries of the existing snapshots into the geometry store, keyed by the md5 of their WKB
+STORE_GEOMETRIES = """
+INSERT INTO bfrs_snapshotgeometry (hash, geometry)
+SELECT DISTINCT ON (md5(ST_AsBinary(fire_boundary))) md5(ST_AsBinary(fire_boundary)), fire_boundary
+FROM bfrs_bushfiresnapshot WHERE fire_boundary IS NOT NULL;
+UPDATE bfrs_bushfiresnapshot SET fire_boundary_geometry_id = md5(ST_AsBinary(fire_boundary)), fire_boundary = NULL
+WHERE fire_boundary IS NOT NULL;
+"""
+
+RESTORE_GEOMETRIES = """
+UPDATE bfrs_bushfiresnapshot s SET fire_boundary = g.geometry
+FROM bfrs_snapshotgeometry g WHERE s.fire_boundary_geometry_id = g.hash;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bfrs', '0028_bushfire_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotGeometry',
+            fields=[
+                ('hash', models.CharField(editable=False, max_length=32, primary_key=True, serialize=False)),
+                ('geometry', django.contrib.gis.db.models.fields.MultiPolygonField(editable=False, srid=4326)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bushfiresnapshot',
+            name='fire_boundary_geometry',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='bfrs.SnapshotGeometry'),
+        ),
+        migrations.RunSQL(STORE_GEOMETRIES, RESTORE_GEOMETRIES),
+    ]
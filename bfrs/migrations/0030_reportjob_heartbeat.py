@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bfrs', '0029_snapshotgeometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='heartbeat',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        #the jobs running before the heartbeat was added
+        migrations.RunSQL("UPDATE bfrs_reportjob SET heartbeat = started WHERE status = 2;", migrations.RunSQL.noop),
+    ]
@@ -1,11 +1,13 @@
 import sys
 import os
 import json
+import hashlib
 import traceback
 from datetime import datetime, timedelta
 import pytz
 
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import WKBWriter
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.utils.encoding import python_2_unicode_compatible
@@ -24,7 +26,7 @@ import reversion
 
 from classproperty import (classproperty,cachedclassproperty)
 
-from bfrs.base import Audit,DictMixin
+from bfrs.base import Audit,AuditQuerySet,DictMixin
 
 
 SNAPSHOT_INITIAL = 1
@@ -292,6 +294,15 @@ class District(models.Model):
     def __str__(self):
         return self.name
 
+class BushfireQuerySet(AuditQuerySet):
+    #the columns which are not shown by the bushfire list and its exports
+    LIST_DEFERRED_FIELDS = ('origin_point', 'fire_boundary', 'sss_data')
+
+    def list_view(self):
+        """ The read only bushfires of a list, without the geometries and the sss data """
+        return self.defer(*self.LIST_DEFERRED_FIELDS).read_only()
+
+
 class BushfireBase(Audit,DictMixin):
     STATUS_INITIAL                = 1
     STATUS_INITIAL_AUTHORISED     = 2
@@ -477,6 +488,8 @@ class BushfireBase(Audit,DictMixin):
     capturemethod = models.ForeignKey(CaptureMethod,editable=True,null=True,blank=True)
     other_capturemethod = models.CharField(verbose_name="Other Capture Methdod", max_length=128, editable=True, null=True, blank=True)
 
+    objects = BushfireQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
@@ -618,6 +631,40 @@ class BushfireBase(Audit,DictMixin):
             return self.initial_control.name
 
 
+class SnapshotGeometry(models.Model):
+    """
+    The fire boundaries of the snapshots, stored once per distinct geometry.
+    hash is the md5 of the 2D little endian WKB of the geometry, the same as md5(ST_AsBinary(geometry)) in postgis
+    """
+    SRID = 4326
+
+    hash = models.CharField(max_length=32, primary_key=True, editable=False)
+    geometry = models.MultiPolygonField(srid=SRID, editable=False)
+
+    @classmethod
+    def geometry_hash(cls, geometry):
+        if geometry.srid and geometry.srid != cls.SRID:
+            geometry = geometry.transform(cls.SRID, clone=True)
+        writer = WKBWriter()
+        writer.byteorder = 1
+        writer.outdim = 2
+        return hashlib.md5(bytes(writer.write(geometry))).hexdigest()
+
+    @classmethod
+    def store(cls, geometry):
+        """ The stored geometry, the geometry is only written if it isn't stored yet """
+        obj, created = cls.objects.only('hash').get_or_create(hash=cls.geometry_hash(geometry), defaults={'geometry': geometry})
+        return obj
+
+    @classmethod
+    def delete_unused(cls):
+        """ Delete the geometries which are not used by any snapshot, return the number of deleted geometries """
+        return cls.objects.filter(snapshots__isnull=True).delete()[0]
+
+    def __str__(self):
+        return self.hash
+
+
 class BushfireSnapshot(BushfireBase):
 
     fire_number = models.CharField(max_length=15, verbose_name="Fire Number")
@@ -626,6 +673,24 @@ class BushfireSnapshot(BushfireBase):
     snapshot_type = models.PositiveSmallIntegerField(choices=SNAPSHOT_TYPE_CHOICES)
     action = models.CharField(verbose_name="Action Type", max_length=100)
     bushfire = models.ForeignKey('Bushfire', related_name='snapshots')
+    fire_boundary_geometry = models.ForeignKey(SnapshotGeometry, null=True, blank=True, editable=False, on_delete=models.PROTECT, related_name='snapshots')
+
+    @property
+    def boundary(self):
+        """ The fire boundary of the snapshot, which is kept in SnapshotGeometry """
+        if self.fire_boundary_geometry_id:
+            return self.fire_boundary_geometry.geometry
+        return self.fire_boundary
+
+    def save(self, *args, **kwargs):
+        """ Keep the fire boundary in SnapshotGeometry instead of the snapshot, whose fire_boundary column stays null """
+        update_fields = kwargs.get("update_fields")
+        if self.fire_boundary is not None and (update_fields is None or "fire_boundary" in update_fields):
+            self.fire_boundary_geometry = SnapshotGeometry.store(self.fire_boundary)
+            self.fire_boundary = None
+            if update_fields is not None:
+                kwargs["update_fields"] = list(update_fields) + ["fire_boundary_geometry"]
+        super(BushfireSnapshot, self).save(*args, **kwargs)
 
     @property
     def fire_bombing(self):
@@ -761,13 +826,18 @@ class Bushfire(BushfireBase):
 
     @property
     def initial_snapshot(self):
-        qs = self.snapshots.filter(snapshot_type=SNAPSHOT_INITIAL)
-        return qs.latest('created') if len(qs)>0 and self.is_init_authorised else None
+        return self.latest_snapshot(SNAPSHOT_INITIAL) if self.is_init_authorised else None
 
     @property
     def final_snapshot(self):
-        qs = self.snapshots.filter(snapshot_type=SNAPSHOT_FINAL)
-        return qs.latest('created') if len(qs)>0 and self.is_final_authorised else None
+        return self.latest_snapshot(SNAPSHOT_FINAL) if self.is_final_authorised else None
+
+    def latest_snapshot(self, snapshot_type):
+        """ The latest snapshot of the type with its fire boundary, None if the bushfire doesn't have one """
+        try:
+            return self.snapshots.select_related('fire_boundary_geometry').filter(snapshot_type=snapshot_type).latest('created')
+        except BushfireSnapshot.DoesNotExist:
+            return None
 
     @property
     def snapshot_list(self):
@@ -1245,6 +1315,83 @@ class DocumentListener(object):
                 traceback.print_exc()
 
 
+class ReportJob(models.Model):
+    """
+    A report generation job, queued by the web request and processed by the workers of the run_report_jobs command
+    """
+    TYPE_BUSHFIRE_REPORT = 'bushfire_report'
+    TYPE_MINISTERIAL_PDF = 'ministerial_pdf'
+    TYPE_CHOICES = (
+        (TYPE_BUSHFIRE_REPORT, 'Bushfire Report (Excel)'),
+        (TYPE_MINISTERIAL_PDF, 'Ministerial Report (PDF)'),
+    )
+
+    STATUS_QUEUED    = 1
+    STATUS_RUNNING   = 2
+    STATUS_SUCCEEDED = 3
+    STATUS_FAILED    = 4
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    job_type = models.CharField(max_length=32, choices=TYPE_CHOICES, editable=False)
+    parameters = models.TextField(default='{}', editable=False)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=STATUS_QUEUED, editable=False, db_index=True)
+    submitter = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, editable=False, related_name='report_jobs')
+    submitted = models.DateTimeField(default=timezone.now, editable=False)
+    started = models.DateTimeField(null=True, editable=False)
+    finished = models.DateTimeField(null=True, editable=False)
+    worker = models.CharField(max_length=64, null=True, editable=False)
+    #the last time the worker reported it is still running the job
+    heartbeat = models.DateTimeField(null=True, editable=False)
+    #the number of times the job has been claimed by a worker
+    attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    result = models.FileField(upload_to='report_jobs/%Y/%m/', null=True, editable=False)
+    filename = models.CharField(max_length=128, null=True, editable=False)
+    content_type = models.CharField(max_length=64, null=True, editable=False)
+    error = models.TextField(null=True, editable=False)
+
+    @property
+    def params(self):
+        return json.loads(self.parameters) if self.parameters else {}
+
+    @property
+    def is_finished(self):
+        return self.status in (ReportJob.STATUS_SUCCEEDED, ReportJob.STATUS_FAILED)
+
+    @property
+    def wait_time(self):
+        """ The time the job was queued before a worker picked it up """
+        return (self.started - self.submitted) if self.started else None
+
+    @property
+    def run_time(self):
+        return (self.finished - self.started) if self.started and self.finished else None
+
+    def __str__(self):
+        return "{}({}) - {}".format(self.get_job_type_display(), self.id, self.get_status_display())
+
+    class Meta:
+        ordering = ['-submitted']
+
+
+class ReportJobListener(object):
+    @staticmethod
+    @receiver(post_delete, sender=ReportJob)
+    def delete_result(sender, instance, **kwargs):
+        """
+        Delete the generated report from disk if the job is deleted
+        """
+        if instance.result:
+            try:
+                instance.result.delete(save=False)
+            except:
+                traceback.print_exc()
+
+
 reversion.register(Bushfire, follow=['tenures_burnt', 'injuries', 'damages'])
 reversion.register(Profile)
 reversion.register(Region)
@@ -0,0 +1,162 @@
+"""
+Paginators for the big lists (the bushfire list).
+
+EstimatedCountPaginator uses the planner's row estimate instead of COUNT(*) when the estimate is over
+settings.ESTIMATED_COUNT_THRESHOLD rows, the exact count is only needed for the page links.
+
+KeysetPaginator seeks to a page with the key (the order by columns) of the last row of the previous page
+(or the first row of the next page) instead of OFFSET, so a page costs the same no matter how deep it is.
+Every page has a next_cursor and a previous_cursor, passed back as the 'after'/'before' request parameters
+by the next/previous page links; a page requested without a cursor (a numbered page link) falls back to OFFSET.
+"""
+import base64
+import json
+from datetime import datetime, date
+
+from django.conf import settings
+from django.core.paginator import Paginator, Page
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        """ The planner's estimate of the number of rows if over the threshold, the exact count otherwise """
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (FORMAT JSON) {}".format(sql), params)
+                plan = cursor.fetchone()[0]
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            estimate = int(plan[0]["Plan"]["Plan Rows"])
+        except Exception as e:
+            logger.error("Failed to estimate the row count. {}".format(e))
+            estimate = 0
+
+        if estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class KeysetPage(Page):
+    def __init__(self, object_list, number, paginator, has_next=None):
+        super(KeysetPage, self).__init__(list(object_list), number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        if self._has_next is None:
+            return super(KeysetPage, self).has_next()
+        return self._has_next
+
+    def next_page_number(self):
+        if self._has_next is None:
+            return super(KeysetPage, self).next_page_number()
+        return self.number + 1
+
+    @property
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1]) if self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0]) if self.object_list else None
+
+
+class KeysetPaginator(EstimatedCountPaginator):
+    """
+    after: the cursor of the last row of the previous page
+    before: the cursor of the first row of the next page
+    Keyset paging is only used if the queryset is ordered by the model's own fields, the cursors of the pages are None otherwise.
+    The nulls are ordered as postgres does: last in ascending order, first in descending order
+    """
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, after=None, before=None):
+        super(KeysetPaginator, self).__init__(object_list, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page)
+        self.ordering = self.get_ordering()
+        if self.ordering and len(self.ordering) > len(self.object_list.query.order_by):
+            #order by the primary key too, so the key of a row is unique
+            self.object_list = self.object_list.order_by(*(list(self.object_list.query.order_by) + ['pk']))
+        self.after = self.decode_cursor(after) if after and self.ordering else None
+        self.before = self.decode_cursor(before) if before and self.ordering and not self.after else None
+
+    def get_ordering(self):
+        """ [(field, descending)] of the queryset's order by, ending with the primary key; None if not supported """
+        model = self.object_list.model
+        fields = dict([(f.name, f) for f in model._meta.concrete_fields])
+        ordering = []
+        for name in self.object_list.query.order_by:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            name = model._meta.pk.name if name == 'pk' else name
+            if name not in fields:
+                return None
+            ordering.append((fields[name], descending))
+        if not ordering:
+            return None
+        if model._meta.pk not in [f for f, _ in ordering]:
+            ordering.append((model._meta.pk, False))
+        return ordering
+
+    def encode_cursor(self, obj):
+        if not self.ordering:
+            return None
+        values = []
+        for field, descending in self.ordering:
+            value = getattr(obj, field.attname)
+            values.append(value.isoformat() if isinstance(value, (datetime, date)) else value)
+        return base64.urlsafe_b64encode(json.dumps(values))
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if len(values) != len(self.ordering):
+                raise Exception("The cursor doesn't match the ordering")
+            return [None if value is None else field.to_python(value) for (field, descending), value in zip(self.ordering, values)]
+        except Exception as e:
+            logger.warning("Ignore the invalid cursor ({}). {}".format(cursor, e))
+            return None
+
+    def keyset_filter(self, values, reverse=False):
+        """ The Q object of the rows after the key in the ordering, or before the key if reverse is True """
+        key_filter = None
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, values):
+            if descending != reverse:
+                #nulls are first
+                if value is None:
+                    after = Q(**{"{}__isnull".format(field.name): False})
+                else:
+                    after = Q(**{"{}__lt".format(field.name): value})
+            else:
+                #nulls are last
+                if value is None:
+                    after = None
+                elif field.null:
+                    after = Q(**{"{}__gt".format(field.name): value}) | Q(**{"{}__isnull".format(field.name): True})
+                else:
+                    after = Q(**{"{}__gt".format(field.name): value})
+            if after is not None:
+                key_filter = (equal & after) if key_filter is None else key_filter | (equal & after)
+            equal = equal & (Q(**{"{}__isnull".format(field.name): True}) if value is None else Q(**{field.name: value}))
+        return key_filter if key_filter is not None else Q(pk__in=[])
+
+    def page(self, number):
+        if not (self.after or self.before):
+            return super(KeysetPaginator, self).page(number)
+
+        #the number is only used for display, the page is found by the cursor; the count may be an estimate
+        number = max(int(number), 1)
+        if self.after:
+            rows = list(self.object_list.filter(self.keyset_filter(self.after))[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+        else:
+            rows = list(self.object_list.filter(self.keyset_filter(self.before, reverse=True)).reverse()[:self.per_page])
+            return KeysetPage(rows[::-1], number, self, has_next=True)
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
@@ -0,0 +1,216 @@
+"""
+A database backed job queue for the reports which are too slow to generate inside a web request
+(the bushfire report workbook and the latex ministerial report).
+
+The web request submits a ReportJob and redirects to the job page, which polls the job status;
+the workers started by the 'run_report_jobs' command claim the queued jobs (SELECT ... FOR UPDATE SKIP LOCKED),
+generate the report into MEDIA_ROOT/report_jobs and record the status and timing.
+While a job runs, its worker updates the job's heartbeat; a running job without a recent heartbeat belongs to a dead worker
+and is requeued, or failed after REPORT_JOB_MAX_ATTEMPTS attempts.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from multiprocessing import Process
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, connections
+from django.utils import timezone
+
+from bfrs.models import ReportJob
+from bfrs.excel import excel_content_type
+
+import logging
+logger = logging.getLogger(__name__)
+
+#the seconds between two checks for stale jobs in a worker
+REQUEUE_INTERVAL = 60
+
+
+def bushfire_report_job(params):
+    from bfrs.reports import BushfireReport
+    rpt_date, data = BushfireReport.get_cached_workbook(params.get("reporting_year"))
+    return (BushfireReport.workbook_filename(rpt_date), excel_content_type(), data)
+
+
+def ministerial_pdf_job(params):
+    from bfrs.reports import MinisterialReport
+    downloadname, data = MinisterialReport().get_pdf(params.get("form_data") or {}, params.get("user"), params.get("baseurl"))
+    return (downloadname, 'application/pdf', data)
+
+
+#job type -> function(params) returning (filename, content type, content)
+JOB_HANDLERS = {
+    ReportJob.TYPE_BUSHFIRE_REPORT: bushfire_report_job,
+    ReportJob.TYPE_MINISTERIAL_PDF: ministerial_pdf_job,
+}
+
+
+def submit_job(job_type, params=None, user=None):
+    """
+    Queue a report job; returns the ReportJob
+    """
+    if job_type not in JOB_HANDLERS:
+        raise Exception("Unknown report job type '{}'".format(job_type))
+    job = ReportJob.objects.create(job_type=job_type, parameters=json.dumps(params or {}), submitter=user)
+    logger.info("Submitted {}".format(job))
+    return job
+
+
+def claim_job(worker):
+    """
+    Claim the oldest queued job for the worker; returns the ReportJob or None if the queue is empty.
+    SKIP LOCKED lets the workers claim jobs concurrently without waiting for each other
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+UPDATE bfrs_reportjob SET status = %s, started = %s, heartbeat = %s, worker = %s, attempts = attempts + 1
+WHERE id = (
+    SELECT id FROM bfrs_reportjob WHERE status = %s ORDER BY submitted, id LIMIT 1 FOR UPDATE SKIP LOCKED
+)
+RETURNING id
+""", [ReportJob.STATUS_RUNNING, now, now, worker, ReportJob.STATUS_QUEUED])
+        row = cursor.fetchone()
+    return ReportJob.objects.get(id=row[0]) if row else None
+
+
+class Heartbeat(threading.Thread):
+    """
+    Update the heartbeat of the job every interval seconds while the worker runs it
+    """
+    def __init__(self, job, interval=None):
+        super(Heartbeat, self).__init__(name="heartbeat-{}".format(job.id))
+        self.daemon = True
+        self.job = job
+        self.interval = interval or settings.REPORT_JOB_HEARTBEAT_INTERVAL
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                ReportJob.objects.filter(id=self.job.id, worker=self.job.worker, status=ReportJob.STATUS_RUNNING).update(heartbeat=timezone.now())
+        except:
+            logger.error("Failed to update the heartbeat of {}. {}".format(self.job, traceback.format_exc()))
+        finally:
+            #the thread has its own database connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Generate the report of a claimed job and record the result.
+    The result is only recorded if the job still belongs to the worker, i.e. it hasn't been requeued meanwhile;
+    returns True if the result is recorded
+    """
+    logger.info("Running {}".format(job))
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        filename, content_type, data = JOB_HANDLERS[job.job_type](job.params)
+        job.result.save(filename, ContentFile(data), save=False)
+        job.filename = filename
+        job.content_type = content_type
+        job.status = ReportJob.STATUS_SUCCEEDED
+    except Exception as e:
+        logger.error("Failed to run {}. {}".format(job, traceback.format_exc()))
+        job.status = ReportJob.STATUS_FAILED
+        job.error = str(e)
+    finally:
+        heartbeat.stop()
+    job.finished = timezone.now()
+    recorded = ReportJob.objects.filter(id=job.id, worker=job.worker, status=ReportJob.STATUS_RUNNING).update(
+        result=job.result.name, filename=job.filename, content_type=job.content_type, status=job.status, error=job.error, finished=job.finished
+    )
+    if not recorded:
+        logger.warning("{} was taken from worker {}, discard its result".format(job, job.worker))
+        if job.result:
+            job.result.delete(save=False)
+        return False
+    logger.info("Finished {}. wait time={}, run time={}".format(job, job.wait_time, job.run_time))
+    return True
+
+
+def run_worker(poll_interval=None, max_jobs=None):
+    """
+    Process the queued jobs until max_jobs jobs have been run (forever if None);
+    the jobs of the dead workers are checked every REQUEUE_INTERVAL seconds
+    """
+    poll_interval = poll_interval or settings.REPORT_JOB_POLL_INTERVAL
+    worker = "{}:{}".format(socket.gethostname(), os.getpid())
+    logger.info("Report job worker {} started".format(worker))
+    jobs = 0
+    last_requeue = None
+    while max_jobs is None or jobs < max_jobs:
+        if last_requeue is None or time.time() - last_requeue >= REQUEUE_INTERVAL:
+            requeue_stale_jobs()
+            last_requeue = time.time()
+        job = claim_job(worker)
+        if job:
+            run_job(job)
+            jobs += 1
+        else:
+            #close the connection while idle
+            connection.close()
+            time.sleep(poll_interval)
+
+
+def _start_worker(poll_interval, max_jobs):
+    #the forked process must not share the parent's database connections
+    connections.close_all()
+    try:
+        run_worker(poll_interval, max_jobs)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(workers=None, poll_interval=None, max_jobs=None):
+    """
+    Start a pool of worker processes and wait for them
+    """
+    workers = workers or settings.REPORT_JOB_WORKERS
+    if workers == 1:
+        run_worker(poll_interval, max_jobs)
+        return
+
+    connections.close_all()
+    processes = [Process(target=_start_worker, args=(poll_interval, max_jobs)) for i in range(workers)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+            p.join()
+
+
+def requeue_stale_jobs(timeout=None, max_attempts=None):
+    """
+    Requeue the running jobs whose worker died, i.e. hasn't sent a heartbeat for timeout seconds;
+    a job which has been claimed max_attempts times is failed instead.
+    Returns the number of requeued jobs
+    """
+    timeout = timeout or settings.REPORT_JOB_TIMEOUT
+    max_attempts = max_attempts or settings.REPORT_JOB_MAX_ATTEMPTS
+    now = timezone.now()
+    stale = ReportJob.objects.filter(status=ReportJob.STATUS_RUNNING, heartbeat__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=ReportJob.STATUS_FAILED, finished=now, error="The worker stopped running the job {} times".format(max_attempts)
+    )
+    if failed:
+        logger.error("Failed {} stale report jobs after {} attempts".format(failed, max_attempts))
+    count = stale.filter(attempts__lt=max_attempts).update(status=ReportJob.STATUS_QUEUED, started=None, heartbeat=None, worker=None)
+    if count:
+        logger.info("Requeued {} stale report jobs".format(count))
+    return count
@@ -0,0 +1,701 @@
+import json
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+import logging
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+INCREMENTAL = "incremental"
+
+#The spatial layers the area burnt calculation is based on.
+#Any change to these tables invalidates every previously calculated area burnt row, so incremental mode falls back to a full rebuild.
+LAYER_TABLES = ["reporting_cadastre", "reporting_dept_managed", "reporting_dept_interest", "reporting_state_forest"]
+#Small lookup tables joined by the area burnt calculation, versioned by content
+LOOKUP_TABLES = ["bfrs_tenure", "bfrs_region"]
+#Source tables copied with 'SELECT *'; a schema change (migration) forces a full rebuild
+SOURCE_TABLES = ["bfrs_bushfire", "bfrs_areaburnt"]
+
+#reporting_cadastre has huge, complex polygons. The area burnt is calculated against the pieces of reporting_cadastre_subdivided
+#(at most CADASTRE_SUBDIVIDE_MAX_VERTICES vertices each) and summed per parcel (objectid).
+#The table is refreshed by CadastreTableUpdate, and by calculate_report_tables if reporting_cadastre has been replaced since.
+CADASTRE_SUBDIVIDE_MAX_VERTICES = 256
+
+DELTA_FILTER = "AND bf.id IN (SELECT id FROM reporting_delta_fires)"
+
+#Generated reports are cached per reporting table build; the keys of the cached reports are kept under REPORT_CACHE_KEYS
+#so they can be deleted when a new build finishes
+REPORT_CACHE_KEYS = "reporting_build_cached_reports"
+
+#The reporting tables read by the reports.
+#The sql below refers to them as '{reporting_bushfire}' etc.; a full rebuild writes into their shadow tables and swaps them in at the end.
+REPORTING_TABLES = ["reporting_bushfire", "reporting_areaburnt", "reporting_crossregion_fires"]
+LIVE_TABLES = dict((t, t) for t in REPORTING_TABLES)
+SHADOW_TABLES = dict((t, "{}_shadow".format(t)) for t in REPORTING_TABLES)
+
+#Steps to recreate the reporting_bushfire and reporting_areaburnt tables from scratch
+CREATE_TABLE_STEPS = [
+    ("reporting_bushfire CREATION AND INDEXES", """
+DROP TABLE IF EXISTS {reporting_bushfire};
+CREATE TABLE {reporting_bushfire} AS SELECT * FROM bfrs_bushfire;
+CREATE INDEX idx_{reporting_bushfire}_tenure ON {reporting_bushfire} (tenure_id);
+CREATE INDEX idx_{reporting_bushfire}_region ON {reporting_bushfire} (region_id);
+CREATE INDEX idx_{reporting_bushfire}_rpt_status ON {reporting_bushfire} (report_status);
+CREATE INDEX idx_{reporting_bushfire}_rpt_year ON {reporting_bushfire} (reporting_year);
+CREATE INDEX idx_{reporting_bushfire}_id ON {reporting_bushfire} (id);
+"""),
+    ("reporting_areaburnt CREATION AND INDEXES", """
+DROP TABLE IF EXISTS {reporting_areaburnt};
+CREATE TABLE {reporting_areaburnt} AS SELECT * FROM bfrs_areaburnt;
+ALTER TABLE {reporting_areaburnt} DROP CONSTRAINT IF EXISTS reporting_areaburnt_bushfire_id_tenure_id_key;
+ALTER TABLE {reporting_areaburnt} ADD COLUMN region_id Integer;
+ALTER TABLE {reporting_areaburnt} ADD COLUMN has_fire_boundary Boolean;
+CREATE INDEX idx_{reporting_areaburnt}_tenure ON {reporting_areaburnt}(tenure_id);
+CREATE INDEX idx_{reporting_areaburnt}_bushfire ON {reporting_areaburnt}(bushfire_id);
+CREATE INDEX idx_{reporting_areaburnt}_region ON {reporting_areaburnt}(region_id);
+DELETE FROM {reporting_areaburnt} WHERE bushfire_id IN (SELECT id FROM {reporting_bushfire} WHERE fire_boundary IS NOT NULL);
+UPDATE {reporting_areaburnt} ab SET region_id = (SELECT bf.region_id FROM {reporting_bushfire} bf WHERE ab.bushfire_id = bf.id);
+UPDATE {reporting_areaburnt} SET has_fire_boundary = False;
+"""),
+    ("make valid fire boundaries", """
+UPDATE {reporting_bushfire} SET fire_boundary = ST_CollectionExtract(ST_MakeValid(fire_boundary), 3) WHERE NOT ST_IsValid(fire_boundary);
+"""),
+    ("GET REGION-CROSSING FIRES", """
+DROP TABLE IF EXISTS {reporting_crossregion_fires};
+CREATE TABLE {reporting_crossregion_fires} AS SELECT DISTINCT bf.id FROM {reporting_bushfire} bf JOIN bfrs_region r ON ST_Overlaps(bf.fire_boundary, r.geometry);
+CREATE INDEX idx_{reporting_crossregion_fires} ON {reporting_crossregion_fires}(id);
+"""),
+]
+
+#Steps to replace the rows of the changed fires (listed in reporting_delta_fires) in the existing reporting tables
+REFRESH_DELTA_STEPS = [
+    ("replace changed fires in reporting_bushfire", """
+DELETE FROM {reporting_bushfire} WHERE id IN (SELECT id FROM reporting_delta_fires);
+INSERT INTO {reporting_bushfire} SELECT * FROM bfrs_bushfire WHERE id IN (SELECT id FROM reporting_delta_fires);
+UPDATE {reporting_bushfire} SET fire_boundary = ST_CollectionExtract(ST_MakeValid(fire_boundary), 3) WHERE NOT ST_IsValid(fire_boundary) AND id IN (SELECT id FROM reporting_delta_fires);
+"""),
+    ("replace changed fires in reporting_areaburnt", """
+DELETE FROM {reporting_areaburnt} WHERE bushfire_id IN (SELECT id FROM reporting_delta_fires);
+INSERT INTO {reporting_areaburnt} (id, area, bushfire_id, tenure_id, region_id, has_fire_boundary)
+    SELECT ab.id, ab.area, ab.bushfire_id, ab.tenure_id, bf.region_id, False
+    FROM bfrs_areaburnt ab JOIN {reporting_bushfire} bf ON ab.bushfire_id = bf.id
+    WHERE bf.fire_boundary IS NULL AND bf.id IN (SELECT id FROM reporting_delta_fires);
+"""),
+    ("replace changed fires in reporting_crossregion_fires", """
+DELETE FROM {reporting_crossregion_fires} WHERE id IN (SELECT id FROM reporting_delta_fires);
+INSERT INTO {reporting_crossregion_fires} (id)
+    SELECT DISTINCT bf.id FROM {reporting_bushfire} bf JOIN bfrs_region r ON ST_Overlaps(bf.fire_boundary, r.geometry)
+    WHERE bf.id IN (SELECT id FROM reporting_delta_fires);
+"""),
+]
+
+#Area burnt intersections of the fires which are not region-crossing.
+#Each entry is (key, description, sql); the sql selects (area, bushfire_id, tenure_id, region_id, has_fire_boundary) rows.
+#The intersections are independent of each other and are calculated concurrently into the staging tables 'reporting_stage_<key>'.
+#'{bushfire_filter}' restricts an intersection to the changed fires in incremental mode and is empty in a full rebuild.
+AREA_BURNT_INTERSECTIONS = [
+    #UCL/Other Crown/Private Property 13 min
+    ("other_crown", "Other Crown 5min", """
+SELECT ROUND((SUM(ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914)))/10000)::numeric,2) AS area, bf.id AS bushfire_id, 19 AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape)
+    WHERE brc_fms_legend = 'Other Crown Land' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+    GROUP BY bf.id, bf.region_id, cad.objectid
+"""),
+    ("ucl", "UCL 5min", """
+SELECT ROUND((SUM(ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914)))/10000)::numeric,2) AS area, bf.id AS bushfire_id, 25 AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape)
+    WHERE brc_fms_legend = 'UCL' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+    GROUP BY bf.id, bf.region_id, cad.objectid
+"""),
+    ("freehold", "Freehold 15s", """
+SELECT ROUND((SUM(ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914)))/10000)::numeric,2) AS area, bf.id AS bushfire_id, 18 AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape)
+    WHERE brc_fms_legend = 'Freehold' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+    GROUP BY bf.id, bf.region_id, cad.objectid
+"""),
+    #DEPT LAND
+    ("dept_interest", "INTEREST 20s", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, di.geometry), 900914))/10000)::numeric,2) AS area,
+    bf.id AS bushfire_id, t.id AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_dept_interest di ON ST_Intersects(bf.fire_boundary, di.geometry) JOIN bfrs_tenure t ON di.category = t.name
+    WHERE bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+    ("dept_managed", "MANAGED 3min", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, dm.geometry), 900914))/10000)::numeric,2) AS area,
+    bf.id AS bushfire_id, t.id AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_dept_managed dm ON ST_Intersects(bf.fire_boundary, dm.geometry) JOIN bfrs_tenure t ON dm.category = t.name
+    WHERE dm.category <> 'State Forest' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+    #STATE FOREST 20s
+    ("hardwood", "Hardwood 4s", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, sf.shape), 900914))/10000)::numeric,2) AS area, bf.id AS bushfire_id, 26 AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape)
+    WHERE fbr_fire_report_classification = 'Native Hardwood' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+    ("softwood", "Softwood 1s", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, sf.shape), 900914))/10000)::numeric,2) AS area, bf.id AS bushfire_id, 27 AS tenure_id, bf.region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape)
+    WHERE fbr_fire_report_classification = 'State - Coniferous' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+]
+
+#Area burnt intersections of the region-crossing fires (20min in total), the same format as AREA_BURNT_INTERSECTIONS
+CROSSREGION_AREA_BURNT_INTERSECTIONS = [
+    ("crossregion_sa_nt", "SA/NT: the SA/NT components of trans-state fires (this is done USING r.name = t.name) 1 min", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, r.geometry), 900914))/10000)::numeric,2) AS area,
+    bf.id AS bushfire_id, t.id AS tenure_id, r.id AS region_id, True AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON r.name = t.name
+    WHERE True {bushfire_filter}
+"""),
+    #the Prvt Prpty / UCL / Other Crown Land components of trans-region fires (13 min)
+    ("crossregion_other_crown", "trans-region Other Crown Land", """
+SELECT area, bushfire_id, 19 AS tenure_id, region_id, True AS has_fire_boundary
+FROM (
+    SELECT SUM(ROUND((parcel_area/10000)::numeric, 2)) AS area, bushfire_id, region_id
+    FROM (
+        SELECT SUM(ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))) AS parcel_area,
+        bf.id as bushfire_id, r.id as region_id
+        FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
+        WHERE brc_fms_legend = 'Other Crown Land' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) AND r.dbca {bushfire_filter}
+        GROUP BY bf.id, r.id, cad.objectid) AS parcels
+    GROUP BY bushfire_id, region_id) AS sqry
+"""),
+    ("crossregion_ucl", "trans-region UCL 3 min", """
+SELECT area, bushfire_id, 25 AS tenure_id, region_id, True AS has_fire_boundary
+FROM (
+    SELECT SUM(ROUND((parcel_area/10000)::numeric, 2)) AS area, bushfire_id, region_id
+    FROM (
+        SELECT SUM(ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))) AS parcel_area,
+        bf.id as bushfire_id, r.id as region_id
+        FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
+        WHERE brc_fms_legend = 'UCL' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) AND r.dbca {bushfire_filter}
+        GROUP BY bf.id, r.id, cad.objectid) AS parcels
+    GROUP BY bushfire_id, region_id) AS sqry
+"""),
+    ("crossregion_freehold", "trans-region Private Property (Freehold) 30s", """
+SELECT area, bushfire_id, 18 AS tenure_id, region_id, True AS has_fire_boundary
+FROM (
+    SELECT SUM(ROUND((parcel_area/10000)::numeric, 2)) AS area, bushfire_id, region_id
+    FROM (
+        SELECT SUM(ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))) AS parcel_area,
+        bf.id as bushfire_id, r.id as region_id
+        FROM {reporting_bushfire} bf JOIN reporting_cadastre_subdivided cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
+        WHERE brc_fms_legend = 'Freehold' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) and r.dbca {bushfire_filter}
+        GROUP BY bf.id, r.id, cad.objectid) AS parcels
+    GROUP BY bushfire_id, region_id) AS sqry
+"""),
+    ("crossregion_hardwood", "trans-region State Forest (Hardwood) 4s", """
+SELECT area, bushfire_id, 26 AS tenure_id, region_id, True AS has_fire_boundary
+FROM (
+    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, sf.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
+    bf.id as bushfire_id, r.id as region_id
+    FROM {reporting_bushfire} bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
+    WHERE fbr_fire_report_classification = 'Native Hardwood' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) and r.dbca {bushfire_filter}
+    GROUP BY bf.id, r.id) AS sqry
+"""),
+    ("crossregion_softwood", "trans-region State Forest (Softwood) 4s", """
+SELECT area, bushfire_id, 27 AS tenure_id, region_id, True AS has_fire_boundary
+FROM (
+    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, sf.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
+    bf.id as bushfire_id, r.id as region_id
+    FROM {reporting_bushfire} bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
+    WHERE fbr_fire_report_classification = 'State - Coniferous' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) and r.dbca {bushfire_filter}
+    GROUP BY bf.id, r.id) AS sqry
+"""),
+    ("crossregion_dept_interest", "trans-region Interest Tenure 8s", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, di.geometry), r.geometry), 900914))/10000)::numeric,2) AS area,
+    bf.id AS bushfire_id, t.id AS tenure_id, r.id AS region_id, NULL::boolean AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_dept_interest di ON ST_Intersects(bf.fire_boundary, di.geometry) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON di.category = t.name
+    WHERE bf.id IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+    ("crossregion_dept_managed", "trans-region Managed Tenure 1:19", """
+SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, dm.geometry), r.geometry), 900914))/10000)::numeric,2) AS area,
+    bf.id AS bushfire_id, t.id AS tenure_id, r.id AS region_id, NULL::boolean AS has_fire_boundary
+    FROM {reporting_bushfire} bf JOIN reporting_dept_managed dm ON ST_Intersects(bf.fire_boundary, dm.geometry) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON dm.category = t.name
+    WHERE dm.category <> 'State Forest' AND bf.id IN (SELECT id FROM {reporting_crossregion_fires}) {bushfire_filter}
+"""),
+]
+
+#Steps to update the tenure of ignition point and the tenure of the area burnt rows of the fires without fire boundary.
+#Run after the area burnt of the non region-crossing fires is merged and before the area burnt of the region-crossing fires is merged.
+TENURE_STEPS = [
+    ("UPDATE tenure_id FOR IGNITION POINTS IN UCL, FREEHOLD AND OTHER CROWN", """
+UPDATE {reporting_bushfire} bf SET tenure_id = 19 WHERE bf.id IN
+    (SELECT id FROM {reporting_bushfire} bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'Other Crown Land' {bushfire_filter});
+UPDATE {reporting_bushfire} bf SET tenure_id = 18 WHERE bf.id IN
+    (SELECT id FROM {reporting_bushfire} bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'Freehold' {bushfire_filter});
+UPDATE {reporting_bushfire} bf SET tenure_id = 25 WHERE bf.id IN
+    (SELECT id FROM {reporting_bushfire} bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'UCL' {bushfire_filter});
+"""),
+    ("UPDATE tenure_id FOR OLD 'Other' TENURE IN DEPT-MANAGED LAND", """
+UPDATE {reporting_bushfire}
+SET tenure_id = t_id
+FROM (SELECT bf.id AS bf_id, t.id AS t_id FROM {reporting_bushfire} bf, reporting_dept_managed dm
+    JOIN bfrs_tenure t ON dm.category = t.name
+    WHERE tenure_id = 20 AND st_within(bf.origin_point, dm.geometry) {bushfire_filter}) AS sqry
+WHERE id = bf_id;
+"""),
+    ("state forest area burnt where NOT has_fire_boundary, remaining '3's should be 26", """
+UPDATE {reporting_areaburnt} SET tenure_id = 27 WHERE id IN
+    (SELECT ab.id FROM {reporting_areaburnt} ab JOIN {reporting_bushfire} bf ON ab.bushfire_id = bf.id
+    JOIN reporting_state_forest sf ON ST_Within(bf.origin_point, sf.shape)
+    WHERE ab.tenure_id = 3 AND NOT has_fire_boundary AND sf.fbr_fire_report_classification = 'State - Coniferous' {bushfire_filter});
+UPDATE {reporting_areaburnt} SET tenure_id = 26 WHERE id IN
+    (SELECT ab.id FROM {reporting_areaburnt} ab JOIN {reporting_bushfire} bf ON ab.bushfire_id = bf.id
+    JOIN reporting_state_forest sf ON ST_Within(bf.origin_point, sf.shape)
+    WHERE ab.tenure_id = 3 AND NOT has_fire_boundary AND sf.fbr_fire_report_classification = 'Native Hardwood' {bushfire_filter});
+DELETE FROM {reporting_areaburnt} WHERE tenure_id = 3;
+"""),
+    ("UPDATE STATE FOREST IGNITION POINTS", """
+UPDATE {reporting_bushfire} bf SET tenure_id = 26 WHERE bf.tenure_id = 3 AND bf.id IN
+    (SELECT id FROM {reporting_bushfire} bf, reporting_state_forest sf WHERE ST_Within(bf.origin_point, sf.shape) AND sf.fbr_fire_report_classification = 'Native Hardwood' {bushfire_filter});
+UPDATE {reporting_bushfire} bf SET tenure_id = 27 WHERE bf.tenure_id = 3 AND bf.id IN
+    (SELECT id FROM {reporting_bushfire} bf, reporting_state_forest sf WHERE ST_Within(bf.origin_point, sf.shape) AND sf.fbr_fire_report_classification = 'State - Coniferous' {bushfire_filter});
+"""),
+]
+
+#The summary (cube) read by the reports, rebuilt at the end of every build.
+#A merged fire is counted in the reporting year and report status of its valid fire; the 'fires' rows count the fires by their
+#own region, tenure of ignition point and cause, and the 'area' rows sum the area burnt by tenure and area burnt region.
+#first_attack_id, valid_region_id and small_fire (area < 2 ha) are of the valid fire.
+CREATE_SUMMARY_SQL = """
+DROP TABLE IF EXISTS reporting_summary_shadow;
+CREATE TABLE reporting_summary_shadow AS
+SELECT 'fires'::varchar(8) AS measure, f.reporting_year, f.report_status, f.region_id, r.forest_region, NULL::integer AS area_region_id,
+    f.tenure_id, t.report_group, t.dbca_interest, f.cause_id, f.first_attack_id, f.valid_region_id, f.small_fire,
+    count(*) AS fires, NULL::double precision AS area
+FROM (
+    SELECT a1.reporting_year, a1.report_status, a1.region_id, a1.tenure_id, COALESCE(a1.cause_id, 9) AS cause_id,
+        a1.first_attack_id, a1.region_id AS valid_region_id, a1.area < 2.0 AS small_fire
+    FROM reporting_bushfire a1
+    WHERE a1.report_status IN (2, 3, 4) AND NOT a1.fire_not_found
+    UNION ALL
+    SELECT b2.reporting_year, b2.report_status, b1.region_id, b1.tenure_id, COALESCE(b1.cause_id, 9) AS cause_id,
+        b2.first_attack_id, b2.region_id AS valid_region_id, b2.area < 2.0 AS small_fire
+    FROM reporting_bushfire b1
+        JOIN reporting_bushfire b2 ON b1.valid_bushfire_id = b2.id AND b2.report_status IN (2, 3, 4) AND NOT b2.fire_not_found
+    WHERE b1.report_status = 100
+) f
+    LEFT JOIN bfrs_region r ON f.region_id = r.id
+    LEFT JOIN bfrs_tenure t ON f.tenure_id = t.id
+GROUP BY f.reporting_year, f.report_status, f.region_id, r.forest_region, f.tenure_id, t.report_group, t.dbca_interest, f.cause_id,
+    f.first_attack_id, f.valid_region_id, f.small_fire
+UNION ALL
+SELECT 'area'::varchar(8) AS measure, bf.reporting_year, bf.report_status, bf.region_id, r.forest_region, ab.region_id AS area_region_id,
+    ab.tenure_id, t.report_group, t.dbca_interest, COALESCE(bf.cause_id, 9) AS cause_id, bf.first_attack_id, bf.region_id AS valid_region_id, bf.area < 2.0 AS small_fire,
+    count(DISTINCT bf.id) AS fires, SUM(ab.area) AS area
+FROM reporting_bushfire bf
+    JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id
+    LEFT JOIN bfrs_region r ON bf.region_id = r.id
+    LEFT JOIN bfrs_tenure t ON ab.tenure_id = t.id
+WHERE bf.report_status IN (2, 3, 4) AND NOT bf.fire_not_found
+GROUP BY bf.reporting_year, bf.report_status, bf.region_id, r.forest_region, ab.region_id, ab.tenure_id, t.report_group, t.dbca_interest,
+    COALESCE(bf.cause_id, 9), bf.first_attack_id, bf.area < 2.0;
+CREATE INDEX idx_reporting_summary_shadow_year ON reporting_summary_shadow (reporting_year);
+ANALYZE reporting_summary_shadow;
+"""
+
+
+def table_exists(csr, table_name):
+    csr.execute("SELECT to_regclass(%s) IS NOT NULL", [table_name])
+    return csr.fetchone()[0]
+
+
+def create_build_table(csr):
+    """
+    reporting_build records each successful build of the reporting tables,
+    with the versions of the layers used by the build
+    """
+    csr.execute("""
+CREATE TABLE IF NOT EXISTS reporting_build (
+    id serial PRIMARY KEY,
+    mode varchar(16) NOT NULL,
+    started timestamp with time zone NOT NULL,
+    finished timestamp with time zone,
+    fires integer,
+    layer_versions text
+);
+""")
+
+
+def get_last_build(csr):
+    """
+    Return the last successful build as a dict (id, mode, started, finished, layer_versions); or None if no build
+    """
+    if not table_exists(csr, "reporting_build"):
+        return None
+    csr.execute("SELECT id, mode, started, finished, layer_versions FROM reporting_build WHERE finished IS NOT NULL ORDER BY id DESC LIMIT 1;")
+    row = csr.fetchone()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "mode": row[1],
+        "started": row[2],
+        "finished": row[3],
+        "layer_versions": json.loads(row[4]) if row[4] else {}
+    }
+
+
+def get_build_id():
+    """
+    Return the id of the last successful build of the reporting tables; or None if never built
+    """
+    with connection.cursor() as csr:
+        build = get_last_build(csr)
+    return build["id"] if build else None
+
+
+def report_cache_key(name, build_id):
+    return "report_{}_build_{}".format(name, build_id)
+
+
+def get_cached_report(name, build_id):
+    """
+    Return the cached data of the report generated from the build; or None if not cached
+    """
+    if build_id is None:
+        return None
+    return cache.get(report_cache_key(name, build_id))
+
+
+def cache_report(name, build_id, data, timeout=None):
+    """
+    Cache the data of the report generated from the build until the next build finishes,
+    or for timeout seconds if the report also includes live data
+    """
+    if build_id is None:
+        return
+    key = report_cache_key(name, build_id)
+    cache.set(key, data, timeout)
+    keys = cache.get(REPORT_CACHE_KEYS) or []
+    if key not in keys:
+        keys.append(key)
+        cache.set(REPORT_CACHE_KEYS, keys, None)
+
+
+def clear_report_cache():
+    """
+    Delete the cached reports, called when a build finishes
+    """
+    keys = cache.get(REPORT_CACHE_KEYS) or []
+    if keys:
+        cache.delete_many(keys)
+        logger.info("Deleted {} cached reports".format(len(keys)))
+    cache.delete(REPORT_CACHE_KEYS)
+
+
+def get_layer_versions(csr):
+    """
+    Return the current version of each table the area burnt calculation depends on.
+    The big spatial layers are versioned by their table oid (CadastreTableUpdate replaces the table) and the
+    row change counters; the lookup tables by the md5 of their content; the source tables by their column list.
+    """
+    versions = {}
+    for table in LAYER_TABLES:
+        csr.execute("""
+SELECT c.oid, s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+FROM pg_class c LEFT JOIN pg_stat_user_tables s ON c.oid = s.relid
+WHERE c.oid = to_regclass(%s);
+""", [table])
+        row = csr.fetchone()
+        versions[table] = ":".join(str(v) for v in row) if row else None
+
+    for table in LOOKUP_TABLES:
+        csr.execute("SELECT md5(string_agg(t::text, ',' ORDER BY t.id)) FROM {} t;".format(table))
+        versions[table] = csr.fetchone()[0]
+
+    for table in SOURCE_TABLES:
+        csr.execute("""
+SELECT md5(string_agg(column_name || ' ' || data_type, ',' ORDER BY ordinal_position))
+FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s;
+""", [table])
+        versions[table] = csr.fetchone()[0]
+
+    return versions
+
+
+def execute_steps(csr, steps, tables=LIVE_TABLES, bushfire_filter=""):
+    for desc, sql in steps:
+        logger.info("Started - {}".format(desc))
+        started = datetime.now()
+        csr.execute(sql.format(bushfire_filter=bushfire_filter, **tables))
+        logger.info("Completed - {} ({})".format(desc, datetime.now() - started))
+
+
+def check_layers(csr):
+    """
+    Check the reporting_cadastre for invalid shapes and make the other layers valid.
+    """
+    logger.info("Checking reporting_cadastre for invalid shapes")
+    csr.execute("SELECT count(*) AS invalid_shape_count FROM reporting_cadastre WHERE NOT ST_IsValid(shape);")
+    invalid_shapes = csr.fetchone()[0]
+    if invalid_shapes > 0:
+        raise Exception("There are {} invalid shapes in reporting_cadastre. Please contact the GIS Team to fix these shape errors.  Unable to continue with reporting build until resolved.".format(invalid_shapes))
+
+    # reporting_cadastre is not made valid here, because it takes up much time and resources to complete.
+    # The GIS team will need to fix the shapes in and then republish them to KB and the KB import script run to import the updated data.
+    csr.execute("UPDATE reporting_state_forest SET shape = ST_CollectionExtract(ST_MakeValid(shape), 3) WHERE NOT ST_IsValid(shape);")
+    csr.execute("UPDATE reporting_dept_managed SET geometry = ST_CollectionExtract(ST_MakeValid(geometry), 3) WHERE NOT ST_IsValid(geometry);")
+    csr.execute("UPDATE reporting_dept_interest SET geometry = ST_CollectionExtract(ST_MakeValid(geometry), 3) WHERE NOT ST_IsValid(geometry);")
+
+
+def stage_table(key):
+    return "reporting_stage_{}".format(key)
+
+
+def stage_intersection(csr, key, desc, sql, tables=LIVE_TABLES, bushfire_filter=""):
+    """
+    Calculate an area burnt intersection into its staging table
+    """
+    logger.info("Started - {}".format(desc))
+    started = datetime.now()
+    csr.execute("DROP TABLE IF EXISTS {0}; CREATE UNLOGGED TABLE {0} AS {1};".format(stage_table(key), sql.format(bushfire_filter=bushfire_filter, **tables)))
+    logger.info("Completed - {} ({})".format(desc, datetime.now() - started))
+
+
+def _stage_intersection_in_thread(args):
+    """
+    Run by the worker pool; django opens a separate database connection for each thread.
+    """
+    try:
+        with connection.cursor() as csr:
+            stage_intersection(csr, *args)
+    finally:
+        connection.close()
+
+
+def stage_intersections(csr, tables=LIVE_TABLES, bushfire_filter="", workers=1):
+    """
+    Calculate all area burnt intersections into their staging tables.
+    workers > 1: run the intersections concurrently on a pool of 'workers' database connections;
+        the tables the intersections read from must be committed.
+    """
+    intersections = [(key, desc, sql, tables, bushfire_filter) for key, desc, sql in AREA_BURNT_INTERSECTIONS + CROSSREGION_AREA_BURNT_INTERSECTIONS]
+    if workers > 1:
+        pool = ThreadPool(min(workers, len(intersections)))
+        try:
+            pool.map(_stage_intersection_in_thread, intersections, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for args in intersections:
+            stage_intersection(csr, *args)
+
+
+def merge_stages(csr, intersections, tables=LIVE_TABLES):
+    for key, desc, sql in intersections:
+        csr.execute("""
+INSERT INTO {} (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
+    SELECT area, bushfire_id, tenure_id, region_id, has_fire_boundary FROM {};
+""".format(tables["reporting_areaburnt"], stage_table(key)))
+
+
+def drop_stages(csr):
+    for key, desc, sql in AREA_BURNT_INTERSECTIONS + CROSSREGION_AREA_BURNT_INTERSECTIONS:
+        csr.execute("DROP TABLE IF EXISTS {};".format(stage_table(key)))
+
+
+def calculate_area_burnt(csr, tables=LIVE_TABLES, bushfire_filter="", workers=1):
+    """
+    Calculate the area burnt intersections into the staging tables, then merge them into reporting_areaburnt
+    and update the tenures in one transaction.
+    """
+    stage_intersections(csr, tables=tables, bushfire_filter=bushfire_filter, workers=workers)
+    with transaction.atomic():
+        logger.info("Merging area burnt staging tables into {}".format(tables["reporting_areaburnt"]))
+        merge_stages(csr, AREA_BURNT_INTERSECTIONS, tables=tables)
+        execute_steps(csr, TENURE_STEPS, tables=tables, bushfire_filter=bushfire_filter)
+        merge_stages(csr, CROSSREGION_AREA_BURNT_INTERSECTIONS, tables=tables)
+    #staging tables left by a failed build are replaced by the next build
+    drop_stages(csr)
+
+
+def swap_table(csr, table, shadow):
+    """
+    Replace the table with its shadow table and rename the shadow table's indexes.
+    Should be called in a transaction
+    """
+    csr.execute("DROP TABLE IF EXISTS {};".format(table))
+    csr.execute("ALTER TABLE {} RENAME TO {};".format(shadow, table))
+    csr.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s;", [table])
+    for (index,) in csr.fetchall():
+        if shadow in index:
+            csr.execute("ALTER INDEX {} RENAME TO {};".format(index, index.replace(shadow, table)))
+
+
+def swap_tables(csr):
+    """
+    Replace the reporting tables with their shadow tables, including the indexes, in one transaction.
+    The readers only wait for the renames; the old tables are dropped.
+    """
+    with transaction.atomic():
+        for table in REPORTING_TABLES:
+            swap_table(csr, table, SHADOW_TABLES[table])
+    logger.info("Swapped in the rebuilt reporting tables")
+
+
+def refresh_summary(csr):
+    """
+    Rebuild reporting_summary from the reporting tables and swap it in
+    """
+    csr.execute(CREATE_SUMMARY_SQL)
+    with transaction.atomic():
+        swap_table(csr, "reporting_summary", "reporting_summary_shadow")
+    csr.execute("SELECT count(*) FROM reporting_summary;")
+    logger.info("Rebuilt reporting_summary, {} rows".format(csr.fetchone()[0]))
+
+
+def get_cadastre_subdivided_source(csr):
+    """
+    Return the oid of the reporting_cadastre table reporting_cadastre_subdivided was built from; None if not built.
+    """
+    if not table_exists(csr, "reporting_cadastre_subdivided"):
+        return None
+    csr.execute("SELECT obj_description(to_regclass('reporting_cadastre_subdivided'), 'pg_class');")
+    return csr.fetchone()[0]
+
+
+def refresh_cadastre_subdivided(csr=None):
+    """
+    Rebuild reporting_cadastre_subdivided from reporting_cadastre and swap it in.
+    The oid of the source reporting_cadastre is saved as the table comment
+    """
+    if csr is None:
+        with connection.cursor() as csr:
+            return refresh_cadastre_subdivided(csr)
+
+    logger.info("Started - reporting_cadastre_subdivided CREATION AND INDEXES")
+    started = datetime.now()
+    csr.execute("SELECT to_regclass('reporting_cadastre')::oid;")
+    source = csr.fetchone()[0]
+    csr.execute("""
+DROP TABLE IF EXISTS reporting_cadastre_subdivided_shadow;
+CREATE TABLE reporting_cadastre_subdivided_shadow AS
+    SELECT objectid, brc_fms_legend, ST_Subdivide(shape, {0}) AS shape FROM reporting_cadastre;
+CREATE INDEX idx_reporting_cadastre_subdivided_shadow_shape ON reporting_cadastre_subdivided_shadow USING gist (shape);
+CREATE INDEX idx_reporting_cadastre_subdivided_shadow_type ON reporting_cadastre_subdivided_shadow (brc_fms_legend);
+COMMENT ON TABLE reporting_cadastre_subdivided_shadow IS '{1}';
+ANALYZE reporting_cadastre_subdivided_shadow;
+""".format(CADASTRE_SUBDIVIDE_MAX_VERTICES, source))
+    with transaction.atomic():
+        swap_table(csr, "reporting_cadastre_subdivided", "reporting_cadastre_subdivided_shadow")
+    logger.info("Completed - reporting_cadastre_subdivided CREATION AND INDEXES ({})".format(datetime.now() - started))
+
+
+def check_cadastre_subdivided(csr):
+    csr.execute("SELECT to_regclass('reporting_cadastre')::oid;")
+    source = str(csr.fetchone()[0])
+    if get_cadastre_subdivided_source(csr) != source:
+        logger.info("reporting_cadastre_subdivided is missing or out of date")
+        refresh_cadastre_subdivided(csr)
+
+
+def full_rebuild(csr, workers=1):
+    """
+    Rebuild the reporting tables into the shadow tables and swap them in, so the reports keep reading
+    the previous build until the new one is complete
+    """
+    execute_steps(csr, CREATE_TABLE_STEPS, tables=SHADOW_TABLES)
+    calculate_area_burnt(csr, tables=SHADOW_TABLES, workers=workers)
+    for table in REPORTING_TABLES:
+        csr.execute("ANALYZE {};".format(SHADOW_TABLES[table]))
+    swap_tables(csr)
+
+
+def incremental_rebuild(csr, last_build):
+    """
+    Recalculate the reporting rows of the fires changed (or deleted) since the last successful build started.
+    Runs in one transaction, so the reports never see a half applied delta.
+    bfrs_bushfire.modified is set by the application when the row is saved, but committed later, and the build start is
+    the database time; a fire saved just before the last build started and committed after it read bfrs_bushfire
+    (or saved by a server whose clock is behind the database) has a modified earlier than the build start.
+    So the delta goes back settings.REPORT_TABLES_INCREMENTAL_OVERLAP seconds before the last build started;
+    recalculating a fire again is harmless.
+    Return the number of recalculated fires
+    """
+    since = last_build["started"] - timedelta(seconds=settings.REPORT_TABLES_INCREMENTAL_OVERLAP)
+    with transaction.atomic():
+        csr.execute("DROP TABLE IF EXISTS reporting_delta_fires;")
+        csr.execute("""
+CREATE TABLE reporting_delta_fires AS
+    SELECT id FROM bfrs_bushfire WHERE modified >= %s
+    UNION
+    SELECT rb.id FROM reporting_bushfire rb WHERE NOT EXISTS (SELECT 1 FROM bfrs_bushfire b WHERE b.id = rb.id);
+""", [since])
+        csr.execute("CREATE INDEX idx_reporting_delta_fires ON reporting_delta_fires(id);")
+        csr.execute("SELECT count(*) FROM reporting_delta_fires;")
+        fires = csr.fetchone()[0]
+        logger.info("{} fires changed since {}".format(fires, since))
+        if fires:
+            execute_steps(csr, REFRESH_DELTA_STEPS)
+            #the delta is small and not committed yet, so it is calculated on this connection
+            calculate_area_burnt(csr, bushfire_filter=DELTA_FILTER)
+        csr.execute("DROP TABLE reporting_delta_fires;")
+
+    return fires
+
+
+def calculate_report_tables(incremental=False, workers=None):
+    """
+    Build the reporting tables (reporting_bushfire, reporting_areaburnt, reporting_crossregion_fires).
+    incremental: only recalculate the fires changed since the last successful build;
+        falls back to a full rebuild if there is no previous build or any layer has changed since.
+    workers: the number of database connections used to calculate the area burnt of a full rebuild;
+        default is settings.REPORT_TABLES_WORKERS
+    Return the mode used by the build
+    """
+    logger.info("Started calculate report tables")
+    csr = connection.cursor()
+    try:
+        check_layers(csr)
+        check_cadastre_subdivided(csr)
+        create_build_table(csr)
+
+        started = datetime.now()
+        csr.execute("SELECT CURRENT_TIMESTAMP;")
+        build_started = csr.fetchone()[0]
+        layer_versions = get_layer_versions(csr)
+
+        mode = FULL
+        if incremental:
+            last_build = get_last_build(csr)
+            if not last_build:
+                logger.info("No previous build of the reporting tables, run a full rebuild")
+            elif not all(table_exists(csr, t) for t in ("reporting_bushfire", "reporting_areaburnt", "reporting_crossregion_fires")):
+                logger.info("Reporting tables are missing, run a full rebuild")
+            else:
+                changed = [t for t, v in layer_versions.iteritems() if last_build["layer_versions"].get(t) != v]
+                if changed:
+                    logger.info("Tables ({}) changed since the last build, run a full rebuild".format(",".join(sorted(changed))))
+                else:
+                    mode = INCREMENTAL
+
+        logger.info("Dropping table calculate_report_tables_monitor")
+        csr.execute("DROP TABLE IF EXISTS calculate_report_tables_monitor;")
+
+        if mode == INCREMENTAL:
+            fires = incremental_rebuild(csr, last_build)
+        else:
+            full_rebuild(csr, workers=workers or settings.REPORT_TABLES_WORKERS)
+            csr.execute("SELECT count(*) FROM reporting_bushfire;")
+            fires = csr.fetchone()[0]
+
+        refresh_summary(csr)
+
+        csr.execute(
+            "INSERT INTO reporting_build (mode, started, finished, fires, layer_versions) VALUES (%s, %s, CURRENT_TIMESTAMP, %s, %s);",
+            [mode, build_started, fires, json.dumps(layer_versions)]
+        )
+        clear_report_cache()
+        logger.info("Creating calculate_report_tables_monitor with current timestamp for monitoring")
+        csr.execute("CREATE TABLE calculate_report_tables_monitor (id, timestamp) AS SELECT 1, CURRENT_TIMESTAMP;")
+        logger.info("Finished calculate report tables. mode={}, fires={}, time={}".format(mode, fires, datetime.now() - started))
+        return mode
+    finally:
+        csr.close()
@@ -6,8 +6,10 @@ from django.db.models.query import QuerySet
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from datetime import datetime
-from xlwt import Workbook, Font, XFStyle, Alignment, Pattern, Style
+from xlwt import Font, XFStyle, Alignment, Pattern, Style
+from bfrs.excel import new_workbook, excel_extension, excel_content_type
 from itertools import count
+from collections import namedtuple, OrderedDict
 import unicodecsv
 import shutil
 
@@ -16,16 +18,17 @@ from django.template.response import TemplateResponse
 from django.core.mail import send_mail
 from django.db import connection
 from cStringIO import StringIO
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.utils import timezone
 import os
 import subprocess
 import csv
-import traceback
+import time
 
 from django.template.loader import render_to_string
 from .utils import generate_pdf
+from bfrs import reporting_tables
 
 import logging
 logger = logging.getLogger(__name__)
@@ -90,6 +93,85 @@ style_bold_gen     = style(bold=True, num_fmt='#,##0')
 style_bold_red     = style(bold=True, num_fmt='#,##0', colour='red')
 style_bold_yellow  = style(bold=True, num_fmt='#,##0', colour='yellow')
 
+#the parsed HISTORICAL_CAUSE_CSV_FILE, reloaded when the file is modified
+_historical_causes = {"mtime": None, "data": None}
+
+def load_historical_causes():
+    """
+    Parse the historical data file - provided by FMS from legacy BFRS application - once.
+    The file has a count column and a percentage column (10 columns after) per fin year; a row per cause name and a 'Total' row.
+
+    Returns {fin_year: {'count': {cause_id: count}, 'perc': {cause_id: count}, 'count_total': count, 'perc_total': count}},
+    fin_year is the first part of '2006/2007'. The cause names are resolved with one query; the missing causes are added to MISSING_MAP
+    """
+    try:
+        mtime = os.path.getmtime(settings.HISTORICAL_CAUSE_CSV_FILE)
+    except OSError, e:
+        logger.error("Cannot Open CSV file: {}, {}".format(settings.HISTORICAL_CAUSE_CSV_FILE, e))
+        return {}
+    if _historical_causes["mtime"] == mtime:
+        return _historical_causes["data"]
+
+    data = {}
+    try:
+        with open(settings.HISTORICAL_CAUSE_CSV_FILE) as f:
+            reader = csv.reader(f, delimiter=',', quotechar='"')
+            hdr = reader.next()
+            hdr = [hdr[0]] + [int(i.split('/')[0]) for i in hdr if '/' in i] # converts '2006/2007' --> int('2006')
+            columns = {}
+            for idx, fin_year in enumerate(hdr):
+                if idx == 0 or fin_year in columns:
+                    continue
+                if idx + 10 >= len(hdr) or hdr[idx+10] != fin_year:
+                    # check idx + 10 is also equal to fin_year
+                    logger.error("Cannot find 2nd fin_year (percentage column) in CSV header: {}, {}".format(fin_year, hdr))
+                    continue
+                columns[fin_year] = idx
+                data[fin_year] = {'count': {}, 'perc': {}, 'count_total': 0, 'perc_total': 0}
+
+            causes = dict(Cause.objects.values_list('name', 'id'))
+            for i in reader:
+                if len(i) == 0 or i[0].startswith('#'):
+                    # ignore comments or blanks lines in csv file
+                    continue
+
+                if i[0] == 'Total':
+                    for fin_year, idx in columns.iteritems():
+                        data[fin_year]['count_total'] = int(i[idx])
+                        data[fin_year]['perc_total'] = int(i[idx+10])
+                    continue
+
+                cause_id = causes.get(i[0])
+                if cause_id is None:
+                    if not [j for j in MISSING_MAP if j.get('name') == i[0]]:
+                        MISSING_MAP.append( dict(name=i[0], error='Cause {0}, Missing from BFRS Enum list. Please Request OIM to add Cause={0}'.format(i[0])))
+                    continue
+                for fin_year, idx in columns.iteritems():
+                    data[fin_year]['count'][cause_id] = int(i[idx])
+                    data[fin_year]['perc'][cause_id] = int(i[idx+10])
+
+    except IOError, e:
+        logger.error("Cannot Open CSV file: {}, {}".format(settings.HISTORICAL_CAUSE_CSV_FILE, e))
+        return {}
+
+    except Exception, e:
+        logger.error("Error reading CSV file: {}, {}".format(settings.HISTORICAL_CAUSE_CSV_FILE, e))
+        return {}
+
+    _historical_causes["mtime"] = mtime
+    _historical_causes["data"] = data
+    return data
+
+
+def historical_cause_counts(fin_year):
+    """ {cause_id: count} of the fin year from the historical data file """
+    data = load_historical_causes().get(fin_year)
+    if data is None:
+        logger.error("Cannot find fin_year in CSV file: {}, {}".format(fin_year, settings.HISTORICAL_CAUSE_CSV_FILE))
+        return {}
+    return data['count']
+
+
 def read_col(fin_year, col_type):
     """ 
         Reads historical data from file - provided by FMS from legacy BFRS application
@@ -98,70 +180,163 @@ def read_col(fin_year, col_type):
         col_type: 'count'       --> annotated values or 
                   'total_count' --> aggregated values
     """
-    try:
-        reader = csv.reader(open(settings.HISTORICAL_CAUSE_CSV_FILE), delimiter=',', quotechar='"')
-        hdr = reader.next()
-        hdr = [hdr[0]] + [int(i.split('/')[0]) for i in hdr if '/' in i] # converts '2006/2007' --> int('2006')
-        idx = hdr.index(fin_year)
-
-        if hdr[idx+10] != fin_year:
-            # check idx + 10 is also equal to fin_year
-            logger.error("Cannot find 2nd fin_year (percentage column) in CSV header: {}, {}".format(fin_year, hdr))
-            return [], []
-
-        count_list = [] 
-        perc_list = [] 
-        for i in list(reader):
-            if len(i) == 0 or i[0].startswith('#'):
-                # ignore comments or blanks lines in csv file
-                continue
+    data = load_historical_causes().get(fin_year)
+    if data is None:
+        logger.error("Cannot find fin_year in CSV file: {}, {}".format(fin_year, settings.HISTORICAL_CAUSE_CSV_FILE))
+        return [], []
+
+    if col_type == 'total_count':
+        return dict(count_total=data['count_total']), dict(count_total=data['perc_total'])
+
+    count_list = [dict(cause_id=cause_id, count=count) for cause_id, count in data['count'].iteritems()]
+    perc_list = [dict(cause_id=cause_id, count=count) for cause_id, count in data['perc'].iteritems()]
+    return count_list, perc_list
+
+FINAL_REPORT_STATUSES = (Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED)
+AUTHORISED_REPORT_STATUSES = (Bushfire.STATUS_INITIAL_AUTHORISED, Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED)
+
+#The reports read the pre-aggregated reporting_summary table built at the end of calculate_report_tables.
+#A row of the 'fires' measure: the number of fires (including the merged fires, counted in the reporting year of their valid fire).
+#region_id, tenure_id and cause_id are the fires' own, the other columns are from the valid fire
+FireFact = namedtuple('FireFact', ['region_id', 'tenure_id', 'cause_id', 'reporting_year', 'report_status',
+    'valid_region_id', 'first_attack_id', 'small_fire', 'fires'])
+#A row of the 'area' measure: the area burnt of the (non merged) fires by area burnt region and tenure
+AreaBurntFact = namedtuple('AreaBurntFact', ['region_id', 'tenure_id', 'area', 'bushfire_region_id', 'cause_id',
+    'reporting_year', 'report_status', 'fires'])
+
 
-            if i[0] != 'Total' and col_type=='count':
-                cause = Cause.objects.filter(name=i[0])
-                if cause:
-                    cause_id = cause[0].id
+def aggregate(rows, key, value=None):
+    """
+    Group the fact rows by key(row) and return a dict of the number of rows (or the sum of value(row)) in each group.
+    Rows with a None key are ignored
+    """
+    result = {}
+    for row in rows:
+        k = key(row)
+        if k is None:
+            continue
+        result[k] = result.get(k, 0) + (1 if value is None else (value(row) or 0))
+    return result
+
+
+class ReportFacts(object):
+    """
+    The reporting_summary rows used by the reports, loaded once per reporting year.
+    BushfireReport shares one instance with all its sub reports, which pivot the facts in memory.
+    reporting_summary is rebuilt by calculate_report_tables, so the reports only read a few hundred pre-aggregated rows per year.
+
+    To Test:
+        from bfrs.reports import ReportFacts
+        facts = ReportFacts()
+        facts.load(range(2017, 2020))
+        len(facts.fires(2019)), len(facts.areas(2019))
+    """
+    summary_sql = """
+    SELECT measure, region_id, tenure_id, cause_id, reporting_year, report_status, valid_region_id, first_attack_id, small_fire, area_region_id, fires, area
+    FROM reporting_summary
+    WHERE reporting_year IN ({years})
+    """
+
+    tenure_fires_sql = """
+    SELECT DISTINCT bf.id, bf.name, bf.fire_number, bf.region_id
+    FROM reporting_bushfire bf JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id
+    WHERE bf.report_status IN {report_statuses} AND bf.reporting_year = %s AND bf.fire_not_found = false AND ab.tenure_id = %s AND ab.area >= %s
+    """
+
+    def __init__(self):
+        self._fires = {}
+        self._areas = {}
+        self._missing_final = {}
+        self._regions = None
+        self._tenures = None
+        self._causes = None
+
+    def load(self, years):
+        """ Load the facts of the reporting years not loaded yet, one query for all the years """
+        years = [y for y in years if y not in self._fires]
+        if not years:
+            return
+
+        for y in years:
+            self._fires[y] = []
+            self._areas[y] = []
+
+        with connection.cursor() as cursor:
+            if not reporting_tables.table_exists(cursor, "reporting_summary"):
+                raise Exception("The reporting tables have not been calculated, run 'manage.py calculate_report_tables'")
+            cursor.execute(self.summary_sql.format(years=",".join([str(y) for y in years])))
+            for measure, region_id, tenure_id, cause_id, reporting_year, report_status, valid_region_id, first_attack_id, small_fire, area_region_id, fires, area in cursor.fetchall():
+                if measure == 'fires':
+                    self._fires[reporting_year].append(FireFact(region_id, tenure_id, cause_id, reporting_year, report_status,
+                        valid_region_id, first_attack_id, small_fire, fires))
                 else:
-                    if not [j for j in MISSING_MAP if not j.has_key(i[0])]:
-                        MISSING_MAP.append( dict(name=i[0], error='Cause {0}, Missing from BFRS Enum list. Please Request OIM to add Cause={0}'.format(i[0])))
-                    continue
-                count_list.append( dict(cause_id=cause_id, count=int(i[idx])) )
-                perc_list.append( dict(cause_id=cause_id, count=int(i[idx+10])) )
-            if i[0] == 'Total' and col_type=='total_count':
-                return dict(count_total=int(i[idx])), dict(count_total=int(i[idx+10])) 
+                    self._areas[reporting_year].append(AreaBurntFact(area_region_id, tenure_id, area, region_id, cause_id,
+                        reporting_year, report_status, fires))
 
-        return count_list, perc_list
+        logger.info("ReportFacts: loaded the facts of the reporting years {}".format(years))
 
-    except ValueError, e:
-        logger.error("Cannot find fin_year in CSV header: {}, {}, {}".format(fin_year, hdr, e))
+    def fires(self, year, statuses=FINAL_REPORT_STATUSES):
+        """ The fires (including the merged fires) of the reporting year whose valid fire has one of the statuses """
+        self.load([year])
+        return [f for f in self._fires[year] if f.report_status in statuses]
 
-    except IndexError, e:
-        logger.error("Cannot find 2nd fin_year (percentage column) in CSV header: {}, {}, {}".format(fin_year, hdr, e))
+    def areas(self, year, statuses=FINAL_REPORT_STATUSES):
+        """ The area burnt rows of the fires of the reporting year with one of the statuses """
+        self.load([year])
+        return [a for a in self._areas[year] if a.report_status in statuses]
 
-    except IOError, e:
-        logger.error("Cannot Open CSV file: {}, {}".format(settings.HISTORICAL_CAUSE_CSV_FILE, e))
+    def tenure_fires(self, year, tenure_id, min_area=0, statuses=FINAL_REPORT_STATUSES):
+        """ The (id, name, fire_number, region_id) of the fires of the reporting year which burnt at least min_area ha of the tenure """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.tenure_fires_sql.format(report_statuses="({})".format(",".join([str(i) for i in statuses]))),
+                [year, tenure_id, min_area]
+            )
+            return cursor.fetchall()
 
-    except Exception, e:
-        logger.error("Error reading column from CSV file: {}, {}, {}".format(fin_year, settings.HISTORICAL_CAUSE_CSV_FILE, e))
+    def missing_final(self, year):
+        """ The number of fires of the reporting year still waiting for the final report """
+        if year not in self._missing_final:
+            self._missing_final[year] = Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=year).count()
+        return self._missing_final[year]
+
+    @property
+    def regions(self):
+        if self._regions is None:
+            self._regions = dict([(r.id, r) for r in Region.objects.all()])
+        return self._regions
 
-    return [], []
+    @property
+    def tenures(self):
+        if self._tenures is None:
+            self._tenures = dict([(t.id, t) for t in Tenure.objects.all()])
+        return self._tenures
+
+    @property
+    def causes(self):
+        if self._causes is None:
+            self._causes = list(Cause.objects.all().order_by('report_order'))
+        return self._causes
 
 
 class BushfireReport():
     def __init__(self, reporting_year=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
-        self.ministerial_auth = MinisterialReportAuth(self.reporting_year)
-        self.ministerial_268 = MinisterialReport268(self.reporting_year)
-        self.ministerial = MinisterialReport(self.ministerial_auth, self.ministerial_268,self.reporting_year)
-        self.quarterly = QuarterlyReport(self.reporting_year)
-        self.by_tenure = BushfireByTenureReport(self.reporting_year)
-        self.by_cause = BushfireByCauseReport(self.reporting_year)
-        self.region_by_tenure = BushfireByRegionByTenureReport(self.reporting_year)
-        self.indicator = BushfireIndicator(self.reporting_year)
-        self.by_cause_10YrAverage = Bushfire10YrAverageReport(self.reporting_year)
-
-    def write_excel(self):
-        rpt_date = datetime.now()
-        book = Workbook()
+        #load the facts of all the years used by the sub reports (10 years for the 10yr average report) once
+        self.facts = ReportFacts()
+        self.facts.load(range(self.reporting_year - 9, self.reporting_year + 1))
+        self.ministerial_auth = MinisterialReportAuth(self.reporting_year, facts=self.facts)
+        self.ministerial_268 = MinisterialReport268(self.reporting_year, facts=self.facts)
+        self.ministerial = MinisterialReport(self.ministerial_auth, self.ministerial_268,self.reporting_year, facts=self.facts)
+        self.quarterly = QuarterlyReport(self.reporting_year, facts=self.facts)
+        self.by_tenure = BushfireByTenureReport(self.reporting_year, facts=self.facts)
+        self.by_cause = BushfireByCauseReport(self.reporting_year, facts=self.facts)
+        self.region_by_tenure = BushfireByRegionByTenureReport(self.reporting_year, facts=self.facts)
+        self.indicator = BushfireIndicator(self.reporting_year, facts=self.facts)
+        self.by_cause_10YrAverage = Bushfire10YrAverageReport(self.reporting_year, facts=self.facts)
+
+    def get_workbook(self, rpt_date):
+        book = new_workbook()
         self.ministerial.get_excel_sheet(rpt_date, book)
         self.ministerial_auth.get_excel_sheet(rpt_date, book)
         self.ministerial_268.get_excel_sheet(rpt_date, book)
@@ -171,42 +346,78 @@ class BushfireReport():
         self.region_by_tenure.get_excel_sheet(rpt_date, book)
         self.indicator.get_excel_sheet(rpt_date, book)
         self.by_cause_10YrAverage.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        return book
+
+    def write_excel(self):
+        rpt_date = datetime.now()
+        book = self.get_workbook(rpt_date)
+        filename = '/tmp/bushfire_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'bushfire_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
-        response['Content-Disposition'] = 'attachment; filename=' + filename
-
-        book = Workbook()
-        self.ministerial.get_excel_sheet(rpt_date, book)
-        self.ministerial_auth.get_excel_sheet(rpt_date, book)
-        self.ministerial_268.get_excel_sheet(rpt_date, book)
-        self.quarterly.get_excel_sheet(rpt_date, book)
-        self.by_tenure.get_excel_sheet(rpt_date, book)
-        self.by_cause.get_excel_sheet(rpt_date, book)
-        self.region_by_tenure.get_excel_sheet(rpt_date, book)
-        self.indicator.get_excel_sheet(rpt_date, book)
-        self.by_cause_10YrAverage.get_excel_sheet(rpt_date, book)
+        return BushfireReport.workbook_response(self.get_workbook_data(rpt_date), rpt_date)
 
+    def get_workbook_data(self, rpt_date):
+        """ Returns the content of the Excel WB """
+        book = self.get_workbook(rpt_date)
         book.add_sheet('Sheet 1')
-        book.save(response)
-
+        output = StringIO()
+        book.save(output)
+        return output.getvalue()
+
+    @staticmethod
+    def workbook_filename(rpt_date):
+        return 'bushfire_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+
+    @staticmethod
+    def workbook_response(data, rpt_date):
+        response = HttpResponse(data, content_type=excel_content_type())
+        response['Content-Disposition'] = 'attachment; filename=' + BushfireReport.workbook_filename(rpt_date)
         return response
 
+    @staticmethod
+    def get_cached_workbook(reporting_year=None, generate=True):
+        """
+        Returns (report date, content) of the Excel WB of the reporting year.
+        The workbook is cached per build of the reporting tables; the 268b and 'Missing Final' figures are live data,
+        so the cached workbook also expires after settings.REPORT_LIVE_DATA_CACHE_TIMEOUT seconds.
+        Returns None if the workbook is not cached and generate is False
+        """
+        reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        build_id = reporting_tables.get_build_id()
+        name = "bushfire_report_{}.{}".format(reporting_year, excel_extension())
+
+        cached = reporting_tables.get_cached_report(name, build_id)
+        if cached:
+            logger.info("Bushfire report({}) of build {} is cached".format(reporting_year, build_id))
+            return cached
+        elif not generate:
+            return None
+
+        rpt_date = datetime.now()
+        data = BushfireReport(reporting_year).get_workbook_data(rpt_date)
+        reporting_tables.cache_report(name, build_id, (rpt_date, data), settings.REPORT_LIVE_DATA_CACHE_TIMEOUT)
+        return (rpt_date, data)
+
+    @staticmethod
+    def cached_export(reporting_year=None):
+        """ Returns the cached Excel WB of the reporting year as a HTTP Response object """
+        rpt_date, data = BushfireReport.get_cached_workbook(reporting_year)
+        return BushfireReport.workbook_response(data, rpt_date)
+
 
 class MinisterialReport():
     """
     Report for Combined (Authorised and active 268b) fires. This is the sum of MinisterialAuth and Ministerial268b.
     """
-    def __init__(self, ministerial_auth=None, ministerial_268=None, reporting_year=None):
+    def __init__(self, ministerial_auth=None, ministerial_268=None, reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
-        self.ministerial_auth = ministerial_auth if ministerial_auth else MinisterialReportAuth(self.reporting_year)
-        self.ministerial_268 = ministerial_268 if ministerial_268 else MinisterialReport268(self.reporting_year)
+        self.facts = facts or ReportFacts()
+        self.ministerial_auth = ministerial_auth if ministerial_auth else MinisterialReportAuth(self.reporting_year, facts=self.facts)
+        self.ministerial_268 = ministerial_268 if ministerial_268 else MinisterialReport268(self.reporting_year, facts=self.facts)
         self.rpt_map, self.item_map = self.create()
 
     def create(self):
@@ -313,8 +524,9 @@ class MinisterialReport():
                 ])
         return response
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
-        # book = Workbook()
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
         sheet1 = book.add_sheet('Ministerial Report')
         sheet1 = book.get_sheet('Ministerial Report')
 
@@ -335,7 +547,7 @@ class MinisterialReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style_bold_gen)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -382,20 +594,20 @@ class MinisterialReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/ministerial_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/ministerial_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'ministerial_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'ministerial_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -410,35 +622,49 @@ class MinisterialReport():
                 print '{}\t{}\t{}\t{}\t{}'.format(region, data['pw_tenure'], data['area_pw_tenure'], data['total_all_tenure'], data['total_area']).expandtabs(20)
 
     def pdflatex(self, request, form_data):
+        embed = False if request.GET.get("embed") == "false" else True
+        downloadname, data = self.get_pdf(
+            form_data,
+            request.user.get_full_name(),
+            request.build_absolute_uri("/")[:-1],
+            embed=embed,
+            headers=request.GET.get("headers", True),
+            title=request.GET.get("title", "Bushfire Reporting System"),
+            request=request
+        )
+
+        response = HttpResponse(data, content_type='application/pdf')
+        disposition = "attachment"
+        #disposition = "inline"
+        response['Content-Disposition'] = (
+            '{0}; filename="{1}"'.format(
+                disposition, downloadname))
+        logger.debug("Finally: returning PDF response.")
+        return response
 
+    def get_pdf(self, form_data, user, baseurl, embed=True, headers=True, title="Bushfire Reporting System", request=None):
+        """
+        Generates the ministerial report pdf with latex; returns (download name, pdf content).
+        Doesn't need a request, so it can be run by a report job worker
+        """
         now = timezone.localtime(timezone.now())
         #report_date = now.strptime(request.GET.get('date'), '%Y-%m-%d').date()
         report_date = now
 
         #template = request.GET.get("template", "pfp")
         template = "ministerial_report"
-        response = HttpResponse(content_type='application/pdf')
-        filename = template + ".pdf"
-        timestamp = now.isoformat().rsplit(
-            ".")[0].replace(":", "")
         if template == "ministerial_report":
             downloadname = "ministerial_report_" + report_date.strftime('%Y-%m-%d') + ".pdf"
         else:
             downloadname = "ministerial_report_" + template + "_" + report_date.strftime('%Y-%m-%d') + ".pdf"
-        error_response = HttpResponse(content_type='text/html')
-        errortxt = downloadname.replace(".pdf", ".errors.txt.html")
-        error_response['Content-Disposition'] = (
-            '{0}; filename="{1}"'.format(
-            "inline", errortxt))
 
         subtitles = {
             "ministerial_report": "Ministerial Report",
             #"form268a": "268a - Planned Burns",
         }
-        embed = False if request.GET.get("embed") == "false" else True
 
         context = {
-            'user': request.user.get_full_name(),
+            'user': user,
             'report_date': report_date.strftime('%e %B %Y').strip(),
             'time': report_date.strftime('%H:%M'),
             'current_finyear': self.reporting_year,
@@ -446,27 +672,20 @@ class MinisterialReport():
             'item_map': self.item_map,
             'form': form_data,
             'embed': embed,
-            'headers': request.GET.get("headers", True),
-            'title': request.GET.get("title", "Bushfire Reporting System"),
+            'headers': headers,
+            'title': title,
             'subtitle': subtitles.get(template, ""),
             'timestamp': now,
             'downloadname': downloadname,
             'settings': settings,
-            'baseurl': request.build_absolute_uri("/")[:-1]
+            'baseurl': baseurl
         }
-        disposition = "attachment"
-        #disposition = "inline"
-        response['Content-Disposition'] = (
-            '{0}; filename="{1}"'.format(
-                disposition, downloadname))
 
         folder = None
         try:
             folder,pdf_file = generate_pdf("latex/{}.tex".format(template),context=context,request=request,check_output=False)
             with open(pdf_file) as f:
-                response.write(f.read())
-            logger.debug("Finally: returning PDF response.")
-            return response
+                return (downloadname, f.read())
         finally:
             if folder:
                 shutil.rmtree(folder)
@@ -476,27 +695,38 @@ class MinisterialReport268():
     """
     Report for active 268b bushfires only
     """
-    def __init__(self,reporting_year=None):
+    def __init__(self,reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.rpt_map, self.item_map = self.create()
 
-    def get_268_data(self, dbca_initial_control=None):
-        """ Retrieves the 268b fires from PBS and Aggregates the Area and Number count by region """
-        qs_regions = get_sorted_regions()
-
-        if dbca_initial_control:
-            # get the fires managed by DBCA
-            outstanding_fires = list(Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_INITIAL_AUTHORISED], initial_control=Agency.DBCA,reporting_year__lte=self.reporting_year).values_list('fire_number', flat=True))
-        else:
-            outstanding_fires = list(Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_INITIAL_AUTHORISED],reporting_year__lte=self.reporting_year).values_list('fire_number', flat=True))
-
-        pbs_fires_dict = get_pbs_bushfires(outstanding_fires) or []
+    def get_268_data(self):
+        """
+        Retrieves the 268b fires from PBS and Aggregates the Area and Number count by region,
+        for all the outstanding fires and for the fires managed by DBCA.
+        The fires are requested from PBS once, the fires managed by DBCA are filtered locally
+        """
+        outstanding = Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_INITIAL_AUTHORISED],reporting_year__lte=self.reporting_year)
+        outstanding_fires = []
+        dbca_fires = set()
+        for fire_number, initial_control_id in outstanding.values_list('fire_number', 'initial_control_id'):
+            outstanding_fires.append(fire_number)
+            if initial_control_id == Agency.DBCA.id:
+                dbca_fires.add(fire_number)
+
+        self.pbs_fires_dict = get_pbs_bushfires(outstanding_fires) or []
+        #logger.info("self.pbs_fires_dict: " + str(self.pbs_fires_dict))
+        self.found_fires = [i['fire_id'] for i in self.pbs_fires_dict]
+        self.missing_fires = list(set(outstanding_fires).difference(self.found_fires)) # fire_numbers not returned from PB
+
+        return (
+            self.aggregate_268_data(self.pbs_fires_dict),
+            self.aggregate_268_data([i for i in self.pbs_fires_dict if i['fire_id'] in dbca_fires])
+        )
 
-        if not dbca_initial_control:
-            self.pbs_fires_dict = pbs_fires_dict
-            #logger.info("self.pbs_fires_dict: " + str(self.pbs_fires_dict))
-            self.found_fires = [i['fire_id'] for i in self.pbs_fires_dict]
-            self.missing_fires = list(set(outstanding_fires).difference(self.found_fires)) # fire_numbers not returned from PB
+    def aggregate_268_data(self, pbs_fires_dict):
+        """ Aggregates the Area and Number count of the PBS fires by region """
+        qs_regions = get_sorted_regions()
 
         rpt_map = {}
         for i in pbs_fires_dict:                                                                       
@@ -522,8 +752,7 @@ class MinisterialReport268():
     def create(self):
         # Group By Region
 
-        data_268 = self.get_268_data()
-        data_268_pw = self.get_268_data('DBCA')
+        data_268, data_268_pw = self.get_268_data()
 
         rpt_map = []
         item_map = {}
@@ -617,9 +846,10 @@ class MinisterialReport268():
                 
         return rpt_map, item_map
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
 
-        # book = Workbook()
         sheet1 = book.add_sheet('Ministerial Report (268)')
         sheet1 = book.get_sheet('Ministerial Report (268)')
 
@@ -640,7 +870,7 @@ class MinisterialReport268():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style_bold_gen)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -703,20 +933,20 @@ class MinisterialReport268():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/ministerial_268_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/ministerial_268_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'ministerial_268_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'ministerial_268_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -729,8 +959,9 @@ class MinisterialReportAuth():
     """
     Report for Authorised fires Only
     """
-    def __init__(self, reporting_year=None, overlap_ids=[]):
+    def __init__(self, reporting_year=None, overlap_ids=[], facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.overlap_ids = overlap_ids
         self.rpt_map, self.item_map, self.excluded_bf_info = self.create()
 
@@ -745,62 +976,15 @@ class MinisterialReportAuth():
         excluded_bfs_region_info = {}
         excluded_bfs_tenure_info = {}
 
-        count_sql = """
-        SELECT r.region_id,count(*)
-        FROM 
-            ((SELECT a.region_id,a.id
-            FROM reporting_bushfire a JOIN bfrs_tenure t ON a.tenure_id = t.id
-            WHERE a.report_status IN {report_statuses} AND a.reporting_year={reporting_year} AND a.fire_not_found=false {{agency_condition}}
-            )
-            UNION
-            (SELECT b.region_id,b.id
-            FROM reporting_bushfire b JOIN reporting_bushfire c ON b.valid_bushfire_id = c.id AND c.report_status IN {report_statuses} AND c.reporting_year={reporting_year} AND c.fire_not_found=false JOIN bfrs_tenure t ON b.tenure_id = t.id 
-            WHERE b.report_status = {status_merged}  {{agency_condition}}
-            )) as r
-        group by r.region_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_INITIAL_AUTHORISED, Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            reporting_year = self.reporting_year,
-            status_merged = Bushfire.STATUS_MERGED
-        )
-
-        area_sql = """
-        SELECT bf.region_id, SUM(ab.area) AS total_all_regions_area, SUM(bf.area) AS total_area
-        FROM reporting_bushfire bf JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id JOIN bfrs_tenure t ON ab.tenure_id = t.id
-        WHERE bf.report_status IN {report_statuses} AND bf.reporting_year={reporting_year} AND bf.fire_not_found=false AND t.report_group='ALL REGIONS'  {{agency_condition}} 
-        GROUP BY bf.region_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_INITIAL_AUTHORISED, Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED]])),
-            reporting_year = self.reporting_year
-        )
-
-        dbca_count_data = {}
-        total_count_data = {}
+        tenures = self.facts.tenures
+        fires = [f for f in self.facts.fires(self.reporting_year, AUTHORISED_REPORT_STATUSES) if f.tenure_id in tenures]
+        areas = [a for a in self.facts.areas(self.reporting_year, AUTHORISED_REPORT_STATUSES) if a.tenure_id in tenures and tenures[a.tenure_id].report_group == 'ALL REGIONS']
 
-        dbca_area_data = {}
-        total_area_data = {}
+        dbca_count_data = aggregate([f for f in fires if tenures[f.tenure_id].dbca_interest], key=lambda f: f.region_id, value=lambda f: f.fires)
+        total_count_data = aggregate(fires, key=lambda f: f.region_id, value=lambda f: f.fires)
 
-        with connection.cursor() as cursor:
-            sql = count_sql.format(agency_condition = "AND t.dbca_interest IS TRUE")
-            cursor.execute(sql)
-            for result in cursor.fetchall():
-                dbca_count_data[result[0]] = result[1] or 0
-
-            sql = count_sql.format(agency_condition = "")
-            cursor.execute(sql)
-            for result in cursor.fetchall():
-                total_count_data[result[0]] = result[1] or 0
-
-            sql = area_sql.format(agency_condition = "AND t.dbca_interest IS TRUE")
-            cursor.execute(sql)
-            for result in cursor.fetchall():
-                dbca_area_data[result[0]] = result[1] or 0
-
-            sql = area_sql.format(agency_condition = "")
-            logger.info("sql: " + sql)
-            cursor.execute(sql)
-            for result in cursor.fetchall():
-                total_area_data[result[0]] = result[1] or 0
+        dbca_area_data = aggregate([a for a in areas if tenures[a.tenure_id].dbca_interest], key=lambda a: a.bushfire_region_id, value=lambda a: a.area)
+        total_area_data = aggregate(areas, key=lambda a: a.bushfire_region_id, value=lambda a: a.area)
         logger.info("total_area_data: " + str(total_area_data))
         for region in get_sorted_regions(True):
             pw_tenure      = dbca_count_data.get(region.id, 0)
@@ -898,9 +1082,10 @@ class MinisterialReportAuth():
                 ])
         return response
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
 
-        # book = Workbook()
         sheet1 = book.add_sheet('Ministerial Report (Auth)')
         sheet1 = book.get_sheet('Ministerial Report (Auth)')
 
@@ -921,7 +1106,7 @@ class MinisterialReportAuth():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style_bold_gen)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -962,20 +1147,20 @@ class MinisterialReportAuth():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/ministerial_auth_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/ministerial_auth_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'ministerial_auth_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'ministerial_auth_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -1049,8 +1234,9 @@ class MinisterialReportAuth():
 
 
 class QuarterlyReport():
-    def __init__(self, reporting_year=None, overlap_ids=[]):
+    def __init__(self, reporting_year=None, overlap_ids=[], facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.overlap_ids = overlap_ids
         self.rpt_map, self.item_map = self.create()
         #logger.info("overlap_ids: " + str(overlap_ids))
@@ -1065,130 +1251,36 @@ class QuarterlyReport():
         rpt_map = []
         item_map = {}
 
-        count_sql = """
-        SELECT COUNT(*)
-        FROM 
-          ((SELECT bf1.region_id, bf1.id
-          FROM reporting_bushfire bf1 JOIN bfrs_region r ON bf1.region_id = r.id AND r.forest_region = {{forest_region}} JOIN bfrs_tenure t ON bf1.tenure_id = t.id
-          WHERE bf1.report_status IN {report_statuses} AND bf1.reporting_year = {reporting_year} AND bf1.fire_not_found=False {{agency_condition}}
-          )
-          UNION
-          (SELECT bf2.region_id, bf2.id
-          FROM reporting_bushfire bf2 
-              JOIN bfrs_region r2 ON bf2.region_id = r2.id AND r2.forest_region = {{forest_region}}
-              JOIN reporting_bushfire bf3 ON bf2.valid_bushfire_id = bf3.id AND bf3.report_status IN {report_statuses} AND bf3.reporting_year = {reporting_year} AND bf3.fire_not_found=false 
-              JOIN bfrs_tenure t ON bf2.tenure_id = t.id
-          WHERE bf2.report_status = {status_merged} {{agency_condition}}
-          )) AS x
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            reporting_year = self.reporting_year,
-            status_merged = Bushfire.STATUS_MERGED
-        )
-
-        area_sql = """
-        SELECT SUM(ab.area) AS total_all_regions_area, SUM(bf.area) AS total_area 
-        FROM reporting_bushfire bf JOIN bfrs_region r ON bf.region_id = r.id JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id JOIN bfrs_tenure t ON ab.tenure_id = t.id
-        WHERE bf.report_status IN {report_statuses} AND bf.reporting_year = {reporting_year} AND bf.fire_not_found=False AND r.forest_region = {{forest_region}} {{agency_condition}} AND t.report_group = 'ALL REGIONS'
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            reporting_year = self.reporting_year
+        #count and area burnt of the fires grouped by (forest region, dbca interest)
+        regions = self.facts.regions
+        tenures = self.facts.tenures
+        def forest_key(region_id, tenure_id):
+            if region_id not in regions or tenure_id not in tenures or regions[region_id].forest_region is None:
+                return None
+            return (regions[region_id].forest_region, bool(tenures[tenure_id].dbca_interest))
+
+        count_data = aggregate(self.facts.fires(self.reporting_year), key=lambda f: forest_key(f.region_id, f.tenure_id), value=lambda f: f.fires)
+        area_data = aggregate(
+            [a for a in self.facts.areas(self.reporting_year) if a.tenure_id in tenures and tenures[a.tenure_id].report_group == 'ALL REGIONS'],
+            key=lambda a: forest_key(a.bushfire_region_id, a.tenure_id),
+            value=lambda a: a.area
         )
+        logger.info("Quarterly: aggregation complete")
 
-        with connection.cursor() as cursor:
-            cursor.execute(count_sql.format(
-                forest_region = 'true',
-                agency_condition =  "AND t.dbca_interest IS TRUE"
-            ))
-            result = cursor.fetchone()
-            forest_pw_tenure = result[0] or 0
-            logger.info("Quarterly: forest region + DBCA interest count complete")
-
-            cursor.execute(area_sql.format(
-                forest_region = 'true',
-                agency_condition = "AND t.dbca_interest IS TRUE"
-            ))
-            result = cursor.fetchone()
-            forest_area_pw_tenure = result[0] or 0
-            logger.info("Quarterly: forest region + DBCA interest area complete")
-
-            cursor.execute(count_sql.format(
-                forest_region = 'true',
-                agency_condition = "AND t.dbca_interest IS NOT TRUE"
-            ))
-            result = cursor.fetchone()
-            forest_non_pw_tenure = result[0] or 0
-            logger.info("Quarterly: forest region + Non DBCA interest count complete")
-
-            cursor.execute(area_sql.format(
-                forest_region = 'true',
-                agency_condition = "AND t.dbca_interest IS NOT TRUE"
-            ))
-            result = cursor.fetchone()
-            forest_area_non_pw_tenure = result[0] or 0
-            logger.info("Quarterly: forest region + Non DBCA interest area complete")
-
-            forest_tenure_total = forest_pw_tenure + forest_non_pw_tenure 
-            forest_area_total = forest_area_pw_tenure + forest_area_non_pw_tenure
-
-            rpt_map.append(
-                {'Forest Regions': dict(
-                    pw_tenure=forest_pw_tenure, area_pw_tenure=forest_area_pw_tenure, 
-                    non_pw_tenure=forest_non_pw_tenure, area_non_pw_tenure=forest_area_non_pw_tenure, 
-                    total_all_tenure=forest_tenure_total, total_area=forest_area_total
-                )}
+        total = dict(pw_tenure=0, area_pw_tenure=0, non_pw_tenure=0, area_non_pw_tenure=0, total_all_tenure=0, total_area=0)
+        for name, forest_region in (('Forest Regions', True), ('Non Forest Regions', False)):
+            row = dict(
+                pw_tenure=count_data.get((forest_region, True), 0), area_pw_tenure=area_data.get((forest_region, True), 0),
+                non_pw_tenure=count_data.get((forest_region, False), 0), area_non_pw_tenure=area_data.get((forest_region, False), 0)
             )
+            row['total_all_tenure'] = row['pw_tenure'] + row['non_pw_tenure']
+            row['total_area'] = row['area_pw_tenure'] + row['area_non_pw_tenure']
+            for key, value in row.iteritems():
+                total[key] += value
 
-            cursor.execute(count_sql.format(
-                forest_region = 'false',
-                agency_condition = "AND t.dbca_interest IS TRUE"
-            ))
-            result = cursor.fetchone()
-            nonforest_pw_tenure = result[0] or 0
-            logger.info("Quarterly: Non forest region + DBCA interest count complete")
-
-            cursor.execute(area_sql.format(
-                forest_region = 'false',
-                agency_condition = "AND t.dbca_interest IS TRUE"
-            ))
-            result = cursor.fetchone()
-            nonforest_area_pw_tenure = result[0] or 0
-            logger.info("Quarterly: Non forest region + DBCA interest area complete")
-
-            cursor.execute(count_sql.format(
-                forest_region = 'false',
-                agency_condition = "AND t.dbca_interest IS NOT TRUE"
-            ))
-            result = cursor.fetchone()
-            nonforest_non_pw_tenure = result[0] or 0
-            logger.info("Quarterly: Non forest region + non DBCA interest count complete")
-
-            cursor.execute(area_sql.format(
-                forest_region = 'false',
-                agency_condition = "AND t.dbca_interest IS NOT TRUE"
-            ))
-            result = cursor.fetchone()
-            nonforest_area_non_pw_tenure = result[0] or 0
-            logger.info("Quarterly: Non forest region + Non DBCA interest area complete")
-
-            nonforest_tenure_total = nonforest_pw_tenure + nonforest_non_pw_tenure 
-            nonforest_area_total = nonforest_area_pw_tenure + nonforest_area_non_pw_tenure
+            rpt_map.append({name: row})
 
-            rpt_map.append(
-                {'Non Forest Regions': dict(
-                    pw_tenure=nonforest_pw_tenure, area_pw_tenure=nonforest_area_pw_tenure, 
-                    non_pw_tenure=nonforest_non_pw_tenure, area_non_pw_tenure=nonforest_area_non_pw_tenure, 
-                    total_all_tenure=nonforest_tenure_total, total_area=nonforest_area_total
-                )}
-            )
-
-        rpt_map.append(
-            {'TOTAL': dict(
-                pw_tenure=forest_pw_tenure + nonforest_pw_tenure, area_pw_tenure=forest_area_pw_tenure + nonforest_area_pw_tenure, 
-                non_pw_tenure=forest_non_pw_tenure + nonforest_non_pw_tenure, area_non_pw_tenure=forest_area_non_pw_tenure + nonforest_area_non_pw_tenure, 
-                total_all_tenure=forest_tenure_total + nonforest_tenure_total, total_area=forest_area_total + nonforest_area_total
-            )}
-        )
+        rpt_map.append({'TOTAL': total})
 
         logger.info("Quarterly: create complete")        
         return rpt_map, item_map
@@ -1198,9 +1290,10 @@ class QuarterlyReport():
         #return Bushfire.objects.filter(authorised_by__isnull=False, reporting_year=self.reporting_year, cause__name__icontains='escape').exclude(report_status=Bushfire.STATUS_INVALIDATED)
         return Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED], reporting_year=self.reporting_year,fire_not_found=False, cause__name__icontains='escape')
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
 
-        # book = Workbook()
         sheet1 = book.add_sheet('Quarterly Report')
         sheet1 = book.get_sheet('Quarterly Report')
 
@@ -1221,7 +1314,7 @@ class QuarterlyReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style_bold_gen)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -1287,20 +1380,20 @@ class QuarterlyReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/quarterly_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/quarterly_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'quarterly_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'quarterly_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -1319,131 +1412,74 @@ class QuarterlyReport():
 
 
 class BushfireByTenureReport():
-    def __init__(self,reporting_year=None):
+    def __init__(self,reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.rpt_map, self.item_map, self.other_report_group_fires_info = self.create()
         logger.info("Starting BushfireByTenureReport")
 
     def create(self):
         # Group By Region
         #qs = Bushfire.objects.filter(report_status__gte=Bushfire.STATUS_FINAL_AUTHORISED)
-        report_group_sql = """
-        SELECT DISTINCT report_group, report_group_order FROM bfrs_tenure WHERE report_group_order > 0 ORDER BY report_group_order
-        """
-        report_name_sql = """
-        SELECT DISTINCT report_name, report_order FROM bfrs_tenure WHERE report_group = '{report_group}' ORDER BY report_order
-        """
-        count_sql = """
-        SELECT b.report_name, count(*) 
-        FROM (
-            (SELECT 
-                a1.tenure_id,
-                a1.fire_number
-            FROM reporting_bushfire a1
-            WHERE a1.report_status IN {report_statuses} AND a1.reporting_year = {{year}} AND a1.fire_not_found = false
-            )
-            UNION
-            (SELECT 
-                b1.tenure_id,
-                b1.fire_number
-            FROM reporting_bushfire b1 
-                JOIN reporting_bushfire b2 ON b1.valid_bushfire_id = b2.id AND b2.report_status IN {report_statuses} AND b2.reporting_year = {{year}} AND b2.fire_not_found = false
-            WHERE b1.report_status = {status_merged}
-            )
-         ) a JOIN bfrs_tenure b ON a.tenure_id = b.id
-        WHERE b.report_group='{{report_group}}'
-        GROUP BY b.report_name,b.report_order
-        ORDER BY b.report_order
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED]])),
-            status_merged = Bushfire.STATUS_MERGED
-        )
-
-        area_sql = """
-        SELECT t.report_name, SUM(ab.area) AS area 
-        FROM reporting_bushfire bf JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id JOIN bfrs_tenure t ON ab.tenure_id = t.id
-        WHERE bf.report_status IN {report_statuses} AND bf.reporting_year = {{year}} AND bf.fire_not_found = false AND t.report_group = '{{report_group}}'
-        GROUP BY t.report_name, t.report_order
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]]))
-        )
-        
-        other_report_group_sql = """
-        SELECT bf.id, bf.name, bf.fire_number, r.name
-        FROM reporting_bushfire bf JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id JOIN bfrs_region r ON bf.region_id = r.id
-        WHERE ab.tenure_id = 20 AND bf.report_status in {report_statuses} AND bf.reporting_year = {year} AND bf.fire_not_found = false AND ab.area >= 1;
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            year = self.reporting_year
-        )
+        tenures = self.facts.tenures
+        report_groups = sorted(set([(t.report_group_order, t.report_group) for t in tenures.values() if t.report_group_order > 0]))
+        years = (self.reporting_year - 2, self.reporting_year - 1, self.reporting_year)
+
+        #count and area burnt of each year grouped by (report group, report name)
+        tenure_key = lambda tenure_id: (tenures[tenure_id].report_group, tenures[tenure_id].report_name) if tenure_id in tenures else None
+        counts = []
+        areas = []
+        for y in years:
+            counts.append(aggregate(self.facts.fires(y), key=lambda f: tenure_key(f.tenure_id), value=lambda f: f.fires))
+            areas.append(aggregate(self.facts.areas(y), key=lambda a: tenure_key(a.tenure_id), value=lambda a: a.area))
 
         rpt_map = []
-        
-        report_groups = []
-        with connection.cursor() as cursor:
-            cursor.execute(report_group_sql)
-            for result in cursor.fetchall():
-                report_groups.append(result[0])
-
-            for report_group in report_groups:
-                counts = []
-                areas = []
-                rpt_group_map = []
-                rpt_map.append((report_group, rpt_group_map))
-                for y in (self.reporting_year - 2, self.reporting_year - 1, self.reporting_year):
-                    year_counts = {"total":0}
-                    counts.append(year_counts)
-                    cursor.execute(count_sql.format(year=y, report_group=report_group))
-                    for result in cursor.fetchall():
-                        year_counts[result[0]] = result[1] or 0
-                        year_counts["total"] += result[1] or 0
-
-                    year_areas = {"total":0}
-                    areas.append(year_areas)
-                    cursor.execute(area_sql.format(year=y, report_group=report_group))
-                    for result in cursor.fetchall():
-                        year_areas[result[0]] = result[1] or 0
-                        year_areas["total"] += result[1] or 0
-
-                cursor.execute(report_name_sql.format(report_group=report_group))
-                for result in cursor.fetchall():
-                    report_name = result[0]
-                    rpt_group_map.append(
-                        {report_name: dict(
-                            count2=counts[0].get(report_name,0), 
-                            count1=counts[1].get(report_name,0), 
-                            count0=counts[2].get(report_name,0), 
-                            area2=areas[0].get(report_name,0), 
-                            area1=areas[1].get(report_name,0), 
-                            area0=areas[2].get(report_name,0)
-                        )}
-                    )
-                
+        for report_group_order, report_group in report_groups:
+            rpt_group_map = []
+            rpt_map.append((report_group, rpt_group_map))
+
+            report_names = sorted(set([(t.report_order, t.report_name) for t in tenures.values() if t.report_group == report_group]))
+            for report_order, report_name in report_names:
+                key = (report_group, report_name)
                 rpt_group_map.append(
-                    {'Total': dict(
-                        count2=counts[0].get("total",0), 
-                        count1=counts[1].get("total",0), 
-                        count0=counts[2].get("total",0), 
-                        area2=areas[0].get("total",0), 
-                        area1=areas[1].get("total",0), 
-                        area0=areas[2].get("total",0)
+                    {report_name: dict(
+                        count2=counts[0].get(key,0), 
+                        count1=counts[1].get(key,0), 
+                        count0=counts[2].get(key,0), 
+                        area2=areas[0].get(key,0), 
+                        area1=areas[1].get(key,0), 
+                        area0=areas[2].get(key,0)
                     )}
                 )
-                
-                # 'Other' report group polys >= 1 ha
-                other_report_group_fires_info = {}
-                cursor.execute(other_report_group_sql)
-                for result in cursor.fetchall():
-                    other_report_group_fires_info[result[0]] = (result[1], result[2], result[3])
-                
+
+            total = lambda data: sum([v for k, v in data.iteritems() if k[0] == report_group])
+            rpt_group_map.append(
+                {'Total': dict(
+                    count2=total(counts[0]), 
+                    count1=total(counts[1]), 
+                    count0=total(counts[2]), 
+                    area2=total(areas[0]), 
+                    area1=total(areas[1]), 
+                    area0=total(areas[2])
+                )}
+            )
+
+        # 'Other' report group polys >= 1 ha
+        other_report_group_fires_info = {}
+        regions = self.facts.regions
+        for fire_id, name, fire_number, region_id in self.facts.tenure_fires(self.reporting_year, 20, min_area=1):
+            if region_id in regions:
+                other_report_group_fires_info[fire_id] = (name, fire_number, regions[region_id].name)
+
         logger.info("BushfireByTenureReport create complete")
         return rpt_map, None, other_report_group_fires_info
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
         year0 = str(self.reporting_year) + '/' + str(self.reporting_year+1)
         year1 = str(self.reporting_year-1) + '/' + str(self.reporting_year)
         year2 = str(self.reporting_year-2) + '/' + str(self.reporting_year-1)
-        # book = Workbook()
         sheet1 = book.add_sheet('Bushfire By Tenure Report')
         sheet1 = book.get_sheet('Bushfire By Tenure Report')
 
@@ -1477,7 +1513,7 @@ class BushfireByTenureReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style_bold_gen)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         for report_group, rpt_group_map in self.rpt_map:
             hdr = sheet1.row(row_no())
@@ -1551,20 +1587,20 @@ class BushfireByTenureReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_by_tenure_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/bushfire_by_tenure_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'bushfire_by_tenure_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'bushfire_by_tenure_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -1586,8 +1622,9 @@ class BushfireByTenureReport():
 
 
 class BushfireByCauseReport():
-    def __init__(self,reporting_year=None):
+    def __init__(self,reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.rpt_map, self.item_map = self.create()
         logger.info("Starting BushfireByCauseReport")
 
@@ -1595,60 +1632,25 @@ class BushfireByCauseReport():
         rpt_map = []
         item_map = {}
 
-        count_sql = """
-        SELECT a.cause_id, COUNT(*)
-        FROM ( 
-            (SELECT COALESCE(a1.cause_id, 9) AS cause_id, a1.id
-            FROM reporting_bushfire a1
-            WHERE a1.report_status IN {report_statuses} AND a1.reporting_year = {{reporting_year}} AND a1.fire_not_found = false
-            )
-            UNION
-            (SELECT COALESCE(b1.cause_id, 9) AS cause_id, b1.id
-            FROM reporting_bushfire b1
-                JOIN reporting_bushfire b2 ON b1.valid_bushfire_id = b2.id AND b2.report_status IN {report_statuses} AND b2.reporting_year = {{reporting_year}} AND b2.fire_not_found = false
-            WHERE b1.report_status = {status_merged}
-            )
-          ) AS a
-        GROUP BY cause_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            status_merged = Bushfire.STATUS_MERGED
-        )
-
-        area_sql = """
-        SELECT COALESCE(a.cause_id,  9) AS cause_id, SUM(b.area) AS total_all_regions_area, SUM(a.area) AS total_area
-        FROM reporting_bushfire a JOIN reporting_areaburnt b ON a.id = b.bushfire_id JOIN bfrs_tenure c ON b.tenure_id = c.id
-        WHERE a.report_status IN {report_statuses} AND a.reporting_year = {{reporting_year}} AND a.fire_not_found = false AND c.report_group = 'ALL REGIONS'
-        GROUP BY cause_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]]))
-        )
-
         year_count_list = []
         year_total_count_list = []
         
-        all_causes =  Cause.objects.all().order_by('report_order')
-
-        with connection.cursor() as cursor:
-            for year in range(self.reporting_year,self.reporting_year - 3,-1):
-                year_count_data = {}
-                year_count_list.append(year_count_data)
-                year_total_count = 0
-                if year >= 2017:
-                    cursor.execute(count_sql.format(reporting_year=year))
-                    for result in cursor.fetchall():
-                        year_count_data[result[0]] = result[1] or 0
-                        year_total_count += result[1] or 0
-                else:
-                    data = read_col(year,'count')[0]
-                    for cause in all_causes:
-                        row = [d for d in data if d.get('cause_id')==cause.id]
-                        if len(row) > 0:
-                            year_count_data[cause.id] = row[0].get('count') or 0
-                            year_total_count += (row[0].get('count') or 0)
-                        else:
-                            year_count_data[cause.id] = 0
-                year_total_count_list.append(year_total_count)
+        all_causes = self.facts.causes
+
+        for year in range(self.reporting_year,self.reporting_year - 3,-1):
+            year_count_data = {}
+            year_count_list.append(year_count_data)
+            year_total_count = 0
+            if year >= 2017:
+                for cause_id, cause_count in aggregate(self.facts.fires(year), key=lambda f: f.cause_id, value=lambda f: f.fires).iteritems():
+                    year_count_data[cause_id] = cause_count
+                    year_total_count += cause_count
+            else:
+                data = historical_cause_counts(year)
+                for cause in all_causes:
+                    year_count_data[cause.id] = data.get(cause.id) or 0
+                    year_total_count += year_count_data[cause.id]
+            year_total_count_list.append(year_total_count)
         for cause in all_causes:
             if rpt_map and cause.report_name in rpt_map[-1]:
                 for i in range(0,len(year_count_list),1):
@@ -1684,11 +1686,12 @@ class BushfireByCauseReport():
         logger.info("BushfireByCauseReport create complete" )
         return rpt_map, item_map
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
         year0 = str(self.reporting_year) + '/' + str(self.reporting_year+1)
         year1 = str(self.reporting_year-1) + '/' + str(self.reporting_year)
         year2 = str(self.reporting_year-2) + '/' + str(self.reporting_year-1)
-        # book = Workbook()
         sheet1 = book.add_sheet('Bushfire By Cause Report')
         sheet1 = book.get_sheet('Bushfire By Cause Report')
 
@@ -1723,7 +1726,7 @@ class BushfireByCauseReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -1784,20 +1787,20 @@ class BushfireByCauseReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_by_cause_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/bushfire_by_cause_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'bushfire_by_cause_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'bushfire_by_cause_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -1819,79 +1822,33 @@ class BushfireByCauseReport():
 
 
 class BushfireByRegionByTenureReport():
-    def __init__(self, reporting_year=None, overlap_ids=[]):
+    def __init__(self, reporting_year=None, overlap_ids=[], facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.overlap_ids = overlap_ids
         logger.info("Startiing RegionByTenureReport; overlap ids: " + str(self.overlap_ids))
         self.rpt_map, self.tenure_names = self.create()
 
     def create(self):
-        tenure_name_sql = """
-        SELECT distinct report_name, report_order FROM bfrs_tenure WHERE report_group = 'ALL REGIONS' ORDER BY report_order
-        """
-        count_sql = """
-        SELECT a.region_id, b.report_name, count(*)
-        FROM (
-            (SELECT a1.region_id, a1.tenure_id, a1.id
-            FROM reporting_bushfire a1
-            WHERE a1.report_status in {report_statuses} AND a1.reporting_year={{year}} AND a1.fire_not_found = false
-            ) 
-            UNION 
-            (SELECT b1.region_id, b1.tenure_id, b1.id
-            FROM reporting_bushfire b1
-                JOIN reporting_bushfire b2 ON b1.valid_bushfire_id = b2.id AND b2.report_status IN {report_statuses} AND b2.reporting_year = {{year}} AND b2.fire_not_found = false
-            WHERE b1.report_status = {status_merged}
-            ) 
-         ) AS a
-            JOIN bfrs_tenure b ON a.tenure_id = b.id JOIN bfrs_region r ON a.region_id = r.id
-            WHERE r.dbca AND b.report_group='ALL REGIONS'
-        GROUP BY a.region_id,b.report_name, b.report_order
-        ORDER BY a.region_id, b.report_name
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED]])),
-            status_merged = Bushfire.STATUS_MERGED
-        )
-        
-        area_sql = """
-        SELECT ab.region_id, t.report_name, SUM(ab.area) AS area 
-        FROM reporting_bushfire bf JOIN reporting_areaburnt ab ON bf.id = ab.bushfire_id JOIN bfrs_tenure t on ab.tenure_id = t.id JOIN bfrs_region r ON ab.region_id = r.id
-        WHERE bf.report_status in {report_statuses} AND bf.reporting_year = {{year}} AND bf.fire_not_found = False AND t.report_group = 'ALL REGIONS' AND r.dbca
-        GROUP BY ab.region_id, t.report_name, t.report_order
-        ORDER BY ab.region_id, t.report_name
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]]))
-        )
+        regions = self.facts.regions
+        tenures = self.facts.tenures
+        tenure_names = [name for order, name in sorted(set([(t.report_order, t.report_name) for t in tenures.values() if t.report_group == 'ALL REGIONS']))]
+
+        def region_tenure_key(region_id, tenure_id):
+            if region_id not in regions or not regions[region_id].dbca or tenure_id not in tenures or tenures[tenure_id].report_group != 'ALL REGIONS':
+                return None
+            return (region_id, tenures[tenure_id].report_name)
 
         rpt_map = []
         count_data = {}
         area_data = {}
-        tenure_names = []
-        
-        with connection.cursor() as cursor:
-            cursor.execute(tenure_name_sql)
-            for result in cursor.fetchall():
-                tenure_names.append(result[0])
-
-            cursor.execute(count_sql.format(year=self.reporting_year))
-            for result in cursor.fetchall():
-                region_id = result[0]
-                tenure_name = result[1]
-                report_count = result[2] or 0
-
-                if region_id not in count_data:
-                    count_data[region_id] = {}
-                count_data[region_id][tenure_name] = count_data[region_id].get(tenure_name,0) + report_count
-            logger.info("Region by Tenure: count complete")
-            #cursor.execute(area_sql.format(year=self.reporting_year, excluded_ids=str(excluded_ids)[1:-1]))
-            cursor.execute(area_sql.format(year=self.reporting_year))
-            for result in cursor.fetchall():
-                region_id = result[0]
-                tenure_name = result[1]
-                report_area = result[2] or 0
-
-                if region_id not in area_data:
-                    area_data[region_id] = {}
-                area_data[region_id][tenure_name] = area_data[region_id].get(tenure_name, 0) + report_area
+
+        for (region_id, tenure_name), report_count in aggregate(self.facts.fires(self.reporting_year), key=lambda f: region_tenure_key(f.region_id, f.tenure_id), value=lambda f: f.fires).iteritems():
+            count_data.setdefault(region_id, {})[tenure_name] = report_count
+        logger.info("Region by Tenure: count complete")
+
+        for (region_id, tenure_name), report_area in aggregate(self.facts.areas(self.reporting_year), key=lambda a: region_tenure_key(a.region_id, a.tenure_id), value=lambda a: a.area).iteritems():
+            area_data.setdefault(region_id, {})[tenure_name] = report_area
         logger.info("Region by Tenure: area complete")
         
         tenure_count_total_forest={}
@@ -1954,8 +1911,9 @@ class BushfireByRegionByTenureReport():
 
         return rpt_map, tenure_names
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
-        # book = Workbook()
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
         sheet1 = book.add_sheet('Bushfire Region By Tenure')
         sheet1 = book.get_sheet('Bushfire Region By Tenure')
 
@@ -1989,7 +1947,7 @@ class BushfireByRegionByTenureReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -2035,19 +1993,19 @@ class BushfireByRegionByTenureReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_regionbytenure_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/bushfire_regionbytenure_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
         rpt_date = datetime.now()
-        filename = 'bushfire_regionbytenure_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'bushfire_regionbytenure_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -2063,8 +2021,9 @@ class BushfireByRegionByTenureReport():
 
 
 class Bushfire10YrAverageReport():
-    def __init__(self,reporting_year=None):
+    def __init__(self,reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.rpt_map, self.item_map = self.create()
         logger.info("Starting Bushfire10YrAverageReport")
 
@@ -2072,64 +2031,29 @@ class Bushfire10YrAverageReport():
         rpt_map = []
         item_map = {}
 
-        count_sql = """
-        SELECT a.cause_id, COUNT(*)
-        FROM (
-            (SELECT COALESCE(a1.cause_id, 9) AS cause_id, a1.id
-            FROM reporting_bushfire a1
-            WHERE a1.report_status IN {report_statuses} AND a1.reporting_year = {{reporting_year}} AND a1.fire_not_found = false
-            )
-            UNION
-            (SELECT COALESCE(b1.cause_id, 9) AS cause_id, b1.id
-            FROM reporting_bushfire b1
-               JOIN reporting_bushfire b2 ON b1.valid_bushfire_id = b2.id AND b2.report_status IN {report_statuses} AND b2.reporting_year = {{reporting_year}} AND b2.fire_not_found = false
-            WHERE b1.report_status = {status_merged}
-            )
-         ) AS a
-        GROUP BY a.cause_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED, Bushfire.STATUS_REVIEWED]])),
-            status_merged = Bushfire.STATUS_MERGED
-        )
-
-        area_sql = """
-        SELECT COALESCE(a.cause_id, 9) AS cause_id, SUM(b.area) AS total_all_regions_area, SUM(a.area) AS total_area
-        FROM reporting_bushfire a JOIN reporting_areaburnt b ON a.id = b.bushfire_id JOIN bfrs_tenure c ON b.tenure_id = c.id
-        WHERE a.report_status IN {report_statuses} AND a.reporting_year = {{reporting_year}} AND a.fire_not_found = false AND c.report_group = 'ALL REGIONS'
-        GROUP BY a.cause_id
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]]))
-        )
-
         year_count_list = []
         year_total_count_list = []
 
         total_count = 0
         total_count_avg = 0
         
-        all_causes =  Cause.objects.all().order_by('report_order')
-
-        with connection.cursor() as cursor:
-            for year in range(self.reporting_year,self.reporting_year - 10,-1):
-                year_count_data = {}
-                year_count_list.append(year_count_data)
-                year_total_count = 0
-                if year >= 2017:
-                    cursor.execute(count_sql.format(reporting_year=year))
-                    for result in cursor.fetchall():
-                        year_count_data[result[0]] = result[1] or 0
-                        year_total_count += result[1] or 0
-                else:
-                    data = read_col(year,'count')[0]
-                    for cause in all_causes:
-                        row = [d for d in data if d.get('cause_id')==cause.id]
-                        if len(row) > 0:
-                            year_count_data[cause.id] = row[0].get('count') or 0
-                            year_total_count += (row[0].get('count') or 0)
-                        else:
-                            year_count_data[cause.id] = 0
-                year_total_count_list.append(year_total_count)
-                total_count += year_total_count
+        all_causes = self.facts.causes
+
+        for year in range(self.reporting_year,self.reporting_year - 10,-1):
+            year_count_data = {}
+            year_count_list.append(year_count_data)
+            year_total_count = 0
+            if year >= 2017:
+                for cause_id, cause_count in aggregate(self.facts.fires(year), key=lambda f: f.cause_id, value=lambda f: f.fires).iteritems():
+                    year_count_data[cause_id] = cause_count
+                    year_total_count += cause_count
+            else:
+                data = historical_cause_counts(year)
+                for cause in all_causes:
+                    year_count_data[cause.id] = data.get(cause.id) or 0
+                    year_total_count += year_count_data[cause.id]
+            year_total_count_list.append(year_total_count)
+            total_count += year_total_count
 
         total_count_avg = round(total_count/(len(year_count_list) * 1.0))
         
@@ -2181,7 +2105,9 @@ class Bushfire10YrAverageReport():
         logger.info("Bushfire10YrAverageReport create complete")
         return rpt_map, item_map
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
         year0 = str(self.reporting_year) + '/' + str(self.reporting_year+1)
         year1 = str(self.reporting_year-1) + '/' + str(self.reporting_year)
         year2 = str(self.reporting_year-2) + '/' + str(self.reporting_year-1)
@@ -2193,7 +2119,6 @@ class Bushfire10YrAverageReport():
         year8 = str(self.reporting_year-8) + '/' + str(self.reporting_year-7)
         year9 = str(self.reporting_year-9) + '/' + str(self.reporting_year-8)
 
-        # book = Workbook()
         sheet1 = book.add_sheet('Bushfire Causes 10Yr Average')
         sheet1 = book.get_sheet('Bushfire Causes 10Yr Average')
 
@@ -2228,7 +2153,7 @@ class Bushfire10YrAverageReport():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -2362,20 +2287,20 @@ class Bushfire10YrAverageReport():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_cause_10yr_average_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/bushfire_cause_10yr_average_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'bushfire_by_cause_10yr_average_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'bushfire_by_cause_10yr_average_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -2397,8 +2322,9 @@ class Bushfire10YrAverageReport():
 
 
 class BushfireIndicator():
-    def __init__(self,reporting_year=None):
+    def __init__(self,reporting_year=None, facts=None):
         self.reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+        self.facts = facts or ReportFacts()
         self.rpt_map, self.item_map = self.create()
         logger.info("Starting BushfireIndicator")
 
@@ -2415,39 +2341,11 @@ class BushfireIndicator():
         """
 
 
-        count_sql = """
-        select count(*)
-        from (
-            (select a1.id,a1.area
-            from reporting_bushfire a1
-            where a1.report_status in {report_statuses} and a1.reporting_year={reporting_year} and a1.fire_not_found=false and a1.region_id in ({regions}) and a1.first_attack_id = {first_attack_agency}
-            )
-            union
-            (select b1.id,b2.area
-            from reporting_bushfire b1
-               join reporting_bushfire b2 on b1.valid_bushfire_id = b2.id and b2.report_status in {report_statuses} and b2.reporting_year={reporting_year} and b2.region_id in ({regions}) and b2.fire_not_found=false and b2.first_attack_id = {first_attack_agency}
-            where b1.report_status = {status_merged} 
-            )
-         ) as a
-         {{filter}}
-        """.format(
-            report_statuses="({})".format(",".join([str(i) for i in [Bushfire.STATUS_FINAL_AUTHORISED,Bushfire.STATUS_REVIEWED]])),
-            status_merged = Bushfire.STATUS_MERGED,
-            regions = ",".join([str(r.id) for r in get_sorted_regions(True)]),
-            reporting_year = self.reporting_year,
-            first_attack_agency = Agency.DBCA.id
-        )
-
-        count1 = 0
-        count2 = 0
-        with connection.cursor() as cursor:
-            cursor.execute(count_sql.format(filter=""))
-            result = cursor.fetchone()
-            count1 = result[0] or 0
-
-            cursor.execute(count_sql.format(filter=" where a.area < 2.0"))
-            result = cursor.fetchone()
-            count2 = result[0] or 0
+        #a merged fire is counted by the region, initial attack agency and area of its valid fire
+        forest_region_ids = [r.id for r in get_sorted_regions(True)]
+        fires = [f for f in self.facts.fires(self.reporting_year) if f.valid_region_id in forest_region_ids and f.first_attack_id == Agency.DBCA.id]
+        count1 = sum([f.fires for f in fires])
+        count2 = sum([f.fires for f in fires if f.small_fire])
 
         rpt_map = []
         item_map = {}
@@ -2460,9 +2358,10 @@ class BushfireIndicator():
         logger.info("BushfireIndicator create complete")
         return rpt_map, item_map
 
-    def get_excel_sheet(self, rpt_date, book=Workbook()):
+    def get_excel_sheet(self, rpt_date, book=None):
+        if book is None:
+            book = new_workbook()
 
-        # book = Workbook()
         sheet1 = book.add_sheet('Bushfire Indicator')
         sheet1 = book.get_sheet('Bushfire Indicator')
 
@@ -2497,7 +2396,7 @@ class BushfireIndicator():
 
         hdr = sheet1.row(row_no())
         hdr.write(0, 'Missing Final', style=style)
-        hdr.write(1, Bushfire.objects.filter(report_status=Bushfire.STATUS_INITIAL_AUTHORISED, reporting_year=self.reporting_year).count() )
+        hdr.write(1, self.facts.missing_final(self.reporting_year) )
 
         hdr = sheet1.row(row_no())
         hdr = sheet1.row(row_no())
@@ -2533,20 +2432,20 @@ class BushfireIndicator():
 
     def write_excel(self):
         rpt_date = datetime.now()
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
-        filename = '/tmp/bushfire_indicator_report_{}.xls'.format(rpt_date.strftime('%d-%b-%Y'))
+        filename = '/tmp/bushfire_indicator_report_{}.{}'.format(rpt_date.strftime('%d-%b-%Y'), excel_extension())
         book.save(filename)
 
     def export(self):
         """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
 
         rpt_date = datetime.now()
-        filename = 'bushfire_indicator_report_{}.xls'.format(rpt_date.strftime('%d%b%Y'))
-        response = HttpResponse(content_type='application/vnd.ms-excel')
+        filename = 'bushfire_indicator_report_{}.{}'.format(rpt_date.strftime('%d%b%Y'), excel_extension())
+        response = HttpResponse(content_type=excel_content_type())
         response['Content-Disposition'] = 'attachment; filename=' + filename
 
-        book = Workbook()
+        book = new_workbook()
         self.get_excel_sheet(rpt_date, book)
 
         book.add_sheet('Sheet 2')
@@ -2564,6 +2463,47 @@ class BushfireIndicator():
                     print
 
 
+#report name -> report class, the reports served by the json reporting api
+REPORTS = OrderedDict([
+    ('ministerial', MinisterialReport),
+    ('ministerial_auth', MinisterialReportAuth),
+    ('ministerial_268', MinisterialReport268),
+    ('quarterly', QuarterlyReport),
+    ('by_tenure', BushfireByTenureReport),
+    ('by_cause', BushfireByCauseReport),
+    ('region_by_tenure', BushfireByRegionByTenureReport),
+    ('indicator', BushfireIndicator),
+    ('by_cause_10yr_average', Bushfire10YrAverageReport),
+])
+
+#the reports which include the 268b fires from PBS, so their data is also live data
+LIVE_DATA_REPORTS = ('ministerial', 'ministerial_268')
+
+def get_report_data(name, reporting_year=None, build_id=None):
+    """
+    Returns the rpt_map and item_map of the report as a dict.
+    The data is generated once per build of the reporting tables and cached until calculate_report_tables runs again;
+    the data of LIVE_DATA_REPORTS also expires after settings.REPORT_LIVE_DATA_CACHE_TIMEOUT seconds
+    """
+    reporting_year = current_finyear() if (reporting_year is None or reporting_year >= current_finyear()) else reporting_year
+    build_id = build_id or reporting_tables.get_build_id()
+    cache_name = "{}_{}_data".format(name, reporting_year)
+
+    data = reporting_tables.get_cached_report(cache_name, build_id)
+    if data:
+        return data
+
+    report = REPORTS[name](reporting_year=reporting_year)
+    data = {
+        'report': name,
+        'reporting_year': reporting_year,
+        'build_id': build_id,
+        'rpt_map': report.rpt_map,
+        'item_map': getattr(report, 'item_map', None),
+    }
+    reporting_tables.cache_report(cache_name, build_id, data, settings.REPORT_LIVE_DATA_CACHE_TIMEOUT if name in LIVE_DATA_REPORTS else None)
+    return data
+
 def export_outstanding_fires(request, region_id, queryset):
     """ Executed from the Overview page in BFRS, returns an Excel WB as a HTTP Response object """
     #regions = Region.objects.filter(id=region_id) if region_id else Region.objects.all()
@@ -2571,11 +2511,11 @@ def export_outstanding_fires(request, region_id, queryset):
     region_name = regions[0].name if region_id else 'All-Regions'
 
     rpt_date = datetime.now()
-    filename = 'outstanding_fires_{}_{}.xls'.format(region_name, rpt_date.strftime('%d%b%Y'))
-    response = HttpResponse(content_type='application/vnd.ms-excel')
+    filename = 'outstanding_fires_{}_{}.{}'.format(region_name, rpt_date.strftime('%d%b%Y'), excel_extension())
+    response = HttpResponse(content_type=excel_content_type())
     response['Content-Disposition'] = 'attachment; filename=' + filename
 
-    book = Workbook()
+    book = new_workbook()
     for region in regions:
         outstanding_fires(book, region, queryset, rpt_date)
 
@@ -2584,46 +2524,95 @@ def export_outstanding_fires(request, region_id, queryset):
 
     return response
 
+#the number of times a failed outstanding fires email is resent, and the seconds to wait before resending it
+EMAIL_RETRIES = 3
+EMAIL_RETRY_DELAY = 10
+
+def outstanding_fires_message(region, fires, email_to, rpt_date):
+    """ The Outstanding Fires email of the region, with the Excel WB of the region's fires attached """
+    region_name = region.name
+    f = StringIO()
+    book = new_workbook()
+    total_reports = outstanding_fires(book, region, fires, rpt_date)
+    book.add_sheet('Sheet 2')
+    book.save(f)
+
+    if total_reports == 0:
+        subject = 'Outstanding Fires Report - {} - {} - No Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
+        body = 'Outstanding Fires Report - {} - {} - No Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
+    elif total_reports == 1:
+        subject = 'Outstanding Fires Report - {} - {} - 1 Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
+        body = 'Outstanding Fires Report - {} - {} - 1 Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
+    else:
+        subject = 'Outstanding Fires Report - {} - {} - {} Outstanding Fires'.format(region_name, rpt_date.strftime('%d-%b-%Y'),total_reports) 
+        body = 'Outstanding Fires Report - {} - {} - {} Outstanding Fires'.format(region_name, rpt_date.strftime('%d-%b-%Y'),total_reports) 
+
+    message = EmailMessage(subject=subject, body=body, from_email=settings.FROM_EMAIL, to=email_to, cc=settings.CC_EMAIL, bcc=settings.BCC_EMAIL)
+    if total_reports > 0:
+        filename = 'outstanding_fires_{}_{}.{}'.format(region_name.replace(' ', '').lower(), rpt_date.strftime('%d-%b-%Y'), excel_extension())
+        message.attach(filename, f.getvalue(), excel_content_type()) #get the stream and set the correct mimetype
+    return message
+
+def send_messages(email_messages, retries=EMAIL_RETRIES, retry_delay=EMAIL_RETRY_DELAY):
+    """
+    Send the messages over one smtp connection.
+    A failed message is resent (on a new connection) up to retries times, without affecting the other messages.
+    Returns the messages which could not be sent
+    """
+    mail_connection = get_connection()
+    failed = []
+    try:
+        for message in email_messages:
+            attempt = 0
+            while True:
+                try:
+                    mail_connection.send_messages([message])
+                    break
+                except Exception as e:
+                    attempt += 1
+                    mail_connection.close()
+                    if attempt > retries:
+                        logger.error("Failed to send email '{}' to {}. {}".format(message.subject, message.to, e))
+                        failed.append(message)
+                        break
+                    logger.warning("Failed to send email '{}' to {}, resend in {} seconds. {}".format(message.subject, message.to, retry_delay, e))
+                    time.sleep(retry_delay)
+    finally:
+        mail_connection.close()
+    return failed
+
 def email_outstanding_fires(region_id=None):
-    """ Executed from the command line, returns an Excel WB attachment via email """
-    qs = Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_INITIAL_AUTHORISED])
+    """
+    Executed from the command line, returns an Excel WB attachment via email.
+    The WBs of all the regions are built from one query of the outstanding fires and the emails are sent over one smtp connection
+    """
     rpt_date = datetime.now()
+    region_names = [region_name for row in settings.OUTSTANDING_FIRES_EMAIL for region_name in row.keys()]
+    regions = dict([(r.name, r) for r in Region.objects.filter(name__in=region_names)])
+
+    fires = {}
+    for obj in Bushfire.objects.filter(report_status__in=[Bushfire.STATUS_INITIAL_AUTHORISED]).select_related('duty_officer'):
+        fires.setdefault(obj.region_id, []).append(obj)
 
+    email_messages = []
     for row in settings.OUTSTANDING_FIRES_EMAIL:
         for region_name,email_to in row.iteritems():
+            region = regions.get(region_name)
+            if not region:
+                logger.error("Region ({}) Not Found".format(region_name))
+                continue
+            email_messages.append(outstanding_fires_message(region, fires.get(region.id, []), email_to, rpt_date))
 
-            try:
-                region = Region.objects.get(name=region_name)
-            except:
-                region = None
-                traceback.print_exc()
-
-            if region:
-                f = StringIO()
-                book = Workbook()
-                total_reports = outstanding_fires(book, region, qs, rpt_date)
-                book.add_sheet('Sheet 2')
-                book.save(f)
-
-                if total_reports == 0:
-                    subject = 'Outstanding Fires Report - {} - {} - No Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
-                    body = 'Outstanding Fires Report - {} - {} - No Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
-                elif total_reports == 1:
-                    subject = 'Outstanding Fires Report - {} - {} - 1 Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
-                    body = 'Outstanding Fires Report - {} - {} - 1 Outstanding Fire'.format(region_name, rpt_date.strftime('%d-%b-%Y')) 
-                else:
-                    subject = 'Outstanding Fires Report - {} - {} - {} Outstanding Fires'.format(region_name, rpt_date.strftime('%d-%b-%Y'),total_reports) 
-                    body = 'Outstanding Fires Report - {} - {} - {} Outstanding Fires'.format(region_name, rpt_date.strftime('%d-%b-%Y'),total_reports) 
-
-                message = EmailMessage(subject=subject, body=body, from_email=settings.FROM_EMAIL, to=email_to, cc=settings.CC_EMAIL, bcc=settings.BCC_EMAIL)
-                if total_reports > 0:
-                    filename = 'outstanding_fires_{}_{}.xls'.format(region_name.replace(' ', '').lower(), rpt_date.strftime('%d-%b-%Y'))
-                    message.attach(filename, f.getvalue(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet") #get the stream and set the correct mimetype
-
-                message.send()
+    failed = send_messages(email_messages)
+    logger.info("Sent {} of {} Outstanding Fires emails".format(len(email_messages) - len(failed), len(email_messages)))
+    return failed
 
 def outstanding_fires(book, region, queryset, rpt_date):
-    qs = queryset.filter(region_id=region.id)
+    """ Writes the region's fires to a new sheet; queryset is a queryset of fires or a list of the region's fires """
+    if isinstance(queryset, QuerySet):
+        qs = queryset.filter(region_id=region.id).select_related('duty_officer')
+    else:
+        qs = queryset
     sheet1 = book.add_sheet(region.name)
 
     col_no = lambda c=count(): next(c)
@@ -2670,225 +2659,6 @@ export_outstanding_fires.short_description = u"Outstanding Fires"
 def calculate_report_tables(request):
     print "starting calculate report tables"
     url = request.META.get('HTTP_REFERER')
-    with connection.cursor() as csr:
-        csr.execute("""
---------------------------------------------------------------------
---reporting_bushfire and reporting_areaburnt CREATION AND INDEXES
----------------------------------------------------------------------
-DROP TABLE IF EXISTS reporting_bushfire;
-CREATE TABLE reporting_bushfire AS SELECT * FROM bfrs_bushfire;
-
---CREATE INDEX idx_reporting_bushfire_origin ON reporting_bushfire USING GIST(origin_point);
-DROP INDEX IF EXISTS idx_reporting_bushfire_tenure;
-CREATE INDEX idx_reporting_bushfire_tenure ON reporting_bushfire (tenure_id);
-DROP INDEX IF EXISTS idx_reporting_bushfire_region;
-CREATE INDEX idx_reporting_bushfire_region ON reporting_bushfire (region_id);
-DROP INDEX IF EXISTS idx_reporting_bushfire_rpt_status;
-CREATE INDEX idx_reporting_bushfire_rpt_status ON reporting_bushfire (report_status);
-DROP INDEX IF EXISTS idx_reporting_bushfire_rpt_year;
-CREATE INDEX idx_reporting_bushfire_rpt_year ON reporting_bushfire (reporting_year);
-
-DROP TABLE IF EXISTS reporting_areaburnt;
-CREATE TABLE reporting_areaburnt AS SELECT * FROM bfrs_areaburnt;
-ALTER TABLE reporting_areaburnt DROP CONSTRAINT IF EXISTS reporting_areaburnt_bushfire_id_tenure_id_key;
-ALTER TABLE reporting_areaburnt ADD COLUMN region_id Integer;
-ALTER TABLE reporting_areaburnt ADD COLUMN has_fire_boundary Boolean;
-CREATE INDEX idx_reporting_areaburnt_tenure ON reporting_areaburnt(tenure_id);
-CREATE INDEX idx_reporting_areaburnt_bushfire ON reporting_areaburnt(bushfire_id);
-CREATE INDEX idx_reporting_areaburnt_region ON reporting_areaburnt(region_id);
-DELETE FROM reporting_areaburnt WHERE bushfire_id IN
-    (SELECT id FROM reporting_bushfire WHERE fire_boundary IS NOT NULL);
-UPDATE reporting_areaburnt ab SET region_id = (SELECT bf.region_id FROM reporting_bushfire bf WHERE ab.bushfire_id = bf.id);
-UPDATE reporting_areaburnt SET has_fire_boundary = False;
-
---make valid geometries (NB checked cadastre_for_bfrs and no invalid geometries
-UPDATE reporting_bushfire SET fire_boundary = ST_CollectionExtract(ST_MakeValid(fire_boundary), 3) WHERE NOT ST_IsValid(fire_boundary);
-UPDATE reporting_state_forest SET shape = ST_CollectionExtract(ST_MakeValid(shape), 3) WHERE NOT ST_IsValid(shape);
-UPDATE reporting_cadastre SET shape = ST_CollectionExtract(ST_MakeValid(shape), 3) WHERE NOT ST_IsValid(shape);
-UPDATE reporting_dept_managed SET geometry = ST_CollectionExtract(ST_MakeValid(geometry), 3) WHERE NOT ST_IsValid(geometry);
-UPDATE reporting_dept_interest SET geometry = ST_CollectionExtract(ST_MakeValid(geometry), 3) WHERE NOT ST_IsValid(geometry);
-
-----------------------------------------
---GET REGION-CROSSING FIRES
-----------------------------------------
-DROP TABLE IF EXISTS reporting_crossregion_fires;
-CREATE TABLE reporting_crossregion_fires AS SELECT DISTINCT bf.id FROM reporting_bushfire bf JOIN bfrs_region r ON ST_Overlaps(bf.fire_boundary, r.geometry);
-DROP INDEX IF EXISTS idx_reporting_crossregion_fires;
-CREATE INDEX idx_reporting_crossregion_fires ON reporting_crossregion_fires(id);
-
----------------------------------------    
---UCL/Other Crown/Private Property 13 min
----------------------------------------
-
---insert recalculated 'other crown' / UCL / Freehold 
---Other Crown 5min
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914))/10000)::numeric,2), bf.id, 19, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape)
-    WHERE brc_fms_legend = 'Other Crown Land' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-    
---UCL 5min
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914))/10000)::numeric,2), bf.id, 25, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape)
-    WHERE brc_fms_legend = 'UCL' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-    
---Freehold 15s
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, cad.shape), 900914))/10000)::numeric,2), bf.id, 18, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape)
-    WHERE brc_fms_legend = 'Freehold' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-
---UPDATE tenure_id FOR IGNITION POINTS IN UCL, FREEHOLD AND OTHER CROWN
-UPDATE reporting_bushfire bf SET tenure_id = 19 WHERE bf.id IN 
-(SELECT id FROM reporting_bushfire bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'Other Crown Land');
-
-UPDATE reporting_bushfire bf SET tenure_id = 18 WHERE bf.id IN 
-(SELECT id FROM reporting_bushfire bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'Freehold');
-
-UPDATE reporting_bushfire bf SET tenure_id = 25 WHERE bf.id IN 
-(SELECT id FROM reporting_bushfire bf, reporting_cadastre cad WHERE ST_Within(bf.origin_point, cad.shape) AND cad.brc_fms_legend = 'UCL');
-
-
--------------------------------------------
---DEPT LAND
----------------------------------------------
---INTEREST 20s
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, di.geometry), 900914))/10000)::numeric,2),
-    bf.id, t.id, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_dept_interest di ON ST_Intersects(bf.fire_boundary, di.geometry) JOIN bfrs_tenure t ON di.category = t.name
-    WHERE bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-
---MANAGED 3min
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, dm.geometry), 900914))/10000)::numeric,2),
-    bf.id, t.id, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_dept_managed dm ON ST_Intersects(bf.fire_boundary, dm.geometry) JOIN bfrs_tenure t ON dm.category = t.name
-    WHERE dm.category <> 'State Forest' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-
---UPDATE tenure_id FOR OLD 'Other' TENURE IN DEPT-MANAGED LAND
-UPDATE reporting_bushfire
-SET tenure_id = t_id
-FROM (SELECT bf.id AS bf_id, t.id AS t_id FROM reporting_bushfire bf, reporting_dept_managed dm 
-JOIN bfrs_tenure t ON dm.category = t.name
-WHERE tenure_id = 20
-AND st_within(bf.origin_point, dm.geometry)) AS sqry
-WHERE id = bf_id;
-
---------------------------------------------------
---STATE FOREST 20s
---------------------------------------------------
---Hardwood 4s
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, sf.shape), 900914))/10000)::numeric,2), bf.id, 26, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape)
-    WHERE fbr_fire_report_classification = 'Native Hardwood' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-
---Softwood 1s    
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, sf.shape), 900914))/10000)::numeric,2), bf.id, 27, bf.region_id, True
-    FROM reporting_bushfire bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape)
-    WHERE fbr_fire_report_classification = 'State - Coniferous' AND bf.report_status IN (3, 4) AND NOT bf.fire_not_found AND bf.id NOT IN (SELECT id FROM reporting_crossregion_fires);
-
---where NOT has_fire_boundary
-UPDATE reporting_areaburnt
-SET tenure_id = 27 WHERE id IN
-(SELECT ab.id
-FROM reporting_areaburnt ab JOIN reporting_bushfire bf ON ab.bushfire_id = bf.id 
-JOIN reporting_state_forest sf ON ST_Within(bf.origin_point, sf.shape)
-WHERE ab.tenure_id = 3 AND NOT has_fire_boundary AND sf.fbr_fire_report_classification = 'State - Coniferous');
-
---remaining '3's should be 26
-UPDATE reporting_areaburnt
-SET tenure_id = 26 WHERE id IN
-(SELECT ab.id
-FROM reporting_areaburnt ab JOIN reporting_bushfire bf ON ab.bushfire_id = bf.id 
-JOIN reporting_state_forest sf ON ST_Within(bf.origin_point, sf.shape)
-WHERE ab.tenure_id = 3 AND NOT has_fire_boundary AND sf.fbr_fire_report_classification = 'Native Hardwood');
-
-DELETE FROM reporting_areaburnt WHERE tenure_id = 3;
-
---UPDATE STATE FOREST IGNITION POINTS
-UPDATE reporting_bushfire bf SET tenure_id = 26 WHERE bf.tenure_id = 3 AND bf.id IN 
-(SELECT id FROM reporting_bushfire bf, reporting_state_forest sf WHERE ST_Within(bf.origin_point, sf.shape) AND sf.fbr_fire_report_classification = 'Native Hardwood');
-
-UPDATE reporting_bushfire bf SET tenure_id = 27 WHERE bf.tenure_id = 3 AND bf.id IN 
-(SELECT id FROM reporting_bushfire bf, reporting_state_forest sf WHERE ST_Within(bf.origin_point, sf.shape) AND sf.fbr_fire_report_classification = 'State - Coniferous');
-
----------------------------------------
---ADD IN INFO FOR REGION-CROSSING FIRES 20min in total
----------------------------------------
---SA/NT: insert into reporting_areaburnt the SA/NT components of trans-state fires (this is done USING r.name = t.name) 1 min
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(bf.fire_boundary, r.geometry), 900914))/10000)::numeric,2),
-bf.id, t.id, r.id, True
-FROM reporting_bushfire bf JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON r.name = t.name;
-    
---insert into reporting_areaburnt the Prvt Prpty / UCL / Other Crown Land components of trans-region fires (13 min)
---Other Crown Land
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT area, bushfire_id, 19, region_id, True
-FROM (
-    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
-    bf.id as bushfire_id, r.id as region_id
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
-    WHERE brc_fms_legend = 'Other Crown Land' AND bf.id IN (SELECT id FROM reporting_crossregion_fires) AND r.dbca
-    GROUP BY bf.id, r.id) AS sqry;
-    
---UCL 3 min
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT area, bushfire_id, 25, region_id, True
-FROM (
-    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
-    bf.id as bushfire_id, r.id as region_id
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
-    WHERE brc_fms_legend = 'UCL' AND bf.id IN (SELECT id FROM reporting_crossregion_fires) AND r.dbca
-    GROUP BY bf.id, r.id) AS sqry;
-    
---Private Property (Freehold)   30s OK
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT area, bushfire_id, 18, region_id, True
-FROM (
-    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, cad.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
-    bf.id as bushfire_id, r.id as region_id
-    FROM reporting_bushfire bf JOIN reporting_cadastre cad ON ST_Intersects(bf.fire_boundary, cad.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
-    WHERE brc_fms_legend = 'Freehold' AND bf.id IN (SELECT id FROM reporting_crossregion_fires) and r.dbca
-    GROUP BY bf.id, r.id) AS sqry;
-    
---State Forest (Hardwood) (4s)
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT area, bushfire_id, 26, region_id, True
-FROM (
-    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, sf.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
-    bf.id as bushfire_id, r.id as region_id
-    FROM reporting_bushfire bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
-    WHERE fbr_fire_report_classification = 'Native Hardwood' AND bf.id IN (SELECT id FROM reporting_crossregion_fires) and r.dbca
-    GROUP BY bf.id, r.id) AS sqry;
-
---State Forest (Softwood) (4s)
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id, has_fire_boundary)
-SELECT area, bushfire_id, 27, region_id, True
-FROM (
-    SELECT SUM(ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, sf.shape), r.geometry), 900914))/10000)::numeric, 2)) AS area,
-    bf.id as bushfire_id, r.id as region_id
-    FROM reporting_bushfire bf JOIN reporting_state_forest sf ON ST_Intersects(bf.fire_boundary, sf.shape) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry)
-    WHERE fbr_fire_report_classification = 'State - Coniferous' AND bf.id IN (SELECT id FROM reporting_crossregion_fires) and r.dbca
-    GROUP BY bf.id, r.id) AS sqry;
-    
---insert into reporting_areaburnt the Interest Tenure components of trans-region fires (8s)
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, di.geometry), r.geometry), 900914))/10000)::numeric,2),
-    bf.id, t.id, r.id
-    FROM reporting_bushfire bf JOIN reporting_dept_interest di ON ST_Intersects(bf.fire_boundary, di.geometry) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON di.category = t.name
-    WHERE bf.id IN (SELECT id FROM reporting_crossregion_fires);
-
---insert into reporting_areaburnt the Managed Tenure components of trans-region fires (1:19)
-INSERT INTO reporting_areaburnt (area, bushfire_id, tenure_id, region_id)
-    SELECT ROUND((ST_Area(ST_Transform(ST_Intersection(ST_Intersection(bf.fire_boundary, dm.geometry), r.geometry), 900914))/10000)::numeric,2),
-    bf.id, t.id, r.id
-    FROM reporting_bushfire bf JOIN reporting_dept_managed dm ON ST_Intersects(bf.fire_boundary, dm.geometry) JOIN bfrs_region r ON ST_Intersects(bf.fire_boundary, r.geometry) JOIN bfrs_tenure t ON dm.category = t.name
-    WHERE dm.category <> 'State Forest'  AND bf.id IN (SELECT id FROM reporting_crossregion_fires);
-    """)
+    reporting_tables.calculate_report_tables()
     print "finished calculate report tables"
     return HttpResponseRedirect(url)
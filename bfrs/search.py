@@ -0,0 +1,58 @@
+"""
+The global search of the bushfires (fire number, fire name and DFES incident number).
+
+A search value that looks like the start of a fire number ('BF 2023 SWC', 'bf_2023_swc_01', 'BF2023') is normalised
+to the fire number format and searched by prefix; any other value is searched with icontains.
+Both are backed by the indexes created by migration 0028 (pg_trgm for icontains, text_pattern_ops for the prefix),
+on bfrs_bushfire and bfrs_bushfiresnapshot, so the functions work for querysets of both.
+
+To Test:
+    from bfrs.models import Bushfire
+    from bfrs.search import search_bushfires
+    search_bushfires(Bushfire.objects.all(), 'bf 2019 swc').count()
+    [(b.fire_number, b.search_rank) for b in search_bushfires(Bushfire.objects.all(), 'Collie', ranked=True)[:10]]
+"""
+import re
+
+from django.db.models import Q
+
+#'BF'/'DE' followed by (the start of) the year, district code and number, separated by spaces, '_' or '-'
+FIRE_NUMBER_PREFIX_RE = re.compile(r"^(BF|DE)[\s_-]*\d{1,4}([\s_-]*[A-Z]{1,3}([\s_-]*\d{1,3})?)?[\s_-]*$", re.IGNORECASE)
+
+RANK_SQL = "GREATEST(similarity(UPPER({0}.fire_number), UPPER(%s)), similarity(UPPER({0}.name), UPPER(%s)), similarity(UPPER(COALESCE({0}.dfes_incident_no, '')), UPPER(%s)))"
+
+
+def fire_number_prefix(value):
+    """ The fire number prefix ('BF 2023 SWC') of a search value; None if the value does not look like a fire number """
+    value = value.strip()
+    if not FIRE_NUMBER_PREFIX_RE.match(value):
+        return None
+    prefix = ' '.join(re.findall(r"[A-Za-z]+|\d+", value)).upper()
+    if value[-1] in " _-" and len(prefix) > 2:
+        #the last part is complete
+        prefix += ' '
+    return prefix
+
+
+def search_bushfires(queryset, value, ranked=False):
+    """
+    Filter the bushfires (or snapshots) by the search value.
+    ranked: add the 'search_rank' column (the best pg_trgm similarity of the value and the fire number, name and DFES incident number)
+        and order by it
+    """
+    value = (value or '').strip()
+    if not value:
+        return queryset
+
+    prefix = fire_number_prefix(value)
+    if prefix:
+        queryset = queryset.filter(fire_number__startswith=prefix)
+    else:
+        queryset = queryset.filter(Q(fire_number__icontains=value) | Q(name__icontains=value) | Q(dfes_incident_no__icontains=value))
+
+    if ranked:
+        queryset = queryset.extra(
+            select={'search_rank': RANK_SQL.format(queryset.model._meta.db_table)},
+            select_params=[value, value, value]
+        ).order_by('-search_rank', 'fire_number')
+    return queryset
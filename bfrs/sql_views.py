@@ -1,4 +1,4 @@
-from bfrs.models import Bushfire,CaptureMethod
+from bfrs.models import Bushfire,CaptureMethod,SNAPSHOT_INITIAL,SNAPSHOT_FINAL
 from django.db import connection
 
 def create_bushfirelist_view():
@@ -506,11 +506,46 @@ def create_fireboundary_view():
     WHERE b.archive = false AND b.report_status < {0};
     '''.format(Bushfire.STATUS_INVALIDATED,CaptureMethod.OTHER_CODE))
 
+def create_bushfiresnapshot_view():
+    """
+    cursor.execute('''drop view bfrs_bushfiresnapshot_v''')
+    The fire boundaries of the snapshots are resolved from the geometry store (bfrs_snapshotgeometry)
+    """
+    from django.db import connection
+    cursor = connection.cursor()
+    cursor.execute('''
+    DROP VIEW IF EXISTS bfrs_bushfiresnapshot_v;
+    CREATE OR REPLACE VIEW bfrs_bushfiresnapshot_v AS
+    SELECT s.id,
+    s.bushfire_id,
+    s.origin_point,
+    COALESCE(s.fire_boundary, g.geometry) as fire_boundary,
+    CASE WHEN s.snapshot_type = {0} THEN 'Initial'
+         WHEN s.snapshot_type = {1} THEN 'Final'
+         ELSE ''
+    END as snapshot_type,
+    s.action,
+    to_char(s.created at time zone 'Australia/Perth','DD/MM/YYYY HH24:MI:SS') as created,
+    to_char(s.modified at time zone 'Australia/Perth','DD/MM/YYYY HH24:MI:SS') as modified,
+    s.name,
+    s.fire_number,
+    s.year::text || '/' || (s.year + 1)::text as financial_year,
+    s.reporting_year,
+    s.report_status,
+    s.area,
+    s.final_fire_boundary,
+    (SELECT username AS modifier FROM auth_user WHERE id = s.modifier_id),
+    (SELECT name AS region FROM bfrs_region WHERE id = s.region_id),
+    (SELECT name AS district FROM bfrs_district WHERE id = s.district_id)
+    FROM bfrs_bushfiresnapshot s LEFT JOIN bfrs_snapshotgeometry g ON s.fire_boundary_geometry_id = g.hash;
+    '''.format(SNAPSHOT_INITIAL,SNAPSHOT_FINAL))
+
 def create_all_views():
     create_bushfirelist_view()
     create_bushfire_view()
     create_final_fireboundary_view()
     create_fireboundary_view()
+    create_bushfiresnapshot_view()
 
 def drop_bushfirelist_view():
     try:
@@ -544,11 +579,20 @@ def drop_fireboundary_view():
     except:
         pass
 
+def drop_bushfiresnapshot_view():
+    try:
+        cursor=connection.cursor()
+        cursor.execute('''drop view if exists bfrs_bushfiresnapshot_v''')
+        return cursor.fetchall()
+    except:
+        pass
+
 def drop_all_views():
     drop_bushfirelist_view()
     drop_bushfire_view()
     drop_final_fireboundary_view()
     drop_fireboundary_view()
+    drop_bushfiresnapshot_view()
 
 
 
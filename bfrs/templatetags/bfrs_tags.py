@@ -10,7 +10,7 @@ import LatLon
 register = template.Library()
 
 @register.assignment_tag(takes_context=True)
-def is_init_authorised(context, bushfire_id):
+def is_init_authorised(context, bushfire):
     """
     Usage::
 
@@ -21,7 +21,7 @@ def is_init_authorised(context, bushfire_id):
         or
 
         {% for bushfire in object_list %}
-            {% is_init_authorised bushfire.id as init_authorised %}
+            {% is_init_authorised bushfire as init_authorised %}
             <tr>
                 <td>{{ bushfire.id }}</td>
                 <td><a href="{% url 'bushfire:bushfire_initial' bushfire.id %}">{{ bushfire.name }}</td>
@@ -31,10 +31,12 @@ def is_init_authorised(context, bushfire_id):
                 {% endif %}
             </tr>
         {% endfor %}
-    """
 
-    obj = Bushfire.objects.get(id=bushfire_id)
-    return obj.is_init_authorised
+        bushfire is the bushfire already loaded by the view (or its id, which costs a query)
+    """
+    if not isinstance(bushfire, Bushfire):
+        bushfire = Bushfire.objects.get(id=bushfire)
+    return bushfire.is_init_authorised
 
 #@register.filter
 #def date_fmt(dt):
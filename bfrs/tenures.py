@@ -0,0 +1,78 @@
+"""
+The tenure of the origin points, resolved against the local copies of the SSS tenure layers.
+
+SSS returns the first of its tenure layers (state forest, legislated lands and waters, dept interest lands and waters,
+other tenures and the SA/NT polygons) containing the origin point. The same layers, except the SA/NT polygons, are loaded
+into the reporting tables; resolve_tenures looks the points up in these tables in the same order of precedence,
+with one query (an indexed spatial join per layer) per batch of points.
+A point outside all the local layers is not resolved (None); it may be in a layer only SSS has.
+
+To Test:
+    from bfrs.models import Bushfire
+    from bfrs.tenures import resolve_tenures
+    resolve_tenures(dict(Bushfire.objects.filter(reporting_year=2019).values_list('id', 'origin_point')))
+"""
+from django.conf import settings
+from django.db import connection
+
+import logging
+logger = logging.getLogger(__name__)
+
+#(SSS layer id, local table, geometry column, category column) in the order of precedence
+TENURE_LAYERS = [
+    ("state_forest_plantation_distribution", "reporting_state_forest", "shape", "fbr_fire_report_classification"),
+    ("legislated_lands_and_waters", "reporting_dept_managed", "geometry", "category"),
+    ("dept_interest_lands_and_waters", "reporting_dept_interest", "geometry", "category"),
+    ("other_tenures_new", "reporting_cadastre", "shape", "brc_fms_legend"),
+]
+
+RESOLVE_TENURES_SQL = """
+SELECT p.id, {categories}
+FROM unnest(%s::integer[], %s::text[]) AS p(id, ewkt)
+{joins}
+""".format(
+    categories=", ".join(["l{}.category".format(i) for i in range(len(TENURE_LAYERS))]),
+    joins="\n".join([
+        "LEFT JOIN LATERAL (SELECT {3} AS category FROM {1} WHERE ST_Within(ST_GeomFromEWKT(p.ewkt), {2}) LIMIT 1) l{0} ON true".format(i, *layer[1:])
+        for i, layer in enumerate(TENURE_LAYERS)
+    ])
+)
+
+
+def resolve_tenures(points, batch_size=None):
+    """
+    points: {key (an integer, e.g. the bushfire id): origin point}
+    Return {key: (SSS layer id, tenure category)}, the value is None if the point is not within any local tenure layer
+    """
+    batch_size = batch_size or settings.LOCAL_TENURE_BATCH_SIZE
+    keys = [key for key, point in points.iteritems() if point]
+    result = dict([(key, None) for key in points.iterkeys()])
+    with connection.cursor() as cursor:
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            cursor.execute(RESOLVE_TENURES_SQL, [batch, [points[key].ewkt for key in batch]])
+            for row in cursor.fetchall():
+                for (layer_id, table, geometry_column, category_column), category in zip(TENURE_LAYERS, row[1:]):
+                    if category:
+                        result[row[0]] = (layer_id, category)
+                        break
+    return result
+
+
+def resolve_tenure(point):
+    """ (SSS layer id, tenure category) of the point, None if it is not within any local tenure layer """
+    return resolve_tenures({0: point}).get(0) if point else None
+
+
+def client_tenure_data(tenure):
+    """ The resolved tenure in the format of the tenure_ignition_point posted by the SSS client (None if not resolved) """
+    if not tenure:
+        return None
+    return {"id": tenure[0], "category": tenure[1]}
+
+
+def sss_tenure_data(tenure):
+    """ The resolved tenure in the format of the SSS origin point tenure result ({} if not resolved) """
+    if not tenure:
+        return {}
+    return {"id": tenure[0], "feature": {"category": tenure[1]}}
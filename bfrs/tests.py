@@ -2,13 +2,19 @@ import tempfile
 import os
 import shutil
 import subprocess
+import time
 
-from django.test import TestCase
+from django.test import TestCase, Client
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from bfrs.models import Bushfire
+from bfrs.models import Bushfire, District, BushfireProperty, Damage, Injury, AreaBurnt
 from bfrs import utils
+from bfrs.tenures import resolve_tenures
 
 # Create your tests here.
 
@@ -38,3 +44,172 @@ def test_send_fire_bomging_req_email(bushfire=None,user_email=None):
 
 
 
+def test_export_excel_queries(sizes=(10,100,1000)):
+    """
+    Check the number of queries used by utils.export_excel doesn't depend on the number of bushfires exported
+    """
+    queries = []
+    for size in sizes:
+        ids = list(Bushfire.objects.order_by('-id').values_list('id',flat=True)[:size])
+        qs = Bushfire.objects.filter(id__in=ids)
+        with CaptureQueriesContext(connection) as context:
+            started = time.time()
+            utils.export_excel(None,qs)
+            elapsed = time.time() - started
+        queries.append(len(context.captured_queries))
+        print("bushfires = {}, queries = {}, time = {:.2f}s".format(len(ids),len(context.captured_queries),elapsed))
+
+    assert len(set(queries)) == 1,"The number of queries depends on the number of bushfires: {}".format(queries)
+
+
+def test_bushfire_list_queries(username=None,pages=(1,2),max_queries=20):
+    """
+    Check the bushfire list page costs a fixed number of queries, not one or more per row
+    """
+    user = User.objects.get(username=username) if username else User.objects.filter(is_superuser=True).first()
+    client = Client()
+    client.force_login(user)
+    for page in pages:
+        with CaptureQueriesContext(connection) as context:
+            started = time.time()
+            response = client.get(reverse('main'),{"page":page,"include_archived":"on"})
+            elapsed = time.time() - started
+        rows = len(response.context["object_list"]) if response.context else 0
+        print("page = {}, rows = {}, queries = {}, time = {:.2f}s".format(page,rows,len(context.captured_queries),elapsed))
+        assert response.status_code == 200,"The bushfire list page {} returns {}".format(page,response.status_code)
+        assert len(context.captured_queries) <= max_queries,"The bushfire list page {} with {} rows costs {} queries".format(page,rows,len(context.captured_queries))
+
+
+def invalidate_bushfire_by_rows(obj, user, cur_obj):
+    """
+    The previous (row by row) implementation of utils.invalidate_bushfire, the reference of test_invalidate_bushfire
+    """
+    with transaction.atomic():
+        cur_obj.report_status = Bushfire.STATUS_INVALIDATED
+        cur_obj.invalid_details = obj.invalid_details or "Moved from '{}' to '{}'".format(cur_obj.district.name,obj.district.name)
+        cur_obj.modifier = user
+        cur_obj.sss_id = None
+        cur_obj.save(update_fields=["report_status","invalid_details","modifier","modified","sss_id"])
+
+        obj.pk = None
+        reusable_invalidated_objs = cur_obj.bushfire_invalidated.filter(district=obj.district,report_status=Bushfire.STATUS_INVALIDATED)
+        linked_bushfire = None
+        if reusable_invalidated_objs:
+            linked_bushfire = reusable_invalidated_objs[0]
+            obj.fire_number = linked_bushfire.fire_number
+            linked_bushfire.fire_number = 'DE{}'.format(linked_bushfire.fire_number[2:])
+            linked_bushfire.save(update_fields=["fire_number"])
+        else:
+            obj.fire_number = ' '.join(['BF', str(obj.year), obj.district.code, '{0:03d}'.format(obj.next_id(obj.district))])
+
+        obj.region = obj.district.region
+        obj.valid_bushfire = None
+        obj.fire_not_found = False
+        obj.invalid_details = None
+        obj.save()
+
+        if linked_bushfire:
+            for doc in linked_bushfire.uploaded_documents.all():
+                obj.uploaded_documents.add(doc)
+            for doc in linked_bushfire.documents.all():
+                obj.documents.add(doc)
+            linked_bushfire.delete()
+
+        for linked in cur_obj.bushfire_invalidated.all():
+            obj.bushfire_invalidated.add(linked)
+
+        def copy_fk_records(obj_id, fk_set, create_new=True):
+            for record in fk_set.all():
+                if create_new:
+                    record.id = None
+                record.bushfire_id = obj_id
+                record.save()
+
+        copy_fk_records(obj.id, cur_obj.properties)
+        copy_fk_records(obj.id, cur_obj.damages)
+        copy_fk_records(obj.id, cur_obj.injuries)
+        copy_fk_records(obj.id, cur_obj.tenures_burnt)
+        copy_fk_records(obj.id, cur_obj.snapshots, create_new=False)
+
+        cur_obj.valid_bushfire = obj
+        cur_obj.save(update_fields=["valid_bushfire"])
+
+        for doc in cur_obj.documents.all():
+            obj.documents.add(doc)
+
+        if obj.report_status >= Bushfire.STATUS_FINAL_AUTHORISED:
+            utils.serialize_bushfire('Final', 'Update District ({} --> {})'.format(cur_obj.district.code, obj.district.code), obj)
+
+    return (obj,True)
+
+
+def invalidated_bushfire_state(cur_obj, obj, snapshot_ids):
+    """
+    The data of the invalidated and the new bushfire, without the ids and timestamps which differ between runs
+    """
+    def records(model):
+        fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key and f.name != "bushfire"]
+        return sorted(model.objects.filter(bushfire=obj).values_list(*fields))
+
+    cur_obj = Bushfire.objects.get(pk=cur_obj.pk)
+    return {
+        "invalidated": (cur_obj.report_status, cur_obj.invalid_details, cur_obj.sss_id, cur_obj.valid_bushfire_id == obj.id),
+        "bushfire": (obj.fire_number, obj.region_id, obj.district_id, obj.report_status),
+        "records": dict([(model.__name__, records(model)) for model in (BushfireProperty, Damage, Injury, AreaBurnt)]),
+        "snapshots": sorted([(s.id if s.id in snapshot_ids else None, s.snapshot_type, s.action) for s in obj.snapshots.all()]),
+        "documents": sorted(obj.documents.values_list("id", flat=True)),
+        "uploaded_documents": sorted(obj.uploaded_documents.values_list("id", flat=True)),
+        "linked": sorted(obj.bushfire_invalidated.values_list("fire_number", flat=True)),
+    }
+
+
+def test_local_tenure_resolver(limit=100):
+    """
+    Check the tenure of a bushfire, whose origin point is within a local tenure layer, is resolved through the bushfire spatial api
+    """
+    from tastypie.bundle import Bundle
+    from bfrs.api import BushfireSpatialResource
+    points = dict(Bushfire.objects.exclude(origin_point=None).order_by('-id').values_list('id','origin_point')[:limit])
+    tenures = [(key,tenure) for key,tenure in resolve_tenures(points).iteritems() if tenure]
+    if not tenures:
+        raise Exception("None of the {} bushfires is within a local tenure layer".format(len(points)))
+    bushfire_id,(layer_id,category) = tenures[0]
+    bushfire = Bushfire.objects.get(id=bushfire_id)
+    bundle = Bundle(obj=bushfire,data={'tenure_ignition_point':None})
+    with override_settings(TENURE_RESOLVER='local'):
+        BushfireSpatialResource().hydrate_tenure_ignition_point(bundle)
+    print("bushfire = {}, layer = {}, category = {}, tenure = {}".format(bushfire.fire_number,layer_id,category,bushfire.tenure))
+    assert bundle.data['tenure_ignition_point'] == {"id":layer_id,"category":category}
+    assert bushfire.tenure == utils.get_tenure(category)
+
+
+def test_invalidate_bushfire(bushfire, district, username=None):
+    """
+    Check utils.invalidate_bushfire moves the bushfire to the district the same way as the previous row by row implementation.
+    Both implementations run in a transaction which is rolled back
+    """
+    if isinstance(bushfire, int):
+        bushfire = Bushfire.objects.get(id=bushfire)
+    elif isinstance(bushfire, basestring):
+        bushfire = Bushfire.objects.get(fire_number=bushfire)
+    if not isinstance(district, District):
+        district = District.objects.get(code=district)
+    user = User.objects.get(username=username) if username else User.objects.filter(is_superuser=True).first()
+    snapshot_ids = set(bushfire.snapshots.values_list("id", flat=True))
+
+    results = []
+    for name, invalidate in (("row by row", invalidate_bushfire_by_rows), ("set based", utils.invalidate_bushfire)):
+        with transaction.atomic():
+            cur_obj = Bushfire.objects.get(pk=bushfire.pk)
+            obj = Bushfire.objects.get(pk=bushfire.pk)
+            obj.district = district
+            with CaptureQueriesContext(connection) as context:
+                started = time.time()
+                obj, invalidated = invalidate(obj, user, cur_obj)
+                elapsed = time.time() - started
+            results.append(invalidated_bushfire_state(cur_obj, obj, snapshot_ids))
+            transaction.set_rollback(True)
+        print("{}: queries = {}, time = {:.2f}s".format(name, len(context.captured_queries), elapsed))
+
+    for key in results[0]:
+        assert results[0][key] == results[1][key], "{} differs: {} != {}".format(key, results[0][key], results[1][key])
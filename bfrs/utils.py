@@ -15,8 +15,8 @@ from bfrs.models import (Bushfire, BushfireSnapshot, District, Region,BushfirePr
     check_mandatory_fields,
     DocumentTag
     )
-from django.db import IntegrityError, transaction
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction, connection
+from django.http import HttpResponse, StreamingHttpResponse
 from django.core.mail import send_mail
 from cStringIO import StringIO
 from django.core.mail import EmailMessage
@@ -31,18 +31,19 @@ import unicodecsv
 from django.utils.encoding import smart_str
 from datetime import datetime
 from django.core import serializers
-from xlwt import Workbook
-from itertools import count
+from bfrs.excel import new_workbook, excel_extension, excel_content_type
 from django.forms.models import inlineformset_factory
 from collections import defaultdict, OrderedDict
 from copy import deepcopy
 from django.core.urlresolvers import reverse
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 import requests
 from requests.auth import HTTPBasicAuth
 from dateutil import tz
 from dfes import P1CAD
+from multiprocessing.pool import ThreadPool
 import os
+import time
 
 import logging
 logger = logging.getLogger(__name__)
@@ -96,32 +97,49 @@ def model_to_dict(instance, include=[], exclude=[]):
     return {f.attname: getattr(instance, f.attname) for f in fields if f.name not in exclude}
 
 def serialize_bushfire(auth_type, action, obj):
+    """
+    Create the snapshot of the bushfire and its properties, damages, injuries and area burnt.
+    Each child type is read with one query (or from the prefetched objects) and written with one bulk insert,
+    so the cost of a snapshot doesn't depend on the number of children
+    """
     action = action if action else 'Update'
     snapshot_type = SNAPSHOT_INITIAL if auth_type == 'initial' else SNAPSHOT_FINAL
     d = model_to_dict(obj, exclude=['id', 'created', 'modified'])
-    s = BushfireSnapshot.objects.create(snapshot_type=snapshot_type, action=action, bushfire_id=obj.id, **d)
 
-    # create the formset snapshots and attach the bushfire_snapshot
-    for i in obj.properties.all():
-        BushfirePropertySnapshot.objects.create(
-            snapshot_id=s.id, snapshot_type=snapshot_type, name=i.name, value=i.value
-        )
+    with transaction.atomic():
+        s = BushfireSnapshot.objects.create(snapshot_type=snapshot_type, action=action, bushfire_id=obj.id, **d)
 
-    for i in obj.damages.all():
-        damage_obj = DamageSnapshot.objects.create(
-            #snapshot_id=s.id, snapshot_type=snapshot_type, damage_type=i.damage_type, number=i.number, creator=obj.modifier, modifier=obj.modifier
-            snapshot_id=s.id, snapshot_type=snapshot_type, damage_type=i.damage_type, number=i.number, descr=i.descr, creator=obj.modifier, modifier=obj.modifier
-        )
+        # create the formset snapshots and attach the bushfire_snapshot
+        BushfirePropertySnapshot.objects.bulk_create([
+            BushfirePropertySnapshot(snapshot_id=s.id, snapshot_type=snapshot_type, name=i.name, value=i.value)
+            for i in obj.properties.all()
+        ])
 
-    for i in obj.injuries.all():
-        injury_obj = InjurySnapshot.objects.create(
-            snapshot_id=s.id, snapshot_type=snapshot_type, injury_type=i.injury_type, number=i.number, creator=obj.modifier, modifier=obj.modifier
-        )
+        DamageSnapshot.objects.bulk_create([
+            DamageSnapshot(
+                snapshot_id=s.id, snapshot_type=snapshot_type, damage_type_id=i.damage_type_id, number=i.number, descr=i.descr,
+                creator_id=obj.modifier_id, modifier_id=obj.modifier_id
+            )
+            for i in obj.damages.all()
+        ])
 
-    for i in obj.tenures_burnt.all():
-        tenure_burnt_obj = AreaBurntSnapshot.objects.create(
-            snapshot_id=s.id, snapshot_type=snapshot_type, tenure_id=i.tenure_id, area=i.area, creator=obj.modifier, modifier=obj.modifier
-        )
+        InjurySnapshot.objects.bulk_create([
+            InjurySnapshot(
+                snapshot_id=s.id, snapshot_type=snapshot_type, injury_type_id=i.injury_type_id, number=i.number,
+                creator_id=obj.modifier_id, modifier_id=obj.modifier_id
+            )
+            for i in obj.injuries.all()
+        ])
+
+        AreaBurntSnapshot.objects.bulk_create([
+            AreaBurntSnapshot(
+                snapshot_id=s.id, snapshot_type=snapshot_type, tenure_id=i.tenure_id, area=i.area,
+                creator_id=obj.modifier_id, modifier_id=obj.modifier_id
+            )
+            for i in obj.tenures_burnt.all()
+        ])
+
+    return s
 
 def archive_snapshot(auth_type, action, obj):
         """ 
@@ -139,6 +157,18 @@ def archive_snapshot(auth_type, action, obj):
             bushfire_id = obj.id
         )
 
+def copy_bushfire_records(model, from_id, to_id):
+    """
+    Copy the records of a bushfire (properties, damages, injuries or area burnt) to another bushfire with one INSERT ... SELECT
+    return the number of copied records
+    """
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ",".join(['"{}"'.format(f.column) for f in fields])
+    values = ",".join(["%s" if f.name == "bushfire" else '"{}"'.format(f.column) for f in fields])
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO {0} ({1}) SELECT {2} FROM {0} WHERE bushfire_id = %s ORDER BY id".format(model._meta.db_table, columns, values), [to_id, from_id])
+        return cursor.rowcount
+
 def invalidate_bushfire(obj, user,cur_obj=None):
     """ 
         Invalidate the current bushfire, create new bushfire report with new fire_number and data in obj and update links, including historical links if the bushfire need to be invalidated
@@ -187,45 +217,28 @@ def invalidate_bushfire(obj, user,cur_obj=None):
     
         #move documents to new created bushfire
         if linked_bushfire:
-            for doc in linked_bushfire.uploaded_documents.all():
-                obj.uploaded_documents.add(doc)
-
-            for doc in linked_bushfire.documents.all():
-                obj.documents.add(doc)
+            linked_bushfire.uploaded_documents.update(upload_bushfire=obj)
+            linked_bushfire.documents.update(bushfire=obj)
 
             #delete the previous bushfires because a new one is already created
             linked_bushfire.delete()
 
-        # link the new bushfire to the old invalidated bushfire
-        created = datetime.now(tz=pytz.utc)
-
         # move all links from the above invalidated bushfire to the new bushfire
-        for linked in cur_obj.bushfire_invalidated.all():
-            obj.bushfire_invalidated.add(linked)
-
-        def copy_fk_records(obj_id, fk_set, create_new=True):
-            # create duplicate injury records and associate them with the new object
-            for record in fk_set.all():
-                if create_new:
-                    record.id = None
-                record.bushfire_id = obj_id 
-                record.save()
-
-        copy_fk_records(obj.id, cur_obj.properties)
-        copy_fk_records(obj.id, cur_obj.damages)
-        copy_fk_records(obj.id, cur_obj.injuries)
-        copy_fk_records(obj.id, cur_obj.tenures_burnt)
+        cur_obj.bushfire_invalidated.update(valid_bushfire=obj)
+
+        # copy the properties, damages, injuries and area burnt to the new bushfire
+        for model in (BushfireProperty, Damage, Injury, AreaBurnt):
+            copy_bushfire_records(model, cur_obj.id, obj.id)
 
         # update Bushfire Snapshots to the new bushfire_id and then create a new snapshot
-        copy_fk_records(obj.id, cur_obj.snapshots, create_new=False)
+        cur_obj.snapshots.update(bushfire=obj, modified=timezone.now())
 
         # link the old invalidate bushfire to the new (valid) bushfire - fwd link
         cur_obj.valid_bushfire = obj
         cur_obj.save(update_fields=["valid_bushfire"])
 
         #move the documents to new bushfire
-        for doc in cur_obj.documents.all():
-            obj.documents.add(doc)
+        cur_obj.documents.update(bushfire=obj)
 
         if obj.report_status >= Bushfire.STATUS_FINAL_AUTHORISED:
             serialize_bushfire('Final', 'Update District ({} --> {})'.format(cur_obj.district.code, obj.district.code), obj)
@@ -1447,6 +1460,33 @@ def refresh_gokart(request, fire_number=None, region=None, district=None, action
     }
     request.session.modified = True
 
+#the keep-alive session used for the PBS requests, created on first use
+_pbs_session = None
+#fire_id -> (expiry time, PBS fire or None if not found in PBS)
+_pbs_fire_cache = {}
+
+def get_pbs_session():
+    global _pbs_session
+    if _pbs_session is None:
+        session = requests.Session()
+        session.auth = HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=settings.PBS_REQUEST_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _pbs_session = session
+    return _pbs_session
+
+
+def request_pbs_bushfires(params=None):
+    """ One request to the PBS prescribed burn api """
+    pbs_url = settings.PBS_URL if settings.PBS_URL.endswith('/') else settings.PBS_URL + '/'
+    url = pbs_url + 'api/v1/prescribedburn/?format=json'
+    resp = get_pbs_session().get(url=url, params=params, timeout=settings.PBS_REQUEST_TIMEOUT)
+    logger.info("r.url: " + resp.url)
+    resp.raise_for_status()
+    return resp.json()
+
+
 def get_pbs_bushfires(fire_ids=None):
     """ 
         fire_ids: string --> BF_2017_SWC_001, BF_2017_SWC_002, BF_2017_SWC_003", OR
@@ -1457,252 +1497,342 @@ def get_pbs_bushfires(fire_ids=None):
             {'fire_id': u'BF_2017_SWC_001', 'area': '0.3', 'region': 1},
             {'fire_id': u'BF_2017_DON_001', 'area': '2.3', 'region': 2}
         ]
+
+        The fires are cached for settings.PBS_CACHE_TIMEOUT seconds; the fires not in the cache are requested
+        in chunks of settings.PBS_REQUEST_CHUNK_SIZE fire ids, settings.PBS_REQUEST_WORKERS requests at a time.
     """
     try:
         logger.info("fire_ids: " + str(fire_ids))
-        if fire_ids:
-            if isinstance(fire_ids, list):
-                params = {"fire_id__in": ','.join(fire_ids)}
-            else:
-                params = {"fire_id__in": fire_ids}
-        elif isinstance(fire_ids, list) and len(fire_ids) == 0:
+        if isinstance(fire_ids, list) and len(fire_ids) == 0:
             """ case where there are no outstanding fires in BFRS """
             return 
-        else:
-            params = None
-        pbs_url = settings.PBS_URL if settings.PBS_URL.endswith('/') else settings.PBS_URL + os.sep
-        url = pbs_url + 'api/v1/prescribedburn/?format=json'
-        logger.info("r.url: " + requests.get(url=url, params=params, auth=requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO)).url)
-        return requests.get(url=url, params=params, auth=requests.auth.HTTPBasicAuth(settings.USER_SSO, settings.PASS_SSO)).json()
+        elif not fire_ids:
+            return request_pbs_bushfires()
+        elif not isinstance(fire_ids, list):
+            fire_ids = [i.strip() for i in fire_ids.split(',') if i.strip()]
+
+        now = time.time()
+        missing = [i for i in set(fire_ids) if i not in _pbs_fire_cache or _pbs_fire_cache[i][0] < now]
+        if missing:
+            chunk_size = settings.PBS_REQUEST_CHUNK_SIZE
+            chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+            params = [{"fire_id__in": ','.join(chunk)} for chunk in chunks]
+            if len(chunks) == 1:
+                results = [request_pbs_bushfires(params[0])]
+            else:
+                pool = ThreadPool(min(len(chunks), settings.PBS_REQUEST_WORKERS))
+                try:
+                    results = pool.map(request_pbs_bushfires, params)
+                finally:
+                    pool.close()
+
+            expiry = time.time() + settings.PBS_CACHE_TIMEOUT
+            for fire_id in missing:
+                #cache the fires not returned by PBS too
+                _pbs_fire_cache[fire_id] = (expiry, None)
+            for result in results:
+                for fire in result:
+                    _pbs_fire_cache[fire['fire_id']] = (expiry, fire)
+
+        fires = [_pbs_fire_cache[i][1] for i in OrderedDict.fromkeys(fire_ids) if i in _pbs_fire_cache]
+        return [f for f in fires if f is not None]
     except Exception as e:
-        logger.error('REST API error connecting to PBS 268b bushfires:  {}\n{}\n'.format(url, e))
+        logger.error('REST API error connecting to PBS 268b bushfires:  {}\n{}\n'.format(settings.PBS_URL, e))
         return []
    
 
+EXPORT_CHUNK_SIZE = 500
+
+#the foreign keys written by the bushfire exports
+EXPORT_RELATED_FIELDS = ('region', 'district', 'cause', 'field_officer', 'duty_officer', 'init_authorised_by', 'authorised_by',
+    'first_attack', 'initial_control', 'final_control')
+
+def iterate_in_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the objects of the queryset in the queryset's order, fetching chunk_size objects per query,
+    so the memory used doesn't grow with the size of the queryset. Only the ids are fetched up front.
+    """
+    ids = list(queryset.values_list('id', flat=True))
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        objs = dict([(obj.id, obj) for obj in queryset.filter(id__in=chunk).order_by().iterator()])
+        for obj_id in chunk:
+            if obj_id in objs:
+                yield objs[obj_id]
+
+
+class CsvBuffer(object):
+    """
+    A file like object for the csv writer, which keeps the written data until it is read by the streaming response
+    """
+    def __init__(self):
+        self.data = []
+
+    def write(self, value):
+        self.data.append(value)
+
+    def read(self):
+        data = "".join(self.data)
+        self.data = []
+        return data
+
+
+EXPORT_FINAL_CSV_HEADER = [
+    "ID",
+    "Region",
+    "District",
+    "Name",
+    "Year",
+    "Incident No",
+    "DFES Incident No",
+    "Job Code",
+    "Fire Level",
+    "Media Alert Req",
+    "Investigation Req",
+    "Fire Position",
+    #"Origin Point",
+    #"Fire Boundary",
+    "Fire Not Found",
+    "Other Info",
+    "Cause",
+    "Other Cause",
+    "Field Officer",
+    "Duty Officer",
+    "Init Authorised By",
+    "Init Authorised Date",
+    "Authorised By",
+    "Authorised Date",
+    "Dispatch P&W",
+    "Dispatch Aerial",
+    "Fire Detected",
+    "Fire Controlled",
+    "Fire Contained",
+    "Fire Safe",
+    "Fuel Type",
+    #"Initial Snapshot",
+    "First Attack",
+    "Other First Attack",
+    "Initial Control",
+    "Other Initial Control",
+    "Final Control",
+    "Other Final Control",
+    "Arson Squad Notified",
+    "Offence No",
+    "Area",
+    "Authorised By",
+    "Authorised Date",
+    "Report Status",
+]
+
+def export_final_csv_row(obj):
+    return [
+        smart_str( obj.id),
+        smart_str( obj.region.name),
+        smart_str( obj.district.name),
+        smart_str( obj.name),
+        smart_str( obj.year),
+        smart_str( obj.fire_number),
+        smart_str( obj.dfes_incident_no),
+        smart_str( obj.job_code),
+        smart_str( obj.get_prob_fire_level_display()),
+        smart_str( obj.media_alert_req),
+        smart_str( obj.investigation_req),
+        smart_str( obj.fire_position),
+        #smart_str( obj.origin_point),
+        #smart_str( obj.fire_boundary),
+        smart_str( obj.fire_not_found),
+        smart_str( obj.other_info),
+        smart_str( obj.cause),
+        smart_str( obj.other_cause),
+        smart_str( obj.field_officer.get_full_name() if obj.field_officer else None ),
+        smart_str( obj.duty_officer.get_full_name() if obj.duty_officer else None ),
+        smart_str( obj.init_authorised_by.get_full_name() if obj.init_authorised_by else None ),
+        smart_str( obj.init_authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.init_authorised_date else None),
+        smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
+        smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None),
+        smart_str( obj.dispatch_pw_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_pw_date else None),
+        smart_str( obj.dispatch_aerial_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_aerial_date else None),
+        smart_str( obj.fire_detected_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_detected_date else None),
+        smart_str( obj.fire_controlled_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_controlled_date else None),
+        smart_str( obj.fire_contained_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_contained_date else None),
+        smart_str( obj.fire_safe_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_safe_date else None),
+        #bushfire has no fuel type any more, keep the column for the consumers of the csv
+        smart_str( None),
+        #smart_str( obj.initial_snapshot),
+        smart_str( obj.first_attack),
+        smart_str( obj.other_first_attack),
+        smart_str( obj.initial_control),
+        smart_str( obj.other_initial_control),
+        smart_str( obj.final_control),
+        smart_str( obj.other_final_control),
+        smart_str( obj.arson_squad_notified),
+        smart_str( obj.offence_no),
+        smart_str( obj.area),
+        smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
+        smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None ),
+        smart_str( obj.get_report_status_display()),
+    ]
+
 def export_final_csv(request, queryset):
-    #import csv
+    """
+    Stream the bushfires as csv; the rows are written as they are fetched (in chunks, with the foreign keys joined),
+    so the first byte is sent immediately and the memory used doesn't depend on the number of bushfires.
+    """
     filename = 'export_final-' + datetime.now().strftime('%Y-%m-%dT%H%M%S') + '.csv'
-    response = HttpResponse(content_type='text/csv')
+    queryset = queryset.select_related(*EXPORT_RELATED_FIELDS)
+
+    def rows():
+        buff = CsvBuffer()
+        writer = unicodecsv.writer(buff, quoting=unicodecsv.QUOTE_ALL)
+        writer.writerow(EXPORT_FINAL_CSV_HEADER)
+        yield buff.read()
+        for obj in iterate_in_chunks(queryset):
+            writer.writerow(export_final_csv_row(obj))
+            yield buff.read()
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename=' + filename
-    writer = unicodecsv.writer(response, quoting=unicodecsv.QUOTE_ALL)
-
-    writer.writerow([
-        "ID",
-		"Region",
-		"District",
-		"Name",
-		"Year",
-		"Incident No",
-		"DFES Incident No",
-		"Job Code",
-		"Fire Level",
-		"Media Alert Req",
-		"Investigation Req",
-		"Fire Position",
-		#"Origin Point",
-		#"Fire Boundary",
-		"Fire Not Found",
-		"Other Info",
-		"Cause",
-		"Other Cause",
-		"Field Officer",
-		"Duty Officer",
-		"Init Authorised By",
-		"Init Authorised Date",
-		"Authorised By",
-		"Authorised Date",
-		"Dispatch P&W",
-		"Dispatch Aerial",
-		"Fire Detected",
-		"Fire Controlled",
-		"Fire Contained",
-		"Fire Safe",
-		"Fuel Type",
-		#"Initial Snapshot",
-		"First Attack",
-		"Other First Attack",
-		"Initial Control",
-		"Other Initial Control",
-		"Final Control",
-		"Other Final Control",
-		"Arson Squad Notified",
-		"Offence No",
-		"Area",
-		"Authorised By",
-		"Authorised Date",
-		"Report Status",
-    ]
-	)
-    for obj in queryset:
-		writer.writerow([
-			smart_str( obj.id),
-			smart_str( obj.region.name),
-			smart_str( obj.district.name),
-			smart_str( obj.name),
-			smart_str( obj.year),
-			smart_str( obj.fire_number),
-			smart_str( obj.dfes_incident_no),
-			smart_str( obj.job_code),
-			smart_str( obj.get_prob_fire_level_display()),
-			smart_str( obj.media_alert_req),
-			smart_str( obj.investigation_req),
-			smart_str( obj.fire_position),
-			#row.write(col_no(), smart_str( obj.origin_point)),
-			#row.write(col_no(), smart_str( obj.fire_boundary),
-			smart_str( obj.fire_not_found),
-			smart_str( obj.other_info),
-			smart_str( obj.cause),
-			smart_str( obj.other_cause),
-			smart_str( obj.field_officer.get_full_name() if obj.field_officer else None ),
-			smart_str( obj.duty_officer.get_full_name() if obj.duty_officer else None ),
-			smart_str( obj.init_authorised_by.get_full_name() if obj.init_authorised_by else None ),
-			smart_str( obj.init_authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.init_authorised_date else None),
-			smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
-			smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None),
-			smart_str( obj.dispatch_pw_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_pw_date else None),
-			smart_str( obj.dispatch_aerial_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_aerial_date else None),
-			smart_str( obj.fire_detected_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_detected_date else None),
-			smart_str( obj.fire_controlled_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_controlled_date else None),
-			smart_str( obj.fire_contained_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_contained_date else None),
-			smart_str( obj.fire_safe_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_safe_date else None),
-			smart_str( obj.fuel_type),
-			#row.write(col_no(), smart_str( obj.initial_snapshot),
-			smart_str( obj.first_attack),
-			smart_str( obj.other_first_attack),
-			smart_str( obj.initial_control),
-			smart_str( obj.other_initial_control),
-			smart_str( obj.final_control),
-			smart_str( obj.other_final_control),
-			smart_str( obj.arson_squad_notified),
-			smart_str( obj.offence_no),
-			smart_str( obj.area),
-			smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
-			smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None ),
-			smart_str( obj.get_report_status_display()),
-        ])
     return response
 export_final_csv.short_description = u"Export CSV (Final)"
 
 
+EXPORT_EXCEL_HEADER = [
+    "ID",
+    "Region",
+    "District",
+    "Name",
+    "Year",
+    "Fire Number",
+    "DFES Incident No",
+    "Job Code",
+    "Probable Fire Level",
+    "Max Fire Level",
+    "Media Alert Req",
+    "Investigation Req",
+    "Fire Position",
+    #"Origin Point",
+    #"Fire Boundary",
+    "Fire Not Found",
+    "Other Info",
+    "Cause",
+    "Other Cause",
+    "Field Officer",
+    "Duty Officer",
+    "Init Authorised By",
+    "Init Authorised Date",
+    "Authorised By",
+    "Authorised Date",
+    "Dispatch P&W",
+    "Dispatch Aerial",
+    "Fire Detected",
+    "Fire Controlled",
+    "Fire Contained",
+    "Fire Safe",
+    #"Fuel Type",
+    "First Attack",
+    "Other First Attack",
+    "Initial Control",
+    "Other Initial Control",
+    "Final Control",
+    "Other Final Control",
+    "Arson Squad Notified",
+    "Offence No",
+    "Area",
+    "Authorised By",
+    "Authorised Date",
+    "Report Status",
+    "Tenures of Area Burnt",
+    "Damage",
+    "Injuries and Fatalities",
+]
+
+def export_excel_rows(queryset):
+    """
+    Yield a tuple of the column values of each bushfire.
+    The foreign keys are joined and the area burnt, damages and injuries are prefetched (with their types),
+    so the number of queries doesn't depend on the number of bushfires.
+    """
+    queryset = queryset.select_related(*EXPORT_RELATED_FIELDS).prefetch_related(
+        Prefetch('tenures_burnt', queryset=AreaBurnt.objects.select_related('tenure')),
+        Prefetch('damages', queryset=Damage.objects.select_related('damage_type')),
+        Prefetch('injuries', queryset=Injury.objects.select_related('injury_type')),
+    )
+    for obj in queryset:
+        tenures_burnt = obj.tenures_burnt.all()
+        damages = obj.damages.all()
+        injuries = obj.injuries.all()
+        yield (
+            obj.id,
+            obj.region.name,
+            obj.district.name,
+            obj.name,
+            obj.year,
+            obj.fire_number,
+            obj.dfes_incident_no if obj.dfes_incident_no else None,
+            obj.job_code if obj.job_code else None,
+            smart_str( obj.get_prob_fire_level_display() if obj.prob_fire_level else None),
+            smart_str( obj.get_max_fire_level_display() if obj.max_fire_level else None),
+            smart_str( obj.media_alert_req if obj.media_alert_req else None),
+            smart_str( obj.investigation_req if obj.investigation_req else None),
+            smart_str( obj.fire_position if obj.fire_position else None),
+            #smart_str( obj.origin_point),
+            #smart_str( obj.fire_boundary),
+            smart_str( obj.fire_not_found if obj.fire_not_found else None),
+            smart_str( obj.other_info if obj.other_info else None),
+            smart_str( obj.cause if obj.cause else None),
+            smart_str( obj.other_cause if obj.other_cause else None),
+            smart_str( obj.field_officer.get_full_name() if obj.field_officer else None ),
+            smart_str( obj.duty_officer.get_full_name() if obj.duty_officer else None ),
+            smart_str( obj.init_authorised_by.get_full_name() if obj.init_authorised_by else None ),
+            smart_str( obj.init_authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.init_authorised_date else None),
+            smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
+            smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None),
+            smart_str( obj.dispatch_pw_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_pw_date else None),
+            smart_str( obj.dispatch_aerial_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_aerial_date else None),
+            smart_str( obj.fire_detected_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_detected_date else None),
+            smart_str( obj.fire_controlled_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_controlled_date else None),
+            smart_str( obj.fire_contained_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_contained_date else None),
+            smart_str( obj.fire_safe_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_safe_date else None),
+            smart_str( obj.first_attack if obj.first_attack else None),
+            smart_str( obj.other_first_attack if obj.other_first_attack else None),
+            smart_str( obj.initial_control if obj.initial_control else None),
+            smart_str( obj.other_initial_control if obj.other_initial_control else None),
+            smart_str( obj.final_control if obj.final_control else None),
+            smart_str( obj.other_final_control if obj.other_final_control else None),
+            smart_str( obj.arson_squad_notified if obj.arson_squad_notified else None),
+            obj.offence_no if obj.offence_no else None,
+            obj.area if obj.area else None,
+            smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ),
+            smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None ),
+            smart_str( obj.get_report_status_display() if obj.report_status else None),
+            smart_str( '; '.join(['(name={}, area={})'.format(i.tenure.name, i.area) for i in tenures_burnt]) ),
+            smart_str( '; '.join(['(name={}, number={})'.format(i.damage_type.name, i.number) for i in damages]) if damages else None),
+            smart_str( '; '.join(['(name={}, number={})'.format(i.injury_type.name, i.number) for i in injuries]) if injuries else None ),
+        )
+
 def export_excel(request, queryset):
 
-    filename = 'export_final-' + datetime.now().strftime('%Y-%m-%dT%H%M%S') + '.xls'
+    filename = 'export_final-' + datetime.now().strftime('%Y-%m-%dT%H%M%S') + '.' + excel_extension()
     #response = HttpResponse(content_type='application/vnd.ms-excel; charset=utf-16')
-    response = HttpResponse(content_type='application/vnd.ms-excel')
+    response = HttpResponse(content_type=excel_content_type())
     response['Content-Disposition'] = 'attachment; filename=' + filename
-    writer = unicodecsv.writer(response, quoting=unicodecsv.QUOTE_ALL)
-    #import ipdb; ipdb.set_trace()
-
 
-    book = Workbook()
+    book = new_workbook()
     sheet1 = book.add_sheet('Data')
     book.add_sheet('Sheet 2')
 
-    col_no = lambda c=count(): next(c)
-    row_no = lambda c=count(): next(c)
     sheet1 = book.get_sheet(0)
-    hdr = sheet1.row(row_no())
-
-    hdr.write(col_no(), "ID")
-    hdr.write(col_no(), "Region")
-    hdr.write(col_no(), "District")
-    hdr.write(col_no(), "Name")
-    hdr.write(col_no(), "Year")
-    hdr.write(col_no(), "Fire Number")
-    hdr.write(col_no(), "DFES Incident No")
-    hdr.write(col_no(), "Job Code")
-    hdr.write(col_no(), "Probable Fire Level")
-    hdr.write(col_no(), "Max Fire Level")
-    hdr.write(col_no(), "Media Alert Req")
-    hdr.write(col_no(), "Investigation Req")
-    hdr.write(col_no(), "Fire Position")
-    #"Origin Point",
-    #"Fire Boundary",
-    hdr.write(col_no(), "Fire Not Found")
-    hdr.write(col_no(), "Other Info")
-    hdr.write(col_no(), "Cause")
-    hdr.write(col_no(), "Other Cause")
-    hdr.write(col_no(), "Field Officer")
-    hdr.write(col_no(), "Duty Officer")
-    hdr.write(col_no(), "Init Authorised By")
-    hdr.write(col_no(), "Init Authorised Date")
-    hdr.write(col_no(), "Authorised By")
-    hdr.write(col_no(), "Authorised Date")
-    hdr.write(col_no(), "Dispatch P&W")
-    hdr.write(col_no(), "Dispatch Aerial")
-    hdr.write(col_no(), "Fire Detected")
-    hdr.write(col_no(), "Fire Controlled")
-    hdr.write(col_no(), "Fire Contained")
-    hdr.write(col_no(), "Fire Safe")
-    #hdr.write(col_no(), "Fuel Type")
-    hdr.write(col_no(), "First Attack")
-    hdr.write(col_no(), "Other First Attack")
-    hdr.write(col_no(), "Initial Control")
-    hdr.write(col_no(), "Other Initial Control")
-    hdr.write(col_no(), "Final Control")
-    hdr.write(col_no(), "Other Final Control")
-    hdr.write(col_no(), "Arson Squad Notified")
-    hdr.write(col_no(), "Offence No")
-    hdr.write(col_no(), "Area")
-    hdr.write(col_no(), "Authorised By")
-    hdr.write(col_no(), "Authorised Date")
-    hdr.write(col_no(), "Report Status")
-    hdr.write(col_no(), "Tenures of Area Burnt")
-    hdr.write(col_no(), "Damage")
-    hdr.write(col_no(), "Injuries and Fatalities")
-
-    row_no = lambda c=count(1): next(c)
-    for obj in queryset:
-        row = sheet1.row(row_no())
-        col_no = lambda c=count(): next(c)
-
-        row.write(col_no(), obj.id )
-        row.write(col_no(), obj.region.name )
-        row.write(col_no(), obj.district.name )
-        row.write(col_no(), obj.name)
-        row.write(col_no(), obj.year )
-        row.write(col_no(), obj.fire_number )
-        row.write(col_no(), obj.dfes_incident_no if obj.dfes_incident_no else None)
-        row.write(col_no(), obj.job_code if obj.job_code else None)
-        row.write(col_no(), smart_str( obj.get_prob_fire_level_display() if obj.prob_fire_level else None))
-        row.write(col_no(), smart_str( obj.get_max_fire_level_display() if obj.max_fire_level else None))
-        row.write(col_no(), smart_str( obj.media_alert_req if obj.media_alert_req else None))
-        row.write(col_no(), smart_str( obj.investigation_req if obj.investigation_req else None))
-        row.write(col_no(), smart_str( obj.fire_position if obj.fire_position else None))
-        #row.write(col_no(), smart_str( obj.origin_point) )
-        #row.write(col_no(), smart_str( obj.fire_boundary) )
-        row.write(col_no(), smart_str( obj.fire_not_found if obj.fire_not_found else None))
-        row.write(col_no(), smart_str( obj.other_info if obj.other_info else None))
-        row.write(col_no(), smart_str( obj.cause if obj.cause else None))
-        row.write(col_no(), smart_str( obj.other_cause if obj.other_cause else None))
-        row.write(col_no(), smart_str( obj.field_officer.get_full_name() if obj.field_officer else None ) )
-        row.write(col_no(), smart_str( obj.duty_officer.get_full_name() if obj.duty_officer else None ) )
-        row.write(col_no(), smart_str( obj.init_authorised_by.get_full_name() if obj.init_authorised_by else None ) )
-        row.write(col_no(), smart_str( obj.init_authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.init_authorised_date else None) )
-        row.write(col_no(), smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ) )
-        row.write(col_no(), smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None) )
-        row.write(col_no(), smart_str( obj.dispatch_pw_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_pw_date else None) )
-        row.write(col_no(), smart_str( obj.dispatch_aerial_date.strftime('%Y-%m-%d %H:%M:%S') if obj.dispatch_aerial_date else None) )
-        row.write(col_no(), smart_str( obj.fire_detected_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_detected_date else None) )
-        row.write(col_no(), smart_str( obj.fire_controlled_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_controlled_date else None) )
-        row.write(col_no(), smart_str( obj.fire_contained_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_contained_date else None) )
-        row.write(col_no(), smart_str( obj.fire_safe_date.strftime('%Y-%m-%d %H:%M:%S') if obj.fire_safe_date else None) )
-        #row.write(col_no(), smart_str( '; '.join(['(fuel_type={}, ros={}, flame_height={})'.format(i.fuel_type, i.ros, i.flame_height) for i in obj.fire_behaviour.all()])) if obj.fire_behaviour.all() else None )
-        row.write(col_no(), smart_str( obj.first_attack if obj.first_attack else None))
-        row.write(col_no(), smart_str( obj.other_first_attack if obj.other_first_attack else None))
-        row.write(col_no(), smart_str( obj.initial_control if obj.initial_control else None))
-        row.write(col_no(), smart_str( obj.other_initial_control if obj.other_initial_control else None))
-        row.write(col_no(), smart_str( obj.final_control if obj.final_control else None))
-        row.write(col_no(), smart_str( obj.other_final_control if obj.other_final_control else None))
-        row.write(col_no(), smart_str( obj.arson_squad_notified if obj.arson_squad_notified else None))
-        row.write(col_no(), obj.offence_no if obj.offence_no else None)
-        row.write(col_no(), obj.area if obj.area else None)
-        row.write(col_no(), smart_str( obj.authorised_by.get_full_name() if obj.authorised_by else None ) )
-        row.write(col_no(), smart_str( obj.authorised_date.strftime('%Y-%m-%d %H:%M:%S') if obj.authorised_date else None ) )
-        row.write(col_no(), smart_str( obj.get_report_status_display() if obj.report_status else None))
-        row.write(col_no(), smart_str( '; '.join(['(name={}, area={})'.format(i.tenure.name, i.area) for i in obj.tenures_burnt.all()]) ))
-        row.write(col_no(), smart_str( '; '.join(['(name={}, number={})'.format(i.damage_type.name, i.number) for i in obj.damages.all()]) if obj.damages.all() else None))
-        row.write(col_no(), smart_str( '; '.join(['(name={}, number={})'.format(i.injury_type.name, i.number) for i in obj.injuries.all()]) if obj.injuries.all() else None ))
+    hdr = sheet1.row(0)
+    for col, title in enumerate(EXPORT_EXCEL_HEADER):
+        hdr.write(col, title)
+
+    for row_no, values in enumerate(export_excel_rows(queryset), 1):
+        row = sheet1.row(row_no)
+        for col, value in enumerate(values):
+            row.write(col, value)
+        if row_no % 1000 == 0:
+            #release the memory of the written rows
+            sheet1.flush_row_data()
 
     book.save(response)
 
@@ -20,7 +20,7 @@ from django import forms
 from django.contrib.gis.db import models
 from django.forms.models import inlineformset_factory
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.contrib.auth.models import User, Group
 from django.http import JsonResponse
 from django.contrib import messages
@@ -30,7 +30,7 @@ from django.core.exceptions import (PermissionDenied,)
 from bfrs.models import (Profile, Bushfire, BushfireSnapshot,BushfireProperty,
         Region, District,
         Tenure, AreaBurnt,
-        Document,DocumentCategory,DocumentTag,
+        Document,DocumentCategory,DocumentTag,ReportJob,
         SNAPSHOT_INITIAL, SNAPSHOT_FINAL,
         current_finyear
     )
@@ -47,6 +47,7 @@ from bfrs.utils import (breadcrumbs_li,
         get_missing_mandatory_fields,get_bushfire_url,
     )
 from bfrs.reports import BushfireReport, MinisterialReport, export_outstanding_fires, calculate_report_tables
+from bfrs.report_jobs import submit_job
 from django.db import IntegrityError, transaction
 from django.forms import ValidationError
 from datetime import datetime
@@ -56,6 +57,7 @@ from django.utils.dateparse import parse_duration
 
 from django_filters import views as filter_views
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from bfrs.paginators import KeysetPaginator
 from reversion_compare.views import HistoryCompareDetailView
 
 from .utils import invalidate_bushfire
@@ -161,6 +163,9 @@ class BushfireView(ExceptionMixin,NextUrlMixin,LoginRequiredMixin, filter_views.
     link_bushfire_confirm_template = 'bfrs/link_bushfire_confirm.html'
     paginate_by = 50
     actions = collections.OrderedDict([("select_action","------------"),("merge_reports","Link/Merge"),("invalidate_duplicated_reports","Link/Duplication")])
+    #the foreign keys shown by the rows of the bushfire list
+    list_related_fields = ('region', 'district', 'creator', 'field_officer', 'duty_officer', 'init_authorised_by', 'authorised_by', 'reviewed_by',
+        'valid_bushfire', 'valid_bushfire__modifier')
 
     def get_filterset_kwargs(self, filterset_class):
         kwargs = super(BushfireView,self).get_filterset_kwargs(filterset_class)
@@ -201,6 +206,20 @@ class BushfireView(ExceptionMixin,NextUrlMixin,LoginRequiredMixin, filter_views.
         profile, created = Profile.objects.get_or_create(user=self.request.user)
         return { 'region': profile.region, 'district': profile.district }
 
+    def get_queryset(self):
+        """
+        Loads everything the rows of the bushfire list show, so a page costs a fixed number of queries;
+        the geometries and the sss data are not loaded and the bushfires are read only
+        """
+        return Bushfire.objects.list_view().select_related(*self.list_related_fields).prefetch_related(
+            Prefetch('bushfire_invalidated', queryset=Bushfire.objects.list_view().select_related('modifier'))
+        ).extra(select={'snapshot_count': "SELECT COUNT(*) FROM bfrs_bushfiresnapshot s WHERE s.bushfire_id = bfrs_bushfire.id"})
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        """ The next/previous page links seek with the cursor of the current page instead of OFFSET """
+        return KeysetPaginator(queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+
     def get(self, request, *args, **kwargs):
         template_confirm = 'bfrs/confirm.html'
         template_snapshot_history = 'bfrs/snapshot_history.html'
@@ -221,7 +240,13 @@ class BushfireView(ExceptionMixin,NextUrlMixin,LoginRequiredMixin, filter_views.
                 reporting_year = int(self.request.GET.get('reporting_year')) if self.request.GET.has_key('reporting_year') else None
             except:
                 reporting_year = None
-            return BushfireReport(reporting_year).export()
+            if settings.REPORT_JOBS:
+                cached = BushfireReport.get_cached_workbook(reporting_year, generate=False)
+                if cached:
+                    return BushfireReport.workbook_response(cached[1], cached[0])
+                job = submit_job(ReportJob.TYPE_BUSHFIRE_REPORT, {"reporting_year": reporting_year}, self.request.user)
+                return HttpResponseRedirect(reverse('bushfire:report_job', kwargs={"pk": job.id}))
+            return BushfireReport.cached_export(reporting_year)
             
         elif action == 'calculate_report_tables':
             if not self.request.user.groups.filter(name = 'Fire Information Management').exists():
@@ -705,10 +730,56 @@ class ReportView(ExceptionMixin,FormView):
         valid = super(ReportView, self).form_valid(form)
         if valid.status_code == 302:
             #messages.success(self.request, 'Running Ministerial Report ...')
+            if settings.REPORT_JOBS:
+                job = submit_job(ReportJob.TYPE_MINISTERIAL_PDF, {
+                    "form_data": form.cleaned_data,
+                    "user": self.request.user.get_full_name(),
+                    "baseurl": self.request.build_absolute_uri("/")[:-1]
+                }, self.request.user)
+                return HttpResponseRedirect(reverse('bushfire:report_job', kwargs={"pk": job.id}))
             return MinisterialReport().pdflatex(self.request, form.cleaned_data)
         return super(ReportView, self).form_valid(form)
 
 
+class ReportJobView(ExceptionMixin,LoginRequiredMixin,generic.DetailView):
+    """
+    View for polling a report job and downloading the generated report.
+    Returns the job status as json if the 'format' parameter is 'json'
+    """
+    model = ReportJob
+    template_name = 'bfrs/report_job.html'
+
+    def get_queryset(self):
+        qs = super(ReportJobView,self).get_queryset()
+        if not self.request.user.is_superuser:
+            qs = qs.filter(submitter=self.request.user)
+        return qs
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        job = self.object
+        if request.GET.get("format") == "json":
+            return JsonResponse({
+                "id": job.id,
+                "job_type": job.job_type,
+                "status": job.get_status_display(),
+                "submitted": job.submitted.isoformat(),
+                "started": job.started.isoformat() if job.started else None,
+                "finished": job.finished.isoformat() if job.finished else None,
+                "wait_time": job.wait_time.total_seconds() if job.wait_time else None,
+                "run_time": job.run_time.total_seconds() if job.run_time else None,
+                "error": job.error,
+                "download_url": "{}?download=true".format(request.path) if job.status == ReportJob.STATUS_SUCCEEDED else None
+            })
+        elif request.GET.get("download") and job.status == ReportJob.STATUS_SUCCEEDED:
+            f = open(os.path.join(settings.MEDIA_ROOT,job.result.name),'rb')
+            response = FileResponse(content_type=job.content_type,streaming_content=f)
+            response['Content-Disposition'] = 'attachment; filename="{}"'.format(job.filename)
+            return response
+
+        return self.render_to_response(self.get_context_data(object=job))
+
+
 class BushfireDocumentListView(ExceptionMixin,LoginRequiredMixin,filter_views.FilterView):
     """
     View for bushfire's document list
@@ -84,11 +84,42 @@ KMI_URL = env('KMI_URL', 'https://kmi.dbca.wa.gov.au/geoserver')
 AREA_THRESHOLD = env('AREA_THRESHOLD', 2)
 SSS_URL = env('SSS_URL', 'https://sss.dpaw.wa.gov.au')
 SSS_CERTIFICATE_VERIFY = env('SSS_CERTIFICATE_VERIFY', True)
+# migration_utils.refresh_bushfires posts the features to SSS in batches, with a few concurrent requests
+SSS_REFRESH_BATCH_SIZE = env('SSS_REFRESH_BATCH_SIZE', 50)
+SSS_REFRESH_WORKERS = env('SSS_REFRESH_WORKERS', 4)
+SSS_REQUEST_TIMEOUT = env('SSS_REQUEST_TIMEOUT', 300)
+# The origin point tenures are resolved by SSS ('sss') or, if possible, from the local copies of the tenure layers ('local')
+TENURE_RESOLVER = env('TENURE_RESOLVER', 'sss')
+LOCAL_TENURE_BATCH_SIZE = env('LOCAL_TENURE_BATCH_SIZE', 500)
 PBS_URL = env('PBS_URL', 'https://pbs.dpaw.wa.gov.au/')
+# The 268b fires are requested from PBS in chunks of fire ids, concurrently, and cached for a few minutes
+PBS_REQUEST_CHUNK_SIZE = env('PBS_REQUEST_CHUNK_SIZE', 50)
+PBS_REQUEST_WORKERS = env('PBS_REQUEST_WORKERS', 4)
+PBS_REQUEST_TIMEOUT = env('PBS_REQUEST_TIMEOUT', 60)
+PBS_CACHE_TIMEOUT = env('PBS_CACHE_TIMEOUT', 300)
 URL_SSO = env('URL_SSO', 'https://oim.dpaw.wa.gov.au/api/users/')
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024 * 20  # 20 MB
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
 HISTORICAL_CAUSE_CSV_FILE = env('HISTORICAL_CAUSE_CSV_FILE', '')
+# The format of the excel exports, xlsx (written with constant memory, no row limit) or xls
+EXCEL_FORMAT = env('EXCEL_FORMAT', 'xlsx')
+REPORT_TABLES_WORKERS = env('REPORT_TABLES_WORKERS', 4)
+# The incremental report tables build also recalculates the fires modified this many seconds before the last build started
+REPORT_TABLES_INCREMENTAL_OVERLAP = env('REPORT_TABLES_INCREMENTAL_OVERLAP', 3600)
+# The cached reports which include live data (the 268b fires from PBS, the fires missing the final report) expire after this many seconds
+REPORT_LIVE_DATA_CACHE_TIMEOUT = env('REPORT_LIVE_DATA_CACHE_TIMEOUT', 600)
+# Generate the bushfire/ministerial reports with the workers of the run_report_jobs command instead of inside the web request,
+# startup.sh starts the workers if REPORT_JOBS is True
+REPORT_JOBS = env('REPORT_JOBS', False)
+REPORT_JOB_WORKERS = env('REPORT_JOB_WORKERS', 2)
+REPORT_JOB_POLL_INTERVAL = env('REPORT_JOB_POLL_INTERVAL', 2)
+# A running report job is requeued if its worker hasn't sent a heartbeat for REPORT_JOB_TIMEOUT seconds,
+# and failed if its workers died REPORT_JOB_MAX_ATTEMPTS times
+REPORT_JOB_HEARTBEAT_INTERVAL = env('REPORT_JOB_HEARTBEAT_INTERVAL', 30)
+REPORT_JOB_TIMEOUT = env('REPORT_JOB_TIMEOUT', 300)
+REPORT_JOB_MAX_ATTEMPTS = env('REPORT_JOB_MAX_ATTEMPTS', 3)
+# The bushfire list uses the planner's row estimate instead of COUNT(*) for the page links when it is over this number of rows
+ESTIMATED_COUNT_THRESHOLD = env('ESTIMATED_COUNT_THRESHOLD', 20000)
 ADD_REVERSION_ADMIN = True
 LOGIN_URL = '/login/'
 LOGOUT_URL = '/logout/'
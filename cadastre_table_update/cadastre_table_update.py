@@ -45,6 +45,12 @@ class CadastreTableUpdate:
         else:
             logger.info("Cadastre table populated successfully from directory.")
 
+        if not self.run_subdivide_script():
+            logger.error("Failed to refresh the subdivided cadastre table.")
+            return
+        else:
+            logger.info("Subdivided cadastre table refreshed successfully.")
+
         if self.clean_up:
             self.clean_up_directory()
 
@@ -101,6 +107,19 @@ class CadastreTableUpdate:
 
         return success
 
+    def run_subdivide_script(self):
+        """Rebuild reporting_cadastre_subdivided (used by the area burnt calculation) from the new cadastre table."""
+        from bfrs.reporting_tables import refresh_cadastre_subdivided
+
+        success = False
+        try:
+            refresh_cadastre_subdivided()
+            success = True
+        except Exception as e:
+            logger.error("Error refreshing reporting_cadastre_subdivided table: {}".format(e))
+
+        return success
+
     def populate_from_directory(self):
         """Populate the cadastre table from GeoJSON files in a directory."""
         success = False
@@ -15,6 +15,18 @@ fi
 
 fi
 
+if [ "$REPORT_JOBS" == "True" ];
+then
+echo "Starting Report Job Workers"
+/app/venv/bin/python /app/manage.py run_report_jobs >> /app/logs/report_jobs.log 2>&1 &
+status=$?
+if [ $status -ne 0 ]; then
+  echo "Failed to start report job workers: $status"
+  exit $status
+fi
+
+fi
+
 if [ $ENABLE_WEB == "True" ];
     then
 echo "Starting Gunicorn"